@@ -1,10 +1,13 @@
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Tuple
 
-from tools.artifis_file_reader import get_zone_time_mapping_and_zones_per_seat_type, \
-    get_transition_time, check_transition_points_zone_time_mapping_and_transition_time
-from tools.ftp_client import FtpClient
+from tools.artifis_file_reader import SeatTypeMaterialKey
+from tools.decision_cache import DecisionCache, DEFAULT_DECISION_CACHE_SIZE
+from tools.ftp_client import FtpClient, DEFAULT_KEEPALIVE_INTERVAL
+from tools.metrics import ProcessMetrics, BUCKLE_FILTERING_STAGE, PLANNING_STAGE, MOUNTING_WRITE_STAGE
+from tools.robot_configuration import RobotConfiguration
 from tools.trajectory_rules import TrajectoryRules
 from tools.file import write_list_to_csv_file
 
@@ -22,43 +25,42 @@ ROBOT_OUTPUT_PATH = Path(__file__).absolute().parent / 'robot_output_folder'
 
 class AbbCommunication:
     def __init__(self, my_logger, ip_ftp, port_ftp, user_ftp, password_ftp,
-                 mounting_mode,
-                 cycle_time, previous_transition_point, cumulated_time, acceptance_threshold,
-                 zones_not_to_steam_from_buckle_detection, upload_ftp,
-                 zone_time_mapping_file_path, transition_time_table_path,
-                 orders_file_name, out_put_orders_directory) -> None:
+                 mounting_mode, configuration: RobotConfiguration,
+                 orders_file_name, out_put_orders_directory,
+                 ftp_keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL, ftp_timeout=None,
+                 decision_cache_size=DEFAULT_DECISION_CACHE_SIZE, metrics: ProcessMetrics = None,
+                 skip_identical_orders: bool = False) -> None:
         self.logger = my_logger
+        self.metrics = metrics or ProcessMetrics()
         self.ip_ftp = ip_ftp
         self.port_ftp = port_ftp
         self.user_ftp = user_ftp
         self.password_ftp = password_ftp
         self.mounting_mode = mounting_mode
-        self.cycle_time = cycle_time
-        self.previous_transition_point = previous_transition_point
-        self.cumulated_time = cumulated_time
-        self.acceptance_threshold = acceptance_threshold
-        self.zones_not_to_steam_from_buckle_detection = zones_not_to_steam_from_buckle_detection
-        self.upload_ftp = upload_ftp
-        self.zone_time_mapping_file_path = zone_time_mapping_file_path
-        self.transition_time_table_path = transition_time_table_path
         self.orders_file_name = orders_file_name
         self.orders_directory = out_put_orders_directory
-        self.zone_time_mapping, self.zones_per_seat_type = get_zone_time_mapping_and_zones_per_seat_type(
-            self.zone_time_mapping_file_path)
-        self.transition_time_table = get_transition_time(self.transition_time_table_path)
-        self.check_transition_points = check_transition_points_zone_time_mapping_and_transition_time(
-            self.zone_time_mapping,
-            self.transition_time_table)
-        self.display_significant_check_transition_points_log_message(self.check_transition_points)
-
-    def display_significant_check_transition_points_log_message(self, check_transition_points):
-        if not check_transition_points:
-            self.logger.warning("Zone_time_mapping file doesn't match with the transition_time file")
-        else:
-            self.logger.info("Zone_time_mapping file match with the transition_time file")
+        self.ftp_client = FtpClient(self.logger, orders_file_name=self.orders_file_name,
+                                    output_directory=self.orders_directory, ip_server=self.ip_ftp, port=self.port_ftp,
+                                    user=self.user_ftp, password=self.password_ftp,
+                                    keepalive_interval=ftp_keepalive_interval, timeout=ftp_timeout,
+                                    metrics=self.metrics, skip_identical_orders=skip_identical_orders)
+        self.decision_cache = DecisionCache(decision_cache_size)
+        self.configuration = configuration
+        self.delivery_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='robot-delivery')
+
+    def swap_configuration(self, configuration: RobotConfiguration) -> None:
+        """
+        Replace the configuration used for the next seats, a seat being processed keeps the configuration it started
+        with
+        """
+        previous_version = self.configuration.version
+        self.configuration = configuration
+        self.logger.info(f'Configuration "{previous_version}" replaced by configuration "{configuration.version}"')
 
     def verify_buckle_belt_presence_and_remove_zones_if_necessary(self, predicted_wrinkles,
-                                                                  buckle_belt_decision_result) -> Tuple[bool, Dict]:
+                                                                  buckle_belt_decision_result,
+                                                                  zones_not_to_steam_from_buckle_detection) \
+            -> Tuple[bool, Dict]:
         unknown_in_buckle_check = False
 
         if buckle_belt_decision_result:
@@ -68,26 +70,118 @@ class AbbCommunication:
             filtered_predicted_wrinkles = filter_out_steaming_zones_buckle_position_is_nok(
                 predicted_wrinkles=predicted_wrinkles,
                 buckle_detection=buckle_belt_decision_result,
-                zones_not_to_steam_from_buckle_detection=self.zones_not_to_steam_from_buckle_detection)
+                zones_not_to_steam_from_buckle_detection=zones_not_to_steam_from_buckle_detection)
 
             return unknown_in_buckle_check, filtered_predicted_wrinkles
         else:
             return unknown_in_buckle_check, predicted_wrinkles
 
     def upload_into_ftp_client(self, abb_format_zones: List) -> str:
-        ftp_client = FtpClient(self.logger, orders_file_name=self.orders_file_name,
-                               output_directory=self.orders_directory, ip_server=self.ip_ftp, port=self.port_ftp,
-                               user=self.user_ftp, password=self.password_ftp)
-
-        status = ftp_client.write_and_push_temporary_file_to_robot(zones=abb_format_zones)
+        status = self.ftp_client.write_and_push_temporary_file_to_robot(zones=abb_format_zones)
         if status == 'FTP error':
             self.logger.warning('Error when uploading file on ABB FTP')
 
+        ftp_statistics = self.ftp_client.get_statistics()
+        self.logger.debug(f'FTP sessions: {ftp_statistics["connections"]} opened, '
+                          f'{ftp_statistics["reused_connections"]} reused, '
+                          f'{ftp_statistics["reconnections"]} reconnections - orders uploads: '
+                          f'{ftp_statistics["full_uploads"]} full, {ftp_statistics["reused_encoding_uploads"]} reusing '
+                          f'the encoded zone rows, {ftp_statistics["skipped_uploads"]} skipped '
+                          f'({ftp_statistics["skipped_bytes"]} bytes)')
+
         return status
 
-    def apply_calculate_robot_actions(self, original_predicted_wrinkles, wrinkles_succeed, buckle_belt_result, seat_info, serial_number):
+    def calculate_steaming_plan(self, configuration: RobotConfiguration, plant_project, cover_material,
+                                program_number, predicted_wrinkles, serial_number) -> Tuple[List, List, float]:
+        """
+        Compute the zones to steam, or take them from the decision cache. The plan only depends on the seat type,
+        the program number and the predictions kept after the buckle filtering; the serial number is patched in the
+        cached orders.
+        """
+        self.decision_cache.check_configuration_version(configuration.version)
+        cache_key = (plant_project, cover_material, program_number, frozenset(predicted_wrinkles.items()))
+        cached_plan = self.decision_cache.get(cache_key)
+        if cached_plan is not None:
+            abb_format_zones, steaming_sequence_record, theoretical_working_time = cached_plan
+            return ([[program_number, serial_number] + abb_format_zones[0][2:]] +
+                    [list(abb_format_zone) for abb_format_zone in abb_format_zones[1:]],
+                    [dict(time_zone_record) for time_zone_record in steaming_sequence_record],
+                    theoretical_working_time)
+
+        trajectory_rule = TrajectoryRules(plant_project=plant_project,
+                                          acceptance_threshold=configuration.acceptance_threshold,
+                                          cover_material=cover_material,
+                                          seat_profiles=configuration.seat_profiles)
+
+        abb_format_zones, steaming_sequence_record, theoretical_working_time = \
+            trajectory_rule.define_zones_to_steam_in_abb_format_according_to_available_time(
+                predicted_wrinkles=predicted_wrinkles,
+                transition_time_table=configuration.transition_time_table,
+                cycle_time=configuration.cycle_time,
+                previous_transition_point=configuration.previous_transition_point,
+                cumulated_time=configuration.cumulated_time,
+                serial_number=serial_number,
+                program_number=program_number,
+                planner=configuration.planner,
+                planner_time_budget=configuration.planner_time_budget,
+                route_optimization=configuration.route_optimization,
+                precedence_constraints=configuration.precedence_constraints
+            )
+
+        if trajectory_rule.planner_comparison is not None:
+            self.metrics.count_planner_working_time(*trajectory_rule.planner_comparison)
+
+        self.decision_cache.put(cache_key, ([list(abb_format_zone) for abb_format_zone in abb_format_zones],
+                                            [dict(time_zone_record) for time_zone_record in steaming_sequence_record],
+                                            theoretical_working_time))
+        return abb_format_zones, steaming_sequence_record, theoretical_working_time
+
+    def deliver_robot_orders(self, abb_format_zones: List) -> str:
+        """
+        Send the orders to the robot FTP server, or copy them in the robot output folder in mounting mode
+        """
+        if self.mounting_mode:
+            used_path = ROBOT_OUTPUT_PATH / self.orders_directory / self.orders_file_name
+            Path(ROBOT_OUTPUT_PATH / self.orders_directory).mkdir(parents=True, exist_ok=True)
+            self.logger.info(f' Path to use for copying order file: {used_path}')
+            with self.metrics.time_stage(MOUNTING_WRITE_STAGE):
+                return write_list_to_csv_file(self.logger, abb_format_zones, used_path)
+        return self.upload_into_ftp_client(abb_format_zones)
+
+    def deliver_robot_decision(self, robot_decision: Dict, orders_to_deliver: bool) -> Dict:
+        """
+        Deliver the orders of a robot decision when requested, and record the delivery status in its "upload_ftp"
+        field
+        """
+        if orders_to_deliver:
+            status = self.deliver_robot_orders(robot_decision['steaming_robot']['abb_format_zones'])
+            robot_decision['steaming_robot']['upload_ftp'] = status == 'OK'
+        return robot_decision
+
+    def start_robot_decision_delivery(self, robot_decision: Dict, orders_to_deliver: bool) -> Future:
+        """
+        Deliver a robot decision on the delivery thread of the robot, so that the caller can archive the orders
+        meanwhile. The decisions of a robot are delivered, and their futures done, in submission order; the future
+        raises the delivery error, if any.
+        """
+        return self.delivery_executor.submit(self.deliver_robot_decision, robot_decision, orders_to_deliver)
+
+    def stop_delivery(self) -> None:
+        """
+        Wait for the decisions being delivered
+        """
+        self.delivery_executor.shutdown(wait=True)
+
+    def calculate_robot_actions(self, original_predicted_wrinkles, wrinkles_succeed, buckle_belt_result, seat_info,
+                                serial_number) -> Tuple[Dict, bool]:
+        """
+        Compute the robot decision of a seat without sending anything to the robot, also return whether its orders
+        have to be delivered. The "upload_ftp" field is left to False until the delivery status is known.
+        """
         self.logger.info('apply abb communication')
+        configuration = self.configuration
         robot_decision = {}
+        orders_to_deliver = False
         if seat_info:
             if wrinkles_succeed:
                 try:
@@ -100,32 +194,28 @@ class AbbCommunication:
                                                           'steaming_sequence_record': [],
                                                           'abb_format_zones': abb_format_zones,
                                                           'theoretical_working_time': 0,
-                                                          'cycle_time': self.cycle_time,
-                                                          'upload_ftp': False})
+                                                          'cycle_time': configuration.cycle_time,
+                                                          'upload_ftp': False,
+                                                          'configuration_version': configuration.version})
 
-                    unknown_in_buckle_check, kept_predicted_wrinkles = \
-                        self.verify_buckle_belt_presence_and_remove_zones_if_necessary(original_predicted_wrinkles,
-                                                                                       buckle_belt_result)
+                    with self.metrics.time_stage(BUCKLE_FILTERING_STAGE):
+                        unknown_in_buckle_check, kept_predicted_wrinkles = \
+                            self.verify_buckle_belt_presence_and_remove_zones_if_necessary(
+                                original_predicted_wrinkles, buckle_belt_result,
+                                configuration.zones_not_to_steam_from_buckle_detection)
 
                     if (int(program_number) != PROGRAM_NUMBER_TO_NOT_STEAM) and (
                             unknown_in_buckle_check is False):
                         cover_material = seat_info['cover_material']
-                        trajectory_rule = TrajectoryRules(plant_project=plant_project,
-                                                          acceptance_threshold=self.acceptance_threshold,
-                                                          cover_material=cover_material,
-                                                          zones_per_seat_type=self.zones_per_seat_type)
-
-                        abb_format_zones, steaming_sequence_record, theoretical_working_time = \
-                            trajectory_rule.define_zones_to_steam_in_abb_format_according_to_available_time(
-                                predicted_wrinkles=kept_predicted_wrinkles,
-                                zone_time_mapping=self.zone_time_mapping,
-                                transition_time_table=self.transition_time_table,
-                                cycle_time=self.cycle_time,
-                                previous_transition_point=self.previous_transition_point,
-                                cumulated_time=self.cumulated_time,
-                                serial_number=serial_number,
-                                program_number=program_number
-                            )
+                        with self.metrics.time_stage(PLANNING_STAGE):
+                            abb_format_zones, steaming_sequence_record, theoretical_working_time = \
+                                self.calculate_steaming_plan(configuration, plant_project, cover_material,
+                                                             program_number, kept_predicted_wrinkles, serial_number)
+                        requested_zones_count, unknown_zones_count = count_requested_zones(
+                            configuration, plant_project, cover_material, kept_predicted_wrinkles)
+                        self.metrics.count_zones(requested_zones_count=requested_zones_count,
+                                                 selected_zones_count=len(steaming_sequence_record),
+                                                 unknown_zones_count=unknown_zones_count)
 
                         if len(steaming_sequence_record) > 0:
                             robot_decision['steaming_robot']['steaming'] = True
@@ -140,17 +230,7 @@ class AbbCommunication:
                     else:
                         self.logger.info('No steam treatment: Program not to steam or buckle_belt unknown state')
 
-                    if self.upload_ftp:
-                        if self.mounting_mode:
-                            used_path = ROBOT_OUTPUT_PATH / self.orders_directory / self.orders_file_name
-                            Path(ROBOT_OUTPUT_PATH / self.orders_directory).mkdir(parents=True, exist_ok=True)
-                            self.logger.info(f' Path to use for copying order file: {used_path}')
-                            status = write_list_to_csv_file(self.logger, abb_format_zones, used_path)
-                        else:
-                            status = self.upload_into_ftp_client(abb_format_zones)
-
-                        if status == 'OK':
-                            robot_decision['steaming_robot']['upload_ftp'] = True
+                    orders_to_deliver = bool(configuration.upload_ftp)
 
                 except Exception as e:
                     self.logger.error(
@@ -162,8 +242,10 @@ class AbbCommunication:
                                         'steaming_sequence_record': [],
                                         'abb_format_zones': [],
                                         'theoretical_working_time': 0,
-                                        'cycle_time': self.cycle_time,
-                                        'upload_ftp': False})
+                                        'cycle_time': configuration.cycle_time,
+                                        'upload_ftp': False,
+                                        'configuration_version': configuration.version})
+                    orders_to_deliver = False
 
             else:
                 self.logger.info(
@@ -173,8 +255,9 @@ class AbbCommunication:
                                                       'steaming_sequence_record': [],
                                                       'abb_format_zones': [],
                                                       'theoretical_working_time': 0,
-                                                      'cycle_time': self.cycle_time,
-                                                      'upload_ftp': False})
+                                                      'cycle_time': configuration.cycle_time,
+                                                      'upload_ftp': False,
+                                                      'configuration_version': configuration.version})
 
         else:
             self.logger.error(
@@ -186,10 +269,30 @@ class AbbCommunication:
                                                   'steaming_sequence_record': [],
                                                   'abb_format_zones': [],
                                                   'theoretical_working_time': 0,
-                                                  'cycle_time': self.cycle_time,
-                                                  'upload_ftp': False})
-
-        return robot_decision
+                                                  'cycle_time': configuration.cycle_time,
+                                                  'upload_ftp': False,
+                                                  'configuration_version': configuration.version})
+
+        return robot_decision, orders_to_deliver
+
+
+def count_requested_zones(configuration: RobotConfiguration, plant_project: str, cover_material: str,
+                          predicted_wrinkles: Dict) -> Tuple[int, int]:
+    """
+    Count the predicted zones under the acceptance threshold that the seat profile describes, and the ones it does not
+    """
+    seat_profile = configuration.seat_profiles.get(SeatTypeMaterialKey(plant_project, cover_material))
+    descriptors = seat_profile.descriptors if seat_profile is not None else {}
+    requested_zones_count = 0
+    unknown_zones_count = 0
+    for predicted_zone, acceptance in predicted_wrinkles.items():
+        if int(acceptance) > configuration.acceptance_threshold:
+            continue
+        if (int(predicted_zone), int(acceptance)) in descriptors:
+            requested_zones_count += 1
+        else:
+            unknown_zones_count += 1
+    return requested_zones_count, unknown_zones_count
 
 
 def check_unknown_in_buckle_state_results(buckle_detection: Dict) -> bool:
@@ -0,0 +1,58 @@
+"""
+Compare two benchmark results files, for instance the results of two commits:
+    python -m benchmarks.compare_results benchmarks/results/base.json benchmarks/results/current.json
+
+Exit with status 1 when a benchmark got slower than the threshold.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+DEFAULT_THRESHOLD = 0.10
+COMPARED_STATISTIC = 'p50'
+
+
+def get_result_key(result: Dict) -> Tuple:
+    return (result['name'],) + tuple(sorted(result['parameters'].items()))
+
+
+def compare_results(base_results: Dict, new_results: Dict, threshold: float, statistic: str) -> bool:
+    """
+    Print the comparison of the benchmarks found in both files, return True when none of them regressed
+    """
+    base_results_by_key = {get_result_key(result): result for result in base_results['results']}
+    print(f'{base_results["commit"]} -> {new_results["commit"]} ({statistic})')
+
+    no_regression = True
+    for new_result in new_results['results']:
+        base_result = base_results_by_key.get(get_result_key(new_result))
+        if base_result is None:
+            continue
+        ratio = new_result[statistic] / base_result[statistic] if base_result[statistic] else float('inf')
+        regression = ratio > 1 + threshold
+        no_regression = no_regression and not regression
+        parameters = ' '.join(f'{key}={value}' for key, value in new_result['parameters'].items())
+        print(f'{new_result["name"]:<22} {parameters:<55} {base_result[statistic] * 1000:9.3f} ms -> '
+              f'{new_result[statistic] * 1000:9.3f} ms  x{ratio:5.2f}{"  REGRESSION" if regression else ""}')
+    return no_regression
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark results files')
+    parser.add_argument('base', type=Path)
+    parser.add_argument('new', type=Path)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('--statistic', default=COMPARED_STATISTIC, choices=['mean', 'min', 'p50', 'p95', 'p99'])
+    arguments = parser.parse_args()
+
+    base_results = json.loads(arguments.base.read_text())
+    new_results = json.loads(arguments.new.read_text())
+    if not compare_results(base_results, new_results, arguments.threshold, arguments.statistic):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Benchmarks of the configuration loading, the planners and the whole seat processing.
+
+Run from the module folder:
+    python -m benchmarks.run_benchmarks --output benchmarks/results/current.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import platform
+import random
+import socket
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from abb_communication import AbbCommunication
+from benchmarks.synthetic_configuration import write_synthetic_configuration, get_synthetic_predicted_wrinkles, \
+    get_synthetic_input_message, BENCHMARK_PLANT_PROJECT, BENCHMARK_COVER_MATERIAL, BENCHMARK_PROGRAM_NUMBER
+from main import decode_input_message, encode_output_message
+from tools.artifis_file_reader import SeatTypeMaterialKey
+from tools.batch_planner import BatchPlanner
+from tools.blob_uploader import BlobUploader
+from tools.orders_encoder import encode_orders
+from tools.robot_configuration import get_configuration_files, load_robot_configuration
+from tools.run_local_FTP_server import FtpTestServer
+from tools.trajectory_rules import TrajectoryRules, GREEDY_PLANNER, OPTIMAL_PLANNER
+
+DEFAULT_ROWS = (84, 1000, 10000, 50000)
+DEFAULT_SEATS = 200
+BATCH_PLANNER_REPEAT = 10
+RESULTS_FORMAT_VERSION = 1
+
+logger = logging.getLogger('benchmarks')
+
+
+class InMemoryContainerClient:
+    """
+    Stand-in of the blob container client, keeps the uploaded blobs in memory
+    """
+
+    def __init__(self):
+        self.blobs = {}
+
+    def upload_blob(self, name, data, overwrite=False):
+        self.blobs[name] = data
+
+
+class InMemoryPublisher:
+    """
+    Stand-in of the confirmed publisher, confirms the messages right away
+    """
+
+    def __init__(self):
+        self.published_count = 0
+
+    def publish(self, exchange, routing_key, body, on_confirmed):
+        self.published_count += 1
+        on_confirmed()
+
+
+def get_percentile(sorted_samples: List[float], percentile: float) -> float:
+    return sorted_samples[min(len(sorted_samples) - 1, int(round(percentile / 100 * (len(sorted_samples) - 1))))]
+
+
+def summarize(name: str, samples: List[float], parameters: Dict) -> Dict:
+    sorted_samples = sorted(samples)
+    return {'name': name,
+            'parameters': parameters,
+            'unit': 'seconds',
+            'samples': len(samples),
+            'mean': sum(samples) / len(samples),
+            'min': sorted_samples[0],
+            'p50': get_percentile(sorted_samples, 50),
+            'p95': get_percentile(sorted_samples, 95),
+            'p99': get_percentile(sorted_samples, 99)}
+
+
+def measure(function: Callable, arguments: List, warmup: int = 1) -> List[float]:
+    for warmup_arguments in arguments[:warmup]:
+        function(*warmup_arguments)
+    samples = []
+    for call_arguments in arguments:
+        tic = time.perf_counter()
+        function(*call_arguments)
+        samples.append(time.perf_counter() - tic)
+    return samples
+
+
+def load_configuration(configuration_path: Path):
+    return load_robot_configuration(logger, *get_configuration_files(logger, configuration_path, configuration_path))
+
+
+def benchmark_configuration_loading(configuration_path: Path, rows: int, repeat: int) -> Dict:
+    samples = measure(load_configuration, [(configuration_path,)] * repeat, warmup=0)
+    return summarize('configuration_loading', samples, {'rows': rows})
+
+
+def benchmark_planners(configuration, rows: int, seats: int, seed: int) -> List[Dict]:
+    randomizer = random.Random(seed)
+    seat_profile = configuration.seat_profiles[SeatTypeMaterialKey(BENCHMARK_PLANT_PROJECT, BENCHMARK_COVER_MATERIAL)]
+    seats_predicted_wrinkles = [get_synthetic_predicted_wrinkles(randomizer, list(seat_profile.zone_ranks))
+                                for _ in range(seats)]
+    trajectory_rule = TrajectoryRules(seat_profiles=configuration.seat_profiles,
+                                      plant_project=BENCHMARK_PLANT_PROJECT,
+                                      acceptance_threshold=configuration.acceptance_threshold,
+                                      cover_material=BENCHMARK_COVER_MATERIAL)
+
+    results = []
+    for planner, route_optimization in ((GREEDY_PLANNER, False), (OPTIMAL_PLANNER, False), (GREEDY_PLANNER, True)):
+        def plan(predicted_wrinkles):
+            trajectory_rule.define_zones_to_steam_in_abb_format_according_to_available_time(
+                predicted_wrinkles=predicted_wrinkles, transition_time_table=configuration.transition_time_table,
+                cycle_time=configuration.cycle_time, previous_transition_point=configuration.previous_transition_point,
+                cumulated_time=configuration.cumulated_time, serial_number='B0000000',
+                program_number=BENCHMARK_PROGRAM_NUMBER, planner=planner,
+                planner_time_budget=configuration.planner_time_budget, route_optimization=route_optimization)
+
+        samples = measure(plan, [(predicted_wrinkles,) for predicted_wrinkles in seats_predicted_wrinkles])
+        results.append(summarize('planner', samples, {'rows': rows, 'planner': planner,
+                                                      'route_optimization': route_optimization}))
+
+    batch_planner = BatchPlanner(seat_profile, configuration.transition_time_table,
+                                 configuration.acceptance_threshold)
+
+    def plan_batch():
+        batch_planner.plan(seats_predicted_wrinkles, configuration.cycle_time,
+                           configuration.previous_transition_point, configuration.cumulated_time)
+
+    samples = [batch_sample / seats for batch_sample in measure(plan_batch, [()] * BATCH_PLANNER_REPEAT)]
+    results.append(summarize('planner', samples, {'rows': rows, 'planner': 'greedy_batch',
+                                                  'route_optimization': False}))
+    return results
+
+
+def get_free_port() -> int:
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return free_socket.getsockname()[1]
+
+
+def benchmark_seat_processing(configuration, rows: int, seats: int, seed: int, work_path: Path) -> Dict:
+    """
+    Whole seat processing as done by the module callback: decoding, planning, orders upload to a local FTP server,
+    orders archive, then output encoding. Blob storage and AMQP are replaced by in-memory stand-ins.
+    """
+    randomizer = random.Random(seed)
+    seat_profile = configuration.seat_profiles[SeatTypeMaterialKey(BENCHMARK_PLANT_PROJECT, BENCHMARK_COVER_MATERIAL)]
+    bodies = [json.dumps(get_synthetic_input_message(randomizer, seat_number, list(seat_profile.zone_ranks))).encode()
+              for seat_number in range(seats)]
+
+    ftp_folder = work_path / 'ftp_folder'
+    (ftp_folder / 'Aivi_Output').mkdir(parents=True, exist_ok=True)
+    ftp_port = get_free_port()
+    ftp_server = FtpTestServer(ftp_port, ftp_folder.as_posix())
+    ftp_server.start()
+
+    robot = AbbCommunication(logger, '127.0.0.1', ftp_port, 'user', 'password', False, configuration, 'orders.csv',
+                             'Aivi_Output', ftp_timeout=10, decision_cache_size=0)
+    blob_uploader = BlobUploader(logger, InMemoryContainerClient())
+    blob_uploader.start()
+    publisher = InMemoryPublisher()
+
+    def process_seat(body):
+        message, buckle_belt_result, wrinkles_result, wrinkles_succeed, serial_number, seat_info, timestamp = \
+            decode_input_message(logger, body)
+        robot_decision_result, orders_to_deliver = robot.calculate_robot_actions(
+            wrinkles_result, wrinkles_succeed, buckle_belt_result, seat_info, serial_number)
+        robot_delivery = robot.start_robot_decision_delivery(robot_decision_result, orders_to_deliver)
+        if orders_to_deliver:
+            blob_uploader.enqueue(f'{message["metadata"]["pipeline_id"]}_robot_orders.csv',
+                                  encode_orders(robot_decision_result['steaming_robot']['abb_format_zones']))
+        publisher.publish('', '', encode_output_message(message, robot_delivery.result()), lambda: None)
+
+    try:
+        samples = measure(process_seat, [(body,) for body in bodies])
+    finally:
+        blob_uploader.stop(timeout=10)
+        robot.stop_delivery()
+        robot.ftp_client.close()
+        ftp_server.stop()
+
+    return summarize('seat_processing', samples, {'rows': rows, 'ftp': 'local'})
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmarks(rows_list: List[int], seats: int, loading_repeat: int, seed: int) -> Dict:
+    results = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        work_path = Path(work_folder)
+        for rows in rows_list:
+            configuration_path = write_synthetic_configuration(work_path / f'configuration_{rows}', rows, seed)
+            print(f'{rows} rows configuration...')
+            results.append(benchmark_configuration_loading(configuration_path, rows, loading_repeat))
+            configuration = load_configuration(configuration_path)
+            results.extend(benchmark_planners(configuration, rows, seats, seed))
+            results.append(benchmark_seat_processing(configuration, rows, seats, seed, work_path))
+
+    return {'format_version': RESULTS_FORMAT_VERSION,
+            'commit': get_commit(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': seed,
+            'results': results}
+
+
+def print_results(benchmark_results: Dict) -> None:
+    for result in benchmark_results['results']:
+        parameters = ' '.join(f'{key}={value}' for key, value in result['parameters'].items())
+        print(f'{result["name"]:<22} {parameters:<55} mean {result["mean"] * 1000:9.3f} ms   '
+              f'p95 {result["p95"] * 1000:9.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the robot module benchmarks')
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS),
+                        help='zone time mapping sizes of the synthetic configurations')
+    parser.add_argument('--seats', type=int, default=DEFAULT_SEATS, help='seats planned and processed per size')
+    parser.add_argument('--loading-repeat', type=int, default=5, help='configuration loadings per size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, help='json file where the results are written')
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    benchmark_results = run_benchmarks(arguments.rows, arguments.seats, arguments.loading_repeat, arguments.seed)
+    print_results(benchmark_results)
+    if arguments.output:
+        arguments.output.parent.mkdir(parents=True, exist_ok=True)
+        arguments.output.write_text(json.dumps(benchmark_results, indent=4))
+        print(f'Results written in {arguments.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+from tools.robot_configuration import ZONE_TIME_MAPPING_FILE_NAME, TRANSITION_TIME_TABLE_FILE_NAME, \
+    ROBOT_MODULE_CONFIGURATION_FILE_NAME
+
+ZONE_TIME_MAPPING_COLUMNS = ['plant_project', 'cover_material', 'zone_number', 'acceptance', 'time', 'input_offset_x',
+                             'input_offset_y', 'input_offset_z', 'output_offset_x', 'output_offset_y',
+                             'output_offset_z', 'transition_point', 'steam', 'speed', 'trajectory_occurence',
+                             'pressure']
+TRANSITION_POINTS = ['HOME', 'BH', 'BL', 'LH', 'RH', 'CM', 'LL', 'RL', 'F', 'FL', 'FR']
+ZONES_PER_SEAT_TYPE = 21
+ACCEPTANCES = (0, 1)
+COVER_MATERIALS = ('Tissu', 'Tissu_Tep', 'Tep', 'Cuir')
+
+BENCHMARK_PLANT_PROJECT = 'P0'
+BENCHMARK_COVER_MATERIAL = 'Tissu'
+BENCHMARK_PROGRAM_NUMBER = '473'
+
+
+def get_seat_types(rows: int) -> List[tuple]:
+    seat_types_count = max(1, -(-rows // (ZONES_PER_SEAT_TYPE * len(ACCEPTANCES))))
+    return [(f'P{seat_type_number // len(COVER_MATERIALS)}', COVER_MATERIALS[seat_type_number % len(COVER_MATERIALS)])
+            for seat_type_number in range(seat_types_count)]
+
+
+def write_synthetic_configuration(configuration_path: Path, rows: int, seed: int = 0) -> Path:
+    """
+    Write a configuration of about "rows" zone time mapping rows: seat types of 21 zones with 2 acceptance levels,
+    spread over the 11 transition points of the default configuration
+    """
+    randomizer = random.Random(seed)
+    configuration_path.mkdir(parents=True, exist_ok=True)
+
+    zone_time_mapping_lines = [','.join(ZONE_TIME_MAPPING_COLUMNS)]
+    for plant_project, cover_material in get_seat_types(rows):
+        zone_numbers = randomizer.sample(range(1, 60), ZONES_PER_SEAT_TYPE)
+        for acceptance in ACCEPTANCES:
+            for zone_number in zone_numbers:
+                zone_time_mapping_lines.append(','.join(str(value) for value in [
+                    plant_project, cover_material, zone_number, acceptance, round(randomizer.uniform(2.0, 8.0), 2),
+                    0, 0, 0, 0, 0, 0, randomizer.choice(TRANSITION_POINTS[1:]), 1, 10, 1, 20]))
+    (configuration_path / ZONE_TIME_MAPPING_FILE_NAME).write_text('\n'.join(zone_time_mapping_lines) + '\n')
+
+    transition_time_lines = [',' + ','.join(TRANSITION_POINTS)]
+    transition_times = {}
+    for from_position in TRANSITION_POINTS:
+        line = [from_position]
+        for to_position in TRANSITION_POINTS:
+            if from_position == to_position:
+                transition_time = 0
+            else:
+                transition_time = transition_times.setdefault(tuple(sorted((from_position, to_position))),
+                                                              round(randomizer.uniform(1.5, 6.5), 3))
+            line.append(str(transition_time))
+        transition_time_lines.append(','.join(line))
+    (configuration_path / TRANSITION_TIME_TABLE_FILE_NAME).write_text('\n'.join(transition_time_lines) + '\n')
+
+    (configuration_path / ROBOT_MODULE_CONFIGURATION_FILE_NAME).write_text(json.dumps({
+        "cycle_time": 48,
+        "previous_transition_point": "HOME",
+        "cumulated_time": 0,
+        "acceptance_threshold": 1,
+        "upload_ftp": True
+    }, indent=4))
+    return configuration_path
+
+
+def get_synthetic_predicted_wrinkles(randomizer: random.Random, zone_numbers: List[int]) -> Dict[str, int]:
+    return {str(zone_number): randomizer.choice((0, 0, 1, 2, 3)) for zone_number in zone_numbers}
+
+
+def get_synthetic_input_message(randomizer: random.Random, seat_number: int, zone_numbers: List[int]) -> Dict:
+    serial_number = f'B{seat_number:07}'
+    return {
+        "metadata": {
+            "station_info": {"country": "FR", "plant": "BCH", "line_id": "LINE1", "station_full_id": "FRBCHSTATION1"},
+            "serial_number": serial_number,
+            "trigger_time": "2022-03-25T05:10:23.234+00:00",
+            "pipeline_id": f'FRBCHSTATION1_{serial_number}_20220325-051023',
+            "seat_info": {"plant_project": BENCHMARK_PLANT_PROJECT, "cover_material": BENCHMARK_COVER_MATERIAL,
+                          "program_number": BENCHMARK_PROGRAM_NUMBER}
+        },
+        "models": {
+            "wrinkle_detector": {
+                "succeed": True,
+                "predicted_acceptance_per_zone": get_synthetic_predicted_wrinkles(randomizer, zone_numbers)
+            }
+        }
+    }
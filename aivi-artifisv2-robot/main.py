@@ -2,58 +2,36 @@ import json
 import logging
 import os
 from pathlib import Path
-import pandas as pd
 import time
 import uuid
 import datetime
-from ftplib import FTP
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import pika
-from azure.storage.blob import ContainerClient
 
 from abb_communication import AbbCommunication
-from tools.file import load_data_from_json_file
-from prometheus_client import start_http_server, Summary, Counter
-
-RIGHT_BUCKLE = 'right_buckle'
-CENTRAL_BUCKLE = 'central_buckle'
-LEFT_BUCKLE = 'left_buckle'
-
-
-def retrieve_configuration_file_from_ftp_server(file_name, ftp_server_ip, used_port, used_user, used_password,
-                                                destination_path):
-    ftp_client = FTP()
-    ftp_client.connect(ftp_server_ip, used_port)
-    ftp_client.login(used_user, used_password)
-
-
-def get_configuration_files():
-    # retrieve_configuration_files_from_ftp_server()
-    default_config_path = Path(__file__).absolute().parent / 'default_configuration'
-    requested_config_path = Path(__file__).absolute().parent / 'requested_configuration'
-    if os.path.isfile((requested_config_path / 'zone_time_mapping.csv').resolve().as_posix()):
-        logger.info(f'Requested configuration taken for "zone_time_mapping.csv"')
-        zone_time_mapping_file_path = (requested_config_path / 'zone_time_mapping.csv').resolve().as_posix()
-    else:
-        logger.info(f'Default configuration taken for "zone_time_mapping.csv"')
-        zone_time_mapping_file_path = (default_config_path / 'zone_time_mapping.csv').resolve().as_posix()
-
-    if os.path.isfile((requested_config_path / 'transition_time_table.csv').resolve().as_posix()):
-        logger.info(f'Requested configuration taken for "transition_time_table.csv"')
-        transition_time_table_file_path = (requested_config_path / 'transition_time_table.csv').resolve().as_posix()
-    else:
-        logger.info(f'Default configuration taken for "transition_time_table.csv"')
-        transition_time_table_file_path = (default_config_path / 'transition_time_table.csv').resolve().as_posix()
-
-    if os.path.isfile((requested_config_path / 'robot_module_configuration.json').resolve().as_posix()):
-        logger.info(f'Requested configuration taken for "robot_module_configuration.json"')
-        robot_module_configuration_file_path = (
-                requested_config_path / 'robot_module_configuration.json').resolve().as_posix()
-    else:
-        logger.info(f'Default configuration taken for "robot_module_configuration.json"')
-        robot_module_configuration_file_path = (
-                default_config_path / 'robot_module_configuration.json').resolve().as_posix()
-
-    return zone_time_mapping_file_path, transition_time_table_file_path, robot_module_configuration_file_path
+from tools.blob_spool import BlobSpool, FSYNC_ALWAYS, FSYNC_POLICIES
+from tools.blob_uploader import BlobUploader
+from tools.configuration_sync import ConfigurationSync
+from tools.configuration_watcher import ConfigurationWatcher
+from tools.confirmed_publisher import ConfirmedPublisher
+from tools.ftp_client import FULL_UPLOAD, REUSED_ENCODING_UPLOAD, SKIPPED_UPLOAD
+from tools import message_decoder
+from tools.metrics import create_process_metrics, create_startup_metrics, CountersCollector, BLOB_UPLOAD_STAGE, \
+    DECODE_STAGE, PUBLISH_STAGE, METRICS_SERVER_PHASE, CONFIGURATION_PHASE, AMQP_CONNECTION_PHASE, \
+    BLOB_CONTAINER_PHASE, ROBOTS_PHASE, READY_PHASE, FIRST_MESSAGE_PHASE
+from tools.orders_archiver import OrdersArchiver, ARCHIVE_MODES, BATCH_ARCHIVE_MODE, SEAT_BLOB_ARCHIVE_MODE, \
+    ORDERS_BLOB_SUFFIX, ORDERS_JOURNAL_DIRECTORY_NAME
+from tools.orders_encoder import encode_orders
+from tools.output_encoder import encode_decision_message, get_available_output_format, FULL_OUTPUT_FORMAT, \
+    OUTPUT_FORMAT_HEADER
+from tools.robot_configuration import get_configuration_files, load_robot_configuration, \
+    validate_robot_configuration
+from tools.station_dispatcher import StationDispatcher, get_station_table
+from prometheus_client import start_http_server, Summary, Counter, Gauge, REGISTRY
+
+DEFAULT_CONFIGURATION_PATH = Path(__file__).absolute().parent / 'default_configuration'
+REQUESTED_CONFIGURATION_PATH = Path(__file__).absolute().parent / 'requested_configuration'
 
 
 def set_logs():
@@ -68,17 +46,25 @@ def set_logs():
     return my_logger
 
 
-def initialize_amqp_connection(amqp_host, output_exchange, input_exchange, input_routing_key):
+def initialize_amqp_connection(amqp_host, output_exchange, input_exchange, input_routing_key, prefetch_count=0,
+                               input_queue_name=''):
     logger.info(f'Connecting to AMQP host {amqp_host}...')
     connection = pika.BlockingConnection(
         pika.ConnectionParameters(host=amqp_host))
     channel = connection.channel()
 
+    logger.info(f'Setting prefetch count to {prefetch_count}...')
+    channel.basic_qos(prefetch_count=prefetch_count)
+
     logger.info(f'Declaring input exchange {input_exchange}...')
     channel.exchange_declare(exchange=input_exchange, exchange_type='topic')
 
-    logger.info(f'Declaring temporary input queue...')
-    input_queue = channel.queue_declare(queue='', exclusive=True).method.queue
+    if input_queue_name:
+        logger.info(f'Declaring durable input queue "{input_queue_name}"...')
+        input_queue = channel.queue_declare(queue=input_queue_name, durable=True).method.queue
+    else:
+        logger.info(f'Declaring temporary input queue...')
+        input_queue = channel.queue_declare(queue='', exclusive=True).method.queue
 
     logger.info(f'Binding input queue "{input_queue}" to input exchange...')
     channel.queue_bind(exchange=input_exchange, queue=input_queue, routing_key=input_routing_key)
@@ -91,32 +77,69 @@ def initialize_amqp_connection(amqp_host, output_exchange, input_exchange, input
 
 def decode_input_message(logger, body):
     logger.info(" [x] Message Received")
-    message = json.loads(body.decode())
-    buckle_belt_result = message.get("decisions", {"decisions": ''}).get("front_buckle_belt_domain_decision")
-    wrinkles_result = message.get("models")["wrinkle_detector"].get("predicted_acceptance_per_zone")
-    wrinkles_succeed = message.get("models")["wrinkle_detector"].get("succeed")
-    serial_number = message.get("metadata")["serial_number"]
-    seat_info = message.get("metadata")["seat_info"]
-    time_stamp = message.get("metadata", {"trigger_time": 0})["trigger_time"]
+    return message_decoder.decode_input_message(body)
 
-    return message, buckle_belt_result, wrinkles_result, wrinkles_succeed, serial_number, seat_info, time_stamp
 
+def get_station_id(message):
+    return message.get("metadata", {}).get("station_info", {}).get("station_full_id")
 
-def publish_output_message(logger, message, rabbit_mq_channel, rabbit_mq_output_exchange, robot_decision_result,
-                           output_routing_key):
-    logger.info("Publishing output message...")
 
+def encode_output_message(message, robot_decision_result):
     if "decisions" in message:
         message["decisions"].update(robot_decision_result)
     else:
         message.update({"decisions": robot_decision_result})
 
-    body_message = json.dumps(message)
-    rabbit_mq_channel.basic_publish(exchange=rabbit_mq_output_exchange, routing_key=output_routing_key,
-                                    body=body_message)
+    return json.dumps(message)
+
+
+def publish_output_message(logger, message, output_publisher, rabbit_mq_output_exchange, robot_decision_result,
+                           output_routing_key, on_confirmed, output_format=FULL_OUTPUT_FORMAT):
+    logger.info("Publishing output message...")
+
+    if output_format == FULL_OUTPUT_FORMAT:
+        body_message = encode_output_message(message, robot_decision_result)
+        output_publisher.publish(rabbit_mq_output_exchange, output_routing_key, body_message, on_confirmed)
+        return
+
+    encoded_output = encode_decision_message(message, robot_decision_result, output_format)
+    output_publisher.publish(rabbit_mq_output_exchange, output_routing_key, encoded_output.body, on_confirmed,
+                             pika.BasicProperties(content_type=encoded_output.content_type,
+                                                  headers={OUTPUT_FORMAT_HEADER: encoded_output.output_format}))
+
+
+def settle_input_message(rabbit_mq_channel, delivery_tag, succeed):
+    """
+    Acknowledge (or reject without requeue when it could not be processed) an input message, from any thread since
+    the call is handed over to the consumer connection thread
+    """
+    if succeed:
+        settle = partial(rabbit_mq_channel.basic_ack, delivery_tag=delivery_tag)
+    else:
+        settle = partial(rabbit_mq_channel.basic_reject, delivery_tag=delivery_tag, requeue=False)
+    rabbit_mq_channel.connection.add_callback_threadsafe(settle)
+
+
+def get_orders_archive_location(message, timestamp):
+    """
+    Blob folder, hour and pipeline id under which the orders of a seat are archived
+    """
+    time_stamp = datetime.datetime.fromisoformat(timestamp)
+    year = time_stamp.year
+    month = f'{time_stamp.month:02}'
+    day = f'{time_stamp.day:02}'
+
+    plant_id = message["metadata"]["station_info"]["plant"]
+    country_id = message["metadata"]["station_info"]["country"]
+    station_id = message["metadata"]["station_info"]["station_full_id"]
+    pipeline_id = message["metadata"]["pipeline_id"]
+    return f'raw/{country_id}_{plant_id}/{station_id}/{year}/{month}/{day}/', time_stamp.hour, pipeline_id
 
 
 def check_blob_container(logger, conn_str, container_name):
+    # azure is imported here, in the startup thread checking the container, as it is the longest import of the module
+    from azure.storage.blob import ContainerClient
+
     container_client = ContainerClient.from_connection_string(
         conn_str=conn_str, container_name=container_name)
     try:
@@ -130,16 +153,178 @@ def check_blob_container(logger, conn_str, container_name):
     return container_client
 
 
+def timed_startup_phase(startup_metrics, phase, function, *args):
+    with startup_metrics.time_phase(phase):
+        return function(*args)
+
+
+def create_station_robot_instances(logger, station_table, mounting_mode, default_robot_configuration,
+                                   orders_file_name, ftp_keepalive_interval, ftp_timeout, decision_cache_size,
+                                   configuration_watch_interval, process_metrics, skip_identical_orders=False):
+    """
+    Create one robot communication per station of the station table, each one with its own FTP session, plans cache
+    and, when the station has its own requested configuration folder, its own configuration watcher
+    """
+    station_robot_instances = {}
+    for station in station_table.values():
+        station_configuration = default_robot_configuration
+        if station.configuration_directory:
+            station_configuration = load_robot_configuration(
+                logger, *get_configuration_files(logger, DEFAULT_CONFIGURATION_PATH,
+                                                 Path(station.configuration_directory)))
+            for configuration_problem in validate_robot_configuration(station_configuration):
+                logger.warning(f'Station "{station.station_full_id}": {configuration_problem}')
+
+        station_robot_instance = AbbCommunication(logger, station.robot_ip_address, station.robot_port,
+                                                  station.ftp_user, station.ftp_password, mounting_mode,
+                                                  station_configuration, orders_file_name,
+                                                  station.server_output_directory, ftp_keepalive_interval,
+                                                  ftp_timeout, decision_cache_size, process_metrics,
+                                                  skip_identical_orders)
+        station_robot_instances[station.station_full_id] = station_robot_instance
+        logger.info(f'Station "{station.station_full_id}" served by robot {station.robot_ip_address}:'
+                    f'{station.robot_port}')
+
+        if station.configuration_directory and configuration_watch_interval > 0:
+            ConfigurationWatcher(logger, DEFAULT_CONFIGURATION_PATH, Path(station.configuration_directory),
+                                 station_configuration.version, station_robot_instance.swap_configuration,
+                                 configuration_watch_interval).start()
+
+    return station_robot_instances
+
+
+def start_network_startup_phases(logger, startup_metrics, amqp_host, output_exchange, input_exchange,
+                                  input_routing_key, prefetch_count, input_queue_name, blob_connection_string,
+                                  blob_container_name):
+    """
+    Open the AMQP connection and check the blob container in startup threads, as they wait on the network, and return
+    their futures
+    """
+    startup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='startup')
+    amqp_connection_future = startup_executor.submit(
+        timed_startup_phase, startup_metrics, AMQP_CONNECTION_PHASE, initialize_amqp_connection, amqp_host,
+        output_exchange, input_exchange, input_routing_key, prefetch_count, input_queue_name)
+    container_client_future = startup_executor.submit(
+        timed_startup_phase, startup_metrics, BLOB_CONTAINER_PHASE, check_blob_container, logger,
+        blob_connection_string, blob_container_name)
+    startup_executor.shutdown(wait=False)
+    return amqp_connection_future, container_client_future
+
+
+def create_robot_instances(logger, robot_configuration, ip_ftp, port_ftp, user_ftp, password_ftp, mounting_mode,
+                           orders_file_name, ftp_output_directory, ftp_keepalive_interval, ftp_timeout,
+                           decision_cache_size, configuration_watch_interval, process_metrics, skip_identical_orders,
+                           station_table_file, station_workers):
+    """
+    Create the default robot communication and, with a station table, the robot communication of each station and the
+    station dispatcher
+    """
+    robot_instance = AbbCommunication(logger, ip_ftp, port_ftp, user_ftp, password_ftp, mounting_mode,
+                                      robot_configuration, orders_file_name, ftp_output_directory,
+                                      ftp_keepalive_interval, ftp_timeout, decision_cache_size, process_metrics,
+                                      skip_identical_orders)
+
+    station_robot_instances = {}
+    station_dispatcher = None
+    if station_table_file:
+        station_table = get_station_table(station_table_file, ftp_output_directory)
+        station_robot_instances = create_station_robot_instances(
+            logger, station_table, mounting_mode, robot_configuration, orders_file_name, ftp_keepalive_interval,
+            ftp_timeout, decision_cache_size, configuration_watch_interval, process_metrics, skip_identical_orders)
+        station_dispatcher = StationDispatcher(logger, station_workers or len(station_table), station_table)
+        logger.info(f'Multi-robot mode: {len(station_table)} stations on {len(station_dispatcher.executors)} '
+                    f'workers')
+    return robot_instance, station_robot_instances, station_dispatcher
+
+
+def add_robot_counters(counters_collector, module_id, robot_instances):
+    """
+    Add the FTP session, orders uploads and plans cache counters, summed over the robots
+    """
+    counters_collector.add_counter(f"{module_id}_ftp_connections", "FTP sessions opened with the robot",
+                                   lambda: sum(robot.ftp_client.connections_count for robot in robot_instances))
+    counters_collector.add_counter(f"{module_id}_ftp_reused_connections", "Uploads done on an opened FTP session",
+                                   lambda: sum(robot.ftp_client.reused_connections_count for robot in robot_instances))
+    counters_collector.add_counter(f"{module_id}_ftp_reconnections", "FTP sessions reopened after a drop",
+                                   lambda: sum(robot.ftp_client.reconnections_count for robot in robot_instances))
+    for upload_kind in (FULL_UPLOAD, REUSED_ENCODING_UPLOAD, SKIPPED_UPLOAD):
+        counters_collector.add_counter(
+            f"{module_id}_ftp_orders_uploads", "Orders deliveries to the robot FTP by kind: full, reused_encoding "
+            "(zone rows not encoded again) or skipped",
+            partial(lambda kind: sum(robot.ftp_client.uploads_count[kind] for robot in robot_instances), upload_kind),
+            {'upload': upload_kind})
+    ftp_orders_bytes_documentation = "Orders bytes uploaded to or not uploaded again on the robot FTP"
+    counters_collector.add_counter(f"{module_id}_ftp_orders_bytes", ftp_orders_bytes_documentation,
+                                   lambda: sum(robot.ftp_client.uploaded_bytes for robot in robot_instances),
+                                   {'outcome': 'uploaded'})
+    counters_collector.add_counter(f"{module_id}_ftp_orders_bytes", ftp_orders_bytes_documentation,
+                                   lambda: sum(robot.ftp_client.skipped_bytes for robot in robot_instances),
+                                   {'outcome': 'skipped'})
+    counters_collector.add_counter(f"{module_id}_decision_cache_hits", "Robot plans taken from the cache",
+                                   lambda: sum(robot.decision_cache.hits_count for robot in robot_instances))
+    counters_collector.add_counter(f"{module_id}_decision_cache_misses", "Robot plans computed",
+                                   lambda: sum(robot.decision_cache.misses_count for robot in robot_instances))
+    counters_collector.add_counter(f"{module_id}_decision_cache_evictions", "Robot plans evicted from the cache",
+                                   lambda: sum(robot.decision_cache.evictions_count for robot in robot_instances))
+
+
+def create_blob_uploader(logger, container_client, spool_directory, spool_max_bytes, spool_fsync, spool_max_age,
+                         queue_size, workers, max_retries, latency_metric, failure_metric):
+    """
+    Create the blob uploader, spooling the uploads on disk when a spool directory is given
+    """
+    if not spool_directory:
+        return BlobUploader(logger, container_client, queue_size=queue_size, workers=workers,
+                            max_retries=max_retries, latency_metric=latency_metric, failure_metric=failure_metric)
+
+    if spool_fsync not in FSYNC_POLICIES:
+        logger.warning(f'Unknown blob spool fsync policy "{spool_fsync}", "{FSYNC_ALWAYS}" policy used')
+        spool_fsync = FSYNC_ALWAYS
+    logger.info(f'Blob uploads spooled in "{spool_directory}" (up to {spool_max_bytes} bytes, fsync {spool_fsync})')
+    return BlobSpool(logger, container_client, spool_directory, max_bytes=spool_max_bytes, fsync_policy=spool_fsync,
+                     max_age=spool_max_age, workers=workers, max_retries=max_retries, latency_metric=latency_metric,
+                     failure_metric=failure_metric)
+
+
+def start_orders_archiver(logger, blob_uploader, archive_mode, instance_id, max_batch_bytes, max_batch_age,
+                          blob_spool_directory):
+    """
+    Start the orders archiver in batch archive mode, return None in seat blob archive mode. With a blob spool, the
+    batches are journaled in the spool directory.
+    """
+    if archive_mode not in ARCHIVE_MODES:
+        logger.warning(f'Unknown orders archive mode "{archive_mode}", "{SEAT_BLOB_ARCHIVE_MODE}" mode used')
+    if archive_mode != BATCH_ARCHIVE_MODE:
+        return None
+
+    journal_directory = Path(blob_spool_directory) / ORDERS_JOURNAL_DIRECTORY_NAME if blob_spool_directory else None
+    orders_archiver = OrdersArchiver(logger, blob_uploader, instance_id=instance_id, max_batch_bytes=max_batch_bytes,
+                                     max_batch_age=max_batch_age, journal_directory=journal_directory)
+    orders_archiver.start()
+    logger.info(f'Orders archived by batches of {max_batch_bytes} bytes or {max_batch_age} seconds')
+    return orders_archiver
+
+
 logger = set_logs()
 
 
 def main():
+    startup_time = time.perf_counter()
     rabbit_mq_server_url = os.getenv('AMQP_HOST', 'localhost')
     input_ip_ftp = os.getenv("ROBOT_IP_ADDRESS", '127.0.0.1')
     input_port_ftp = int(os.getenv('ROBOT_PORT', 2121))
     input_user_ftp = os.getenv('FTP_USER', 'user')
     input_password_ftp = os.getenv('FTP_PASSWORD', 'password')
     mounting_mode = os.getenv('MOUNTING_MODE', 'False').lower() in 'true'
+    ftp_keepalive_interval = float(os.getenv('FTP_KEEPALIVE_INTERVAL', 30))
+    ftp_timeout = float(os.getenv('FTP_TIMEOUT', 10))
+    skip_identical_orders = os.getenv('SKIP_IDENTICAL_ORDERS', 'False').lower() == 'true'
+    decision_cache_size = int(os.getenv('DECISION_CACHE_SIZE', 1024))
+    configuration_watch_interval = float(os.getenv('CONFIGURATION_WATCH_INTERVAL', 10))
+    configuration_sync_interval = float(os.getenv('CONFIGURATION_SYNC_INTERVAL', 0))
+    configuration_ftp_directory = os.getenv('CONFIGURATION_FTP_DIRECTORY', 'Aivi_Configuration')
+    station_table_file = os.getenv('STATION_TABLE_FILE', '')
+    station_workers = int(os.getenv('STATION_WORKERS', 0))
 
     ftp_server_out_put_directory = os.getenv('SERVER_OUTPUT_DIRECTORY', 'Aivi_Output')
     input_orders_file_name = os.getenv('INPUT_ORDER_FILE_NAME', 'orders.csv')
@@ -147,8 +332,25 @@ def main():
     rabbit_mq_input_exchange_name = os.getenv('INPUT_EXCHANGE', 'robot_input')
     blob_connection_string = os.environ["BLOB_STORAGE_CONNECTION_STRING"]
     blob_container_name = os.getenv('BLOB_CONTAINER_NAME', 'stlocal')
+    blob_upload_queue_size = int(os.getenv('BLOB_UPLOAD_QUEUE_SIZE', 1000))
+    blob_upload_workers = int(os.getenv('BLOB_UPLOAD_WORKERS', 2))
+    blob_upload_max_retries = int(os.getenv('BLOB_UPLOAD_MAX_RETRIES', 5))
+    blob_spool_directory = os.getenv('BLOB_SPOOL_DIRECTORY', '')
+    blob_spool_max_bytes = int(os.getenv('BLOB_SPOOL_MAX_BYTES', 512 * 1024 * 1024))
+    blob_spool_fsync = os.getenv('BLOB_SPOOL_FSYNC', FSYNC_ALWAYS)
+    blob_spool_max_age = float(os.getenv('BLOB_SPOOL_MAX_AGE', 24 * 3600))
+    orders_archive_mode = os.getenv('ORDERS_ARCHIVE_MODE', SEAT_BLOB_ARCHIVE_MODE)
+    orders_archive_batch_bytes = int(os.getenv('ORDERS_ARCHIVE_BATCH_BYTES', 1024 * 1024))
+    orders_archive_batch_age = float(os.getenv('ORDERS_ARCHIVE_BATCH_AGE', 300))
     input_routing_key = os.getenv("INPUT_ROUTING_KEY", "#")
     output_routing_key = os.getenv("OUTPUT_ROUTING_KEY", "")
+    input_queue_name = os.getenv("INPUT_QUEUE_NAME", "")
+    amqp_prefetch_count = int(os.getenv('AMQP_PREFETCH_COUNT', 32))
+    throughput_log_interval = float(os.getenv('THROUGHPUT_LOG_INTERVAL', 60))
+    requested_output_format = os.getenv('OUTPUT_FORMAT', FULL_OUTPUT_FORMAT)
+    default_output_format = get_available_output_format(requested_output_format, FULL_OUTPUT_FORMAT)
+    if default_output_format != requested_output_format:
+        logger.warning(f'Output format "{requested_output_format}" not available, "{default_output_format}" used')
     METRICS_PORT = int(os.getenv('METRICS_PORT', 9605))
 
     labels = ['deviceId', 'instanceNumber', 'iothubHostname', 'moduleId']
@@ -160,74 +362,193 @@ def main():
         deviceId, instanceNumber, iothubHostname, moduleId)
     counter_failures = Counter(f"{moduleId}_counter_failures", "Failure counter", labels).labels(
         deviceId, instanceNumber, iothubHostname, moduleId)
+    gauge_blob_queue_depth = Gauge(f"{moduleId}_blob_upload_queue_depth", "Blob uploads waiting in queue",
+                                   labels).labels(deviceId, instanceNumber, iothubHostname, moduleId)
+    gauge_blob_spool_bytes = Gauge(f"{moduleId}_blob_spool_bytes", "Blob uploads bytes waiting in the disk spool",
+                                   labels).labels(deviceId, instanceNumber, iothubHostname, moduleId)
+    gauge_blob_spool_dead_letters = Gauge(f"{moduleId}_blob_spool_dead_letters",
+                                          "Blob uploads given up and moved to the spool dead letter folder",
+                                          labels).labels(deviceId, instanceNumber, iothubHostname, moduleId)
+    gauge_unconfirmed_publishes = Gauge(f"{moduleId}_unconfirmed_publishes",
+                                        "Output messages waiting for the broker confirmation",
+                                        labels).labels(deviceId, instanceNumber, iothubHostname, moduleId)
+    counter_acknowledged_messages = Counter(f"{moduleId}_acknowledged_messages", "Input messages acknowledged",
+                                            labels).labels(deviceId, instanceNumber, iothubHostname, moduleId)
+    process_metrics = create_process_metrics(moduleId, labels, [deviceId, instanceNumber, iothubHostname, moduleId])
+    startup_metrics = create_startup_metrics(moduleId, labels, [deviceId, instanceNumber, iothubHostname, moduleId],
+                                             startup_time)
 
     logger.info('Starting up http server to expose metrics...')
-    start_http_server(METRICS_PORT)
-
-    input_zone_time_mapping_file_path, input_transition_time_table_path, input_robot_configuration_file_path = \
-        get_configuration_files()
-
-    robot_configuration_dict = load_data_from_json_file(input_robot_configuration_file_path, logger)
-    input_previous_transition_point = robot_configuration_dict["previous_transition_point"]
-    input_cycle_time = float(robot_configuration_dict["cycle_time"])
-    input_cumulated_time = float(robot_configuration_dict["cumulated_time"])
-    input_acceptance_threshold = int(robot_configuration_dict["acceptance_threshold"])
-    input_upload_ftp = robot_configuration_dict["upload_ftp"]
-    input_left_buckle = robot_configuration_dict.get("left_buckle")
-    input_central_buckle = robot_configuration_dict.get("central_buckle")
-    input_right_buckle = robot_configuration_dict.get("right_buckle")
-    input_zones_not_to_steam_from_buckle_detection = {LEFT_BUCKLE: input_left_buckle,
-                                                      CENTRAL_BUCKLE: input_central_buckle,
-                                                      RIGHT_BUCKLE: input_right_buckle}
-
-    rabbit_mq_channel, input_queue = initialize_amqp_connection(rabbit_mq_server_url, rabbit_mq_output_exchange_name,
-                                                                rabbit_mq_input_exchange_name, input_routing_key)
-
-    robot_instance = AbbCommunication(logger, input_ip_ftp, input_port_ftp, input_user_ftp, input_password_ftp,
-                                      mounting_mode,
-                                      input_cycle_time, input_previous_transition_point, input_cumulated_time,
-                                      input_acceptance_threshold,
-                                      input_zones_not_to_steam_from_buckle_detection, input_upload_ftp,
-                                      input_zone_time_mapping_file_path, input_transition_time_table_path,
-                                      input_orders_file_name, ftp_server_out_put_directory)
-
-    container_client = check_blob_container(logger, blob_connection_string, blob_container_name)
-
-    @summary_process.time()
+    with startup_metrics.time_phase(METRICS_SERVER_PHASE):
+        start_http_server(METRICS_PORT)
+
+    # the AMQP connection and the blob container check wait on the network, they run while the configuration loads
+    amqp_connection_future, container_client_future = start_network_startup_phases(
+        logger, startup_metrics, rabbit_mq_server_url, rabbit_mq_output_exchange_name, rabbit_mq_input_exchange_name,
+        input_routing_key, amqp_prefetch_count, input_queue_name, blob_connection_string, blob_container_name)
+
+    with startup_metrics.time_phase(CONFIGURATION_PHASE):
+        if configuration_sync_interval > 0:
+            configuration_sync = ConfigurationSync(logger, input_ip_ftp, input_port_ftp, input_user_ftp,
+                                                   input_password_ftp, configuration_ftp_directory,
+                                                   REQUESTED_CONFIGURATION_PATH, configuration_sync_interval,
+                                                   ftp_timeout)
+            configuration_sync.synchronize()
+            configuration_sync.start()
+
+        robot_configuration = load_robot_configuration(
+            logger, *get_configuration_files(logger, DEFAULT_CONFIGURATION_PATH, REQUESTED_CONFIGURATION_PATH))
+        for configuration_problem in validate_robot_configuration(robot_configuration):
+            logger.warning(configuration_problem)
+
+    output_publisher = ConfirmedPublisher(logger, rabbit_mq_server_url)
+    output_publisher.start()
+    gauge_unconfirmed_publishes.set_function(output_publisher.get_unconfirmed_count)
+
+    with startup_metrics.time_phase(ROBOTS_PHASE):
+        robot_instance, station_robot_instances, station_dispatcher = create_robot_instances(
+            logger, robot_configuration, input_ip_ftp, input_port_ftp, input_user_ftp, input_password_ftp,
+            mounting_mode, input_orders_file_name, ftp_server_out_put_directory, ftp_keepalive_interval, ftp_timeout,
+            decision_cache_size, configuration_watch_interval, process_metrics, skip_identical_orders,
+            station_table_file, station_workers)
+
+    robot_instances = [robot_instance] + list(station_robot_instances.values())
+    counters_collector = CountersCollector(labels, [deviceId, instanceNumber, iothubHostname, moduleId])
+    add_robot_counters(counters_collector, moduleId, robot_instances)
+    REGISTRY.register(counters_collector)
+
+    if configuration_watch_interval > 0:
+        configuration_watcher = ConfigurationWatcher(logger, DEFAULT_CONFIGURATION_PATH, REQUESTED_CONFIGURATION_PATH,
+                                                     robot_configuration.version, robot_instance.swap_configuration,
+                                                     configuration_watch_interval)
+        configuration_watcher.start()
+
+    rabbit_mq_channel, input_queue = amqp_connection_future.result()
+    container_client = container_client_future.result()
+    blob_uploader = create_blob_uploader(logger, container_client, blob_spool_directory, blob_spool_max_bytes,
+                                         blob_spool_fsync, blob_spool_max_age, blob_upload_queue_size,
+                                         blob_upload_workers, blob_upload_max_retries,
+                                         process_metrics.get_stage_latency(BLOB_UPLOAD_STAGE), counter_failures)
+    if blob_spool_directory:
+        gauge_blob_spool_bytes.set_function(blob_uploader.get_spool_bytes)
+        gauge_blob_spool_dead_letters.set_function(blob_uploader.get_dead_lettered_count)
+    blob_uploader.start()
+    gauge_blob_queue_depth.set_function(blob_uploader.get_queue_depth)
+
+    orders_archiver = start_orders_archiver(logger, blob_uploader, orders_archive_mode, str(instanceNumber)[:8],
+                                            orders_archive_batch_bytes, orders_archive_batch_age,
+                                            blob_spool_directory)
+
     @counter_failures.count_exceptions()
-    def callback(rbmq_ch, method, properties, body):
+    def process_message(robot, decoded_message, delivery_tag, output_format):
         message, buckle_belt_result, wrinkles_result, wrinkles_succeed, serial_number, seat_info, timestamp = \
-            decode_input_message(logger, body)
+            decoded_message
         tic = time.perf_counter()
-        robot_decision_result = robot_instance.apply_calculate_robot_actions(wrinkles_result, wrinkles_succeed, buckle_belt_result,
-                                                                             seat_info, serial_number)
-
-        if robot_decision_result['steaming_robot']['upload_ftp']:
-            time_stamp = datetime.datetime.fromisoformat(timestamp)
-            year = time_stamp.year
-            month = f'{time_stamp.month:02}'
-            day = f'{time_stamp.day:02}'
-
-            plant_id = message["metadata"]["station_info"]["plant"]
-            country_id = message["metadata"]["station_info"]["country"]
-            station_id = message["metadata"]["station_info"]["station_full_id"]
-            pipeline_id = message["metadata"]["pipeline_id"]
-            blob_name = f'raw/{country_id}_{plant_id}/{station_id}/{year}/{month}/{day}/{pipeline_id}_robot_orders.csv'
-
-            result_put_in_orders = robot_decision_result['steaming_robot']['abb_format_zones']
-            df = pd.DataFrame(result_put_in_orders)
-            output = df.to_csv(index=False, encoding="utf-8", header=None)
-            container_client.upload_blob(name=blob_name, data=output, overwrite=True)
-
-        publish_output_message(logger, message, rabbit_mq_channel,
-                               rabbit_mq_output_exchange_name, robot_decision_result, output_routing_key)
+        robot_decision_result, orders_to_deliver = robot.calculate_robot_actions(
+            wrinkles_result, wrinkles_succeed, buckle_belt_result, seat_info, serial_number)
+        if orders_to_deliver:
+            archive_folder, archive_hour, pipeline_id = get_orders_archive_location(message, timestamp)
+
+        # The orders are archived while they are delivered to the robot, the output is published once the delivery
+        # status is known
+        robot_delivery = robot.start_robot_decision_delivery(robot_decision_result, orders_to_deliver)
+        if orders_to_deliver:
+            orders = encode_orders(robot_decision_result['steaming_robot']['abb_format_zones'])
+            if orders_archiver is not None:
+                orders_archiver.archive(archive_folder, archive_hour, pipeline_id, orders)
+            else:
+                blob_uploader.enqueue(f'{archive_folder}{pipeline_id}{ORDERS_BLOB_SUFFIX}', orders)
+        robot_delivery.add_done_callback(partial(publish_robot_decision, message, robot_decision_result, delivery_tag,
+                                                 output_format, tic))
+
+    def publish_robot_decision(message, robot_decision_result, delivery_tag, output_format, tic, robot_delivery):
+        """
+        Publish the robot decision of a seat once its orders are delivered, on the delivery thread of the robot
+        """
+        delivery_error = robot_delivery.exception()
+        if delivery_error is not None:
+            counter_failures.inc()
+            logger.error(f'the error "{delivery_error}" occurred when delivering the orders to the robot')
+
+        try:
+            with counter_failures.count_exceptions(), process_metrics.time_stage(PUBLISH_STAGE):
+                publish_output_message(logger, message, output_publisher, rabbit_mq_output_exchange_name,
+                                       robot_decision_result, output_routing_key,
+                                       partial(acknowledge_input_message, delivery_tag), output_format)
+        except Exception:
+            logger.exception('Output publication failed, input message rejected')
+            settle_input_message(rabbit_mq_channel, delivery_tag, succeed=False)
+            return
         toc = time.perf_counter()
+        summary_process.observe(toc - tic)
         logger.info(f'Done in {toc - tic:0.4f} seconds.')
 
-    rabbit_mq_channel.basic_consume(queue=input_queue, on_message_callback=callback, auto_ack=True)
+    def acknowledge_input_message(delivery_tag):
+        settle_input_message(rabbit_mq_channel, delivery_tag, succeed=True)
+        counter_acknowledged_messages.inc()
+
+    def process_and_settle_message(robot, decoded_message, delivery_tag, output_format):
+        try:
+            process_message(robot, decoded_message, delivery_tag, output_format)
+        except Exception:
+            logger.exception('Seat processing failed, input message rejected')
+            settle_input_message(rabbit_mq_channel, delivery_tag, succeed=False)
+
+    def callback(rbmq_ch, method, properties, body):
+        startup_metrics.mark(FIRST_MESSAGE_PHASE)
+        try:
+            with counter_failures.count_exceptions(), process_metrics.time_stage(DECODE_STAGE):
+                decoded_message = decode_input_message(logger, body)
+        except message_decoder.InvalidInputMessage as e:
+            logger.error(f'Invalid input message rejected - {e}')
+            rbmq_ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        output_format = get_available_output_format((properties.headers or {}).get(OUTPUT_FORMAT_HEADER),
+                                                    default_output_format)
+        if station_dispatcher is None:
+            process_and_settle_message(robot_instance, decoded_message, method.delivery_tag, output_format)
+            return
+
+        station_id = get_station_id(decoded_message.message)
+        station_robot_instance = station_robot_instances.get(station_id)
+        if station_robot_instance is None:
+            logger.warning(f'Station "{station_id}" not in station table, default robot used')
+            station_robot_instance = robot_instance
+        station_dispatcher.submit(station_id, process_and_settle_message, station_robot_instance, decoded_message,
+                                  method.delivery_tag, output_format)
+
+    throughput_measure = {'time': time.perf_counter(), 'acknowledged': 0}
+
+    def log_throughput():
+        now = time.perf_counter()
+        acknowledged = output_publisher.confirmed_count
+        seats_count = acknowledged - throughput_measure['acknowledged']
+        logger.info(f'Throughput: {seats_count / (now - throughput_measure["time"]):0.2f} seats/s with prefetch '
+                    f'{amqp_prefetch_count} ({seats_count} seats, {output_publisher.get_unconfirmed_count()} '
+                    f'unconfirmed outputs)')
+        throughput_measure.update({'time': now, 'acknowledged': acknowledged})
+        rabbit_mq_channel.connection.call_later(throughput_log_interval, log_throughput)
+
+    if throughput_log_interval > 0:
+        rabbit_mq_channel.connection.call_later(throughput_log_interval, log_throughput)
+
+    rabbit_mq_channel.basic_consume(queue=input_queue, on_message_callback=callback)
+    startup_metrics.mark(READY_PHASE)
+    logger.info(f'Startup: {startup_metrics.get_breakdown()}')
 
     logger.info(' [*] Waiting for messages. To exit press CTRL+C')
-    rabbit_mq_channel.start_consuming()
+    try:
+        rabbit_mq_channel.start_consuming()
+    finally:
+        if station_dispatcher is not None:
+            station_dispatcher.stop()
+        for robot in robot_instances:
+            robot.stop_delivery()
+        output_publisher.stop(timeout=10)
+        if orders_archiver is not None:
+            orders_archiver.stop(timeout=10)
+        blob_uploader.stop(timeout=30)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+import logging
+import threading
+import unittest
+from pathlib import Path
+
+from abb_communication import AbbCommunication
+from tools.robot_configuration import get_configuration_files, load_robot_configuration
+
+DEFAULT_CONFIGURATION_PATH = Path(__file__).absolute().parent.parent / 'default_configuration'
+
+logger = logging.getLogger('tests')
+
+
+def get_robot_decision(serial_number: str):
+    return {'steaming_robot': {'abb_format_zones': [['473', serial_number]], 'upload_ftp': False}}
+
+
+class TestRobotDecisionDelivery(unittest.TestCase):
+    def setUp(self):
+        configuration = load_robot_configuration(
+            logger, *get_configuration_files(logger, DEFAULT_CONFIGURATION_PATH, DEFAULT_CONFIGURATION_PATH))
+        self.robot = AbbCommunication(logger, '127.0.0.1', 21, 'user', 'password', False, configuration,
+                                      'orders.csv', 'Aivi_Output')
+
+    def tearDown(self):
+        self.robot.stop_delivery()
+
+    def test_orders_delivered_while_the_caller_goes_on(self):
+        orders_archived = threading.Event()
+        self.robot.deliver_robot_orders = lambda abb_format_zones: 'OK' if orders_archived.wait(5) else 'NOK'
+
+        robot_delivery = self.robot.start_robot_decision_delivery(get_robot_decision('S1'), True)
+        orders_archived.set()
+
+        self.assertTrue(robot_delivery.result(timeout=5)['steaming_robot']['upload_ftp'])
+
+    def test_decisions_delivered_in_submission_order(self):
+        delivered_serial_numbers = []
+        self.robot.deliver_robot_orders = \
+            lambda abb_format_zones: delivered_serial_numbers.append(abb_format_zones[0][1]) or 'OK'
+        done_serial_numbers = []
+
+        for serial_number in ('S1', 'S2', 'S3'):
+            robot_delivery = self.robot.start_robot_decision_delivery(get_robot_decision(serial_number), True)
+            robot_delivery.add_done_callback(
+                lambda future: done_serial_numbers.append(future.result()['steaming_robot']['abb_format_zones'][0][1]))
+        self.robot.stop_delivery()
+
+        self.assertEqual(delivered_serial_numbers, ['S1', 'S2', 'S3'])
+        self.assertEqual(done_serial_numbers, ['S1', 'S2', 'S3'])
+
+    def test_delivery_error_raised_by_the_future(self):
+        def deliver_robot_orders(abb_format_zones):
+            raise ConnectionRefusedError('robot unreachable')
+
+        self.robot.deliver_robot_orders = deliver_robot_orders
+        robot_decision = get_robot_decision('S1')
+
+        robot_delivery = self.robot.start_robot_decision_delivery(robot_decision, True)
+
+        self.assertIsInstance(robot_delivery.exception(timeout=5), ConnectionRefusedError)
+        self.assertFalse(robot_decision['steaming_robot']['upload_ftp'])
+
+    def test_decision_without_orders_not_delivered(self):
+        self.robot.deliver_robot_orders = lambda abb_format_zones: self.fail('orders delivered')
+
+        robot_delivery = self.robot.start_robot_decision_delivery(get_robot_decision('S1'), False)
+
+        self.assertFalse(robot_delivery.result(timeout=5)['steaming_robot']['upload_ftp'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import logging
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from tools.blob_spool import BlobSpool, DEAD_LETTER_DIRECTORY_NAME, SPOOL_FILE_SUFFIX
+from tools.blob_uploader import BlobUploader
+
+logger = logging.getLogger('tests')
+
+
+class HttpError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+
+
+class ContainerClient:
+    """
+    Stand-in of the blob container client, raising the given error while it is set
+    """
+
+    def __init__(self, error=None):
+        self.error = error
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+    def upload_blob(self, name, data, overwrite=False):
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            self.blobs[name] = data
+
+
+class TestBlobSpool(unittest.TestCase):
+    def setUp(self):
+        self.spool_folder = tempfile.TemporaryDirectory()
+        self.spool_path = Path(self.spool_folder.name)
+
+    def tearDown(self):
+        self.spool_folder.cleanup()
+
+    def create_blob_spool(self, container_client, **kwargs) -> BlobSpool:
+        return BlobSpool(logger, container_client, self.spool_path, max_retries=0, initial_backoff=0.01,
+                         max_backoff=0.01, **kwargs)
+
+    def get_spool_file_paths(self):
+        return sorted(self.spool_path.glob(f'*{SPOOL_FILE_SUFFIX}'))
+
+    def test_spooled_payloads_uploaded_and_deleted(self):
+        container_client = ContainerClient()
+        blob_spool = self.create_blob_spool(container_client)
+        blob_spool.start()
+        for blob_number in range(5):
+            self.assertTrue(blob_spool.enqueue(f'{blob_number}.csv', f'data {blob_number}'))
+        blob_spool.stop(timeout=5)
+
+        self.assertEqual(container_client.blobs, {f'{blob_number}.csv': f'data {blob_number}'.encode()
+                                                  for blob_number in range(5)})
+        self.assertEqual(self.get_spool_file_paths(), [])
+        self.assertEqual(blob_spool.get_spool_bytes(), 0)
+
+    def test_payloads_beyond_the_spool_size_dropped(self):
+        blob_spool = self.create_blob_spool(ContainerClient(), max_bytes=20)
+
+        self.assertTrue(blob_spool.enqueue('first.csv', b'0123456789'))
+        self.assertFalse(blob_spool.enqueue('second.csv', b'0123456789'))
+        self.assertEqual(blob_spool.rejected_count, 1)
+        self.assertEqual(blob_spool.get_spool_bytes(), len(b'first.csv\n0123456789'))
+
+    def test_payloads_left_in_spool_uploaded_at_restart(self):
+        unreachable_container_client = ContainerClient(ConnectionError('storage unreachable'))
+        blob_spool = self.create_blob_spool(unreachable_container_client)
+        blob_spool.start()
+        blob_spool.enqueue('first.csv', b'first')
+        blob_spool.enqueue('second.csv', b'second')
+        blob_spool.stop(timeout=5)
+
+        self.assertEqual(len(self.get_spool_file_paths()), 2)
+        self.assertEqual(blob_spool.dead_lettered_count, 0)
+
+        container_client = ContainerClient()
+        restarted_blob_spool = self.create_blob_spool(container_client)
+        restarted_blob_spool.start()
+        self.assertEqual(restarted_blob_spool.get_spool_bytes(), len(b'first.csv\nfirst') + len(b'second.csv\nsecond'))
+        restarted_blob_spool.stop(timeout=5)
+
+        self.assertEqual(container_client.blobs, {'first.csv': b'first', 'second.csv': b'second'})
+        self.assertEqual(self.get_spool_file_paths(), [])
+
+    def test_permanent_error_moved_to_dead_letter(self):
+        blob_spool = self.create_blob_spool(ContainerClient(HttpError(403)))
+        blob_spool.start()
+        blob_spool.enqueue('orders.csv', b'data')
+        blob_spool.stop(timeout=5)
+
+        self.assertEqual(self.get_spool_file_paths(), [])
+        self.assertEqual(len(list((self.spool_path / DEAD_LETTER_DIRECTORY_NAME).iterdir())), 1)
+        self.assertEqual((blob_spool.dead_lettered_count, blob_spool.failed_count), (1, 1))
+        self.assertEqual(blob_spool.get_spool_bytes(), 0)
+
+    def test_expired_payload_moved_to_dead_letter(self):
+        blob_spool = self.create_blob_spool(ContainerClient(HttpError(503)), max_age=0)
+        blob_spool.start()
+        blob_spool.enqueue('orders.csv', b'data')
+        blob_spool.stop(timeout=5)
+
+        self.assertEqual(blob_spool.dead_lettered_count, 1)
+        self.assertEqual(self.get_spool_file_paths(), [])
+
+
+class TestBlobUploaderStop(unittest.TestCase):
+    def test_stop_does_not_wait_on_a_full_queue(self):
+        stop_done = threading.Event()
+        blob_uploader = BlobUploader(logger, ContainerClient(ConnectionError('storage unreachable')), queue_size=2,
+                                     workers=1, max_retries=100, initial_backoff=60)
+        blob_uploader.start()
+        for blob_number in range(3):
+            blob_uploader.enqueue(f'{blob_number}.csv', b'data')
+
+        stop_thread = threading.Thread(target=lambda: blob_uploader.stop(timeout=5) or stop_done.set())
+        stop_thread.start()
+
+        self.assertTrue(stop_done.wait(5))
+        self.assertEqual(blob_uploader.get_queue_depth(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
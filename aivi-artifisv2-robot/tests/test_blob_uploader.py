@@ -0,0 +1,87 @@
+import logging
+import unittest
+
+from tools.blob_uploader import BlobUploader, BlobUploadTask
+
+logger = logging.getLogger('tests')
+
+
+class HttpError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+
+
+class FlakyContainerClient:
+    """
+    Stand-in of the blob container client, raising the given errors before uploading
+    """
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.attempts = 0
+        self.blobs = {}
+
+    def upload_blob(self, name, data, overwrite=False):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        self.blobs[name] = data
+
+
+class TestBlobUploader(unittest.TestCase):
+    def create_blob_uploader(self, container_client, **kwargs) -> BlobUploader:
+        blob_uploader = BlobUploader(logger, container_client, initial_backoff=0.01, max_backoff=0.04, **kwargs)
+        backoffs = []
+        blob_uploader.stopping.wait = lambda backoff: backoffs.append(backoff)
+        blob_uploader.backoffs = backoffs
+        return blob_uploader
+
+    def test_upload_retried_with_exponential_backoff(self):
+        container_client = FlakyContainerClient([ConnectionError('reset')] * 4)
+        blob_uploader = self.create_blob_uploader(container_client, max_retries=5)
+
+        self.assertTrue(blob_uploader.upload_with_retry(BlobUploadTask('orders.csv', b'data', 0)))
+        self.assertEqual(container_client.blobs, {'orders.csv': b'data'})
+        self.assertEqual(blob_uploader.backoffs, [0.01, 0.02, 0.04, 0.04])
+
+    def test_upload_failed_after_the_retries(self):
+        container_client = FlakyContainerClient([HttpError(503)] * 3)
+        blob_uploader = self.create_blob_uploader(container_client, max_retries=2)
+
+        self.assertFalse(blob_uploader.upload_with_retry(BlobUploadTask('orders.csv', b'data', 0)))
+        self.assertEqual(container_client.attempts, 3)
+        self.assertEqual(blob_uploader.failed_count, 1)
+
+    def test_permanent_error_not_retried(self):
+        container_client = FlakyContainerClient([HttpError(403)])
+        blob_uploader = self.create_blob_uploader(container_client, max_retries=5)
+
+        self.assertFalse(blob_uploader.upload_with_retry(BlobUploadTask('orders.csv', b'data', 0)))
+        self.assertEqual(container_client.attempts, 1)
+        self.assertEqual(blob_uploader.backoffs, [])
+
+    def test_payload_refused_when_queue_full(self):
+        blob_uploader = BlobUploader(logger, FlakyContainerClient(), queue_size=2)
+
+        self.assertTrue(blob_uploader.enqueue('first.csv', b'data'))
+        self.assertTrue(blob_uploader.enqueue('second.csv', b'data'))
+        self.assertFalse(blob_uploader.enqueue('third.csv', b'data'))
+        self.assertEqual(blob_uploader.rejected_count, 1)
+        self.assertEqual(blob_uploader.get_queue_depth(), 2)
+
+    def test_queued_payloads_uploaded_before_stop(self):
+        container_client = FlakyContainerClient()
+        blob_uploader = BlobUploader(logger, container_client, workers=2)
+        for blob_number in range(10):
+            blob_uploader.enqueue(f'{blob_number}.csv', b'data')
+
+        blob_uploader.start()
+        blob_uploader.stop(timeout=5)
+
+        self.assertEqual(len(container_client.blobs), 10)
+        self.assertEqual(blob_uploader.uploaded_count, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import logging
+import socket
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools.configuration_sync import ConfigurationSync, SYNC_STATE_FILE_NAME
+from tools.robot_configuration import ROBOT_MODULE_CONFIGURATION_FILE_NAME, TRANSITION_TIME_TABLE_FILE_NAME
+from tools.run_local_FTP_server import FtpTestServer
+
+REMOTE_DIRECTORY = 'Aivi_Configuration'
+
+logger = logging.getLogger('tests')
+
+
+def get_free_port() -> int:
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return free_socket.getsockname()[1]
+
+
+class TestConfigurationSync(unittest.TestCase):
+    def setUp(self):
+        self.ftp_folder = tempfile.TemporaryDirectory()
+        self.destination_folder = tempfile.TemporaryDirectory()
+        self.remote_path = Path(self.ftp_folder.name) / REMOTE_DIRECTORY
+        self.remote_path.mkdir()
+        (self.remote_path / ROBOT_MODULE_CONFIGURATION_FILE_NAME).write_text(json.dumps({"cycle_time": 48}))
+        self.destination_path = Path(self.destination_folder.name)
+        port = get_free_port()
+        self.ftp_server = FtpTestServer(port, self.ftp_folder.name)
+        self.ftp_server.daemon = True
+        self.ftp_server.start()
+        self.configuration_sync = ConfigurationSync(logger, '127.0.0.1', port, 'user', 'password', REMOTE_DIRECTORY,
+                                                    self.destination_path, timeout=5)
+
+    def tearDown(self):
+        self.ftp_server.stop()
+        self.ftp_folder.cleanup()
+        self.destination_folder.cleanup()
+
+    def test_files_downloaded_once_until_changed(self):
+        self.assertEqual(self.configuration_sync.synchronize(), [ROBOT_MODULE_CONFIGURATION_FILE_NAME])
+        self.assertEqual((self.destination_path / ROBOT_MODULE_CONFIGURATION_FILE_NAME).read_text(),
+                         json.dumps({"cycle_time": 48}))
+
+        self.assertEqual(self.configuration_sync.synchronize(), [])
+        self.assertEqual(self.configuration_sync.downloads_count, 1)
+
+        (self.remote_path / ROBOT_MODULE_CONFIGURATION_FILE_NAME).write_text(json.dumps({"cycle_time": 50.5}))
+        self.assertEqual(self.configuration_sync.synchronize(), [ROBOT_MODULE_CONFIGURATION_FILE_NAME])
+        self.assertEqual(self.configuration_sync.downloads_count, 2)
+
+    def test_state_kept_across_restarts(self):
+        self.configuration_sync.synchronize()
+
+        restarted_configuration_sync = ConfigurationSync(logger, '127.0.0.1', self.configuration_sync.port, 'user',
+                                                         'password', REMOTE_DIRECTORY, self.destination_path,
+                                                         timeout=5)
+        self.assertEqual(restarted_configuration_sync.synchronize(), [])
+        self.assertEqual(restarted_configuration_sync.downloads_count, 0)
+
+    def test_locally_changed_file_downloaded_again(self):
+        self.configuration_sync.synchronize()
+        (self.destination_path / ROBOT_MODULE_CONFIGURATION_FILE_NAME).write_text('{}')
+
+        self.assertEqual(self.configuration_sync.synchronize(), [ROBOT_MODULE_CONFIGURATION_FILE_NAME])
+
+    def test_file_missing_on_server_left_alone(self):
+        self.configuration_sync.synchronize()
+
+        self.assertFalse((self.destination_path / TRANSITION_TIME_TABLE_FILE_NAME).exists())
+
+    def test_state_not_saved_does_not_stop_the_synchronization(self):
+        (self.destination_path / SYNC_STATE_FILE_NAME).mkdir()
+
+        self.assertEqual(self.configuration_sync.synchronize(), [ROBOT_MODULE_CONFIGURATION_FILE_NAME])
+        self.assertTrue((self.destination_path / ROBOT_MODULE_CONFIGURATION_FILE_NAME).is_file())
+
+    def test_unreachable_server_reported(self):
+        self.ftp_server.stop()
+        self.configuration_sync.port = get_free_port()
+
+        self.assertEqual(self.configuration_sync.synchronize(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
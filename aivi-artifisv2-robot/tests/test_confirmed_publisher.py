@@ -0,0 +1,125 @@
+import logging
+import unittest
+from types import SimpleNamespace
+
+import pika
+from pika.exceptions import ChannelClosedByBroker
+
+from tools.confirmed_publisher import ConfirmedPublisher
+
+logger = logging.getLogger('tests')
+
+
+class FakeIoLoop:
+    """
+    Stand-in of the connection ioloop, running the callbacks right away
+    """
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def call_later(self, delay, callback):
+        callback()
+
+    def stop(self):
+        pass
+
+
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+        self.published_bodies = []
+        self.close_callbacks = []
+
+    def add_on_close_callback(self, callback):
+        self.close_callbacks.append(callback)
+
+    def confirm_delivery(self, callback):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published_bodies.append(body)
+
+    def close_by_broker(self, reply_code, reply_text):
+        self.is_open = False
+        for callback in self.close_callbacks:
+            callback(self, ChannelClosedByBroker(reply_code, reply_text))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.ioloop = FakeIoLoop()
+        self.is_open = True
+        self.channels = []
+
+    def channel(self, on_open_callback):
+        channel = FakeChannel(self)
+        self.channels.append(channel)
+        on_open_callback(channel)
+        return channel
+
+
+def get_confirmation_frame(delivery_tag, multiple=False, refused=False):
+    confirmation_class = pika.spec.Basic.Nack if refused else pika.spec.Basic.Ack
+    return SimpleNamespace(method=confirmation_class(delivery_tag=delivery_tag, multiple=multiple))
+
+
+class TestConfirmedPublisher(unittest.TestCase):
+    def setUp(self):
+        self.publisher = ConfirmedPublisher(logger, 'localhost', reconnection_delay=0)
+        self.connection = FakeConnection()
+        self.publisher.connection = self.connection
+        self.publisher.on_connection_open(self.connection)
+        self.confirmed_messages = []
+
+    def publish(self, body):
+        self.publisher.publish('robot_output', '', body, lambda: self.confirmed_messages.append(body))
+
+    def test_batched_confirmation_confirms_every_message_up_to_its_tag(self):
+        for body in ('first', 'second', 'third'):
+            self.publish(body)
+
+        self.publisher.on_delivery_confirmation(get_confirmation_frame(2, multiple=True))
+
+        self.assertEqual(self.confirmed_messages, ['first', 'second'])
+        self.assertEqual(self.publisher.get_unconfirmed_count(), 1)
+
+    def test_refused_messages_published_again(self):
+        self.publish('first')
+
+        self.publisher.on_delivery_confirmation(get_confirmation_frame(1, refused=True))
+        self.publisher.on_delivery_confirmation(get_confirmation_frame(2))
+
+        self.assertEqual(self.connection.channels[0].published_bodies, ['first', 'first'])
+        self.assertEqual(self.confirmed_messages, ['first'])
+
+    def test_channel_closed_by_broker_reopened_and_messages_published_again(self):
+        self.publish('first')
+        self.publish('second')
+
+        self.connection.channels[0].close_by_broker(404, "NOT_FOUND - no exchange 'robot_output'")
+        self.publish('third')
+
+        self.assertEqual(len(self.connection.channels), 2)
+        self.assertEqual(self.connection.channels[1].published_bodies, ['first', 'second', 'third'])
+        self.assertEqual(self.publisher.republished_count, 2)
+
+        self.publisher.on_delivery_confirmation(get_confirmation_frame(3, multiple=True))
+        self.assertEqual(self.confirmed_messages, ['first', 'second', 'third'])
+        self.assertEqual(self.publisher.get_unconfirmed_count(), 0)
+
+    def test_channel_closed_with_its_connection_not_reopened(self):
+        self.publish('first')
+
+        self.connection.is_open = False
+        self.connection.channels[0].close_by_broker(320, 'CONNECTION_FORCED')
+        self.publisher.on_connection_closed(self.connection, 'CONNECTION_FORCED')
+
+        self.assertEqual(len(self.connection.channels), 1)
+        self.assertEqual(self.publisher.get_unconfirmed_count(), 1)
+        self.assertEqual(self.publisher.republished_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
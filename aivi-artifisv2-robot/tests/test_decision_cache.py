@@ -0,0 +1,84 @@
+import logging
+import unittest
+from pathlib import Path
+
+from abb_communication import AbbCommunication
+from tools.decision_cache import DecisionCache
+from tools.robot_configuration import get_configuration_files, load_robot_configuration
+
+DEFAULT_CONFIGURATION_PATH = Path(__file__).absolute().parent.parent / 'default_configuration'
+
+logger = logging.getLogger('tests')
+
+
+class TestDecisionCache(unittest.TestCase):
+    def test_least_recently_used_plan_evicted(self):
+        decision_cache = DecisionCache(max_size=2)
+        decision_cache.put('first', 1)
+        decision_cache.put('second', 2)
+        decision_cache.get('first')
+
+        decision_cache.put('third', 3)
+
+        self.assertEqual(decision_cache.get('first'), 1)
+        self.assertIsNone(decision_cache.get('second'))
+        self.assertEqual(decision_cache.get('third'), 3)
+        self.assertEqual(decision_cache.evictions_count, 1)
+        self.assertEqual((decision_cache.hits_count, decision_cache.misses_count), (3, 1))
+
+    def test_plans_dropped_when_configuration_version_changes(self):
+        decision_cache = DecisionCache()
+        decision_cache.check_configuration_version('v1')
+        decision_cache.put('seat', 1)
+
+        decision_cache.check_configuration_version('v1')
+        self.assertEqual(decision_cache.get('seat'), 1)
+
+        decision_cache.check_configuration_version('v2')
+        self.assertIsNone(decision_cache.get('seat'))
+        self.assertEqual(decision_cache.invalidations_count, 1)
+
+    def test_zero_size_disables_the_cache(self):
+        decision_cache = DecisionCache(max_size=0)
+        decision_cache.put('seat', 1)
+
+        self.assertIsNone(decision_cache.get('seat'))
+        self.assertEqual(len(decision_cache), 0)
+
+
+class TestCachedSteamingPlan(unittest.TestCase):
+    def setUp(self):
+        self.configuration = load_robot_configuration(
+            logger, *get_configuration_files(logger, DEFAULT_CONFIGURATION_PATH, DEFAULT_CONFIGURATION_PATH))
+        self.robot = AbbCommunication(logger, '127.0.0.1', 21, 'user', 'password', False, self.configuration,
+                                      'orders.csv', 'Aivi_Output')
+
+    def test_serial_number_patched_in_cached_plan(self):
+        predicted_wrinkles = {'1': '0', '2': '0', '10': '0'}
+        computed_plan = self.robot.calculate_steaming_plan(self.configuration, 'R8', 'Tissu', '473',
+                                                           predicted_wrinkles, 'SERIAL1')
+        cached_plan = self.robot.calculate_steaming_plan(self.configuration, 'R8', 'Tissu', '473',
+                                                         predicted_wrinkles, 'SERIAL2')
+
+        self.assertEqual(self.robot.decision_cache.hits_count, 1)
+        self.assertEqual(computed_plan[0][0][:2], ['473', 'SERIAL1'])
+        self.assertEqual(cached_plan[0][0][:2], ['473', 'SERIAL2'])
+        self.assertEqual(cached_plan[0][1:], computed_plan[0][1:])
+        self.assertEqual(cached_plan[1:], computed_plan[1:])
+
+    def test_cached_plan_not_shared_with_the_caller(self):
+        predicted_wrinkles = {'1': '0', '2': '0'}
+        computed_plan = self.robot.calculate_steaming_plan(self.configuration, 'R8', 'Tissu', '473',
+                                                           predicted_wrinkles, 'SERIAL1')
+        computed_plan[0][1][0] = 'changed'
+        computed_plan[1][0]['changed'] = True
+
+        cached_plan = self.robot.calculate_steaming_plan(self.configuration, 'R8', 'Tissu', '473',
+                                                         predicted_wrinkles, 'SERIAL2')
+
+        self.assertNotEqual(cached_plan[0][1][0], 'changed')
+        self.assertNotIn('changed', cached_plan[1][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import logging
+import socket
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from tools.ftp_client import FULL_UPLOAD, REUSED_ENCODING_UPLOAD, SKIPPED_UPLOAD, FtpClient
+from tools.orders_encoder import encode_orders
+from tools.run_local_FTP_server import FtpTestServer
+
+OUTPUT_DIRECTORY = 'Aivi_Output'
+ORDERS_FILE_NAME = 'orders.csv'
+ZONES = [['473', 'S1', None, None, None, None, None, None, None, None, None],
+         [1, 0, 'BL', 1.5, 10, 1, 20, 0, 0, 50, 0]]
+
+logger = logging.getLogger('tests')
+
+
+def get_free_port() -> int:
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return free_socket.getsockname()[1]
+
+
+class TestFtpClient(unittest.TestCase):
+    def setUp(self):
+        self.ftp_folder = tempfile.TemporaryDirectory()
+        (Path(self.ftp_folder.name) / OUTPUT_DIRECTORY).mkdir()
+        self.port = get_free_port()
+        self.ftp_server = FtpTestServer(self.port, self.ftp_folder.name)
+        self.ftp_server.daemon = True
+        self.ftp_server.start()
+        self.ftp_client = FtpClient(logger, ORDERS_FILE_NAME, OUTPUT_DIRECTORY, '127.0.0.1', self.port, 'user',
+                                    'password', keepalive_interval=0, timeout=5)
+
+    def tearDown(self):
+        self.ftp_client.close()
+        self.ftp_server.stop()
+        self.ftp_folder.cleanup()
+
+    def get_delivered_orders(self) -> bytes:
+        return (Path(self.ftp_folder.name) / OUTPUT_DIRECTORY / ORDERS_FILE_NAME).read_bytes()
+
+    def test_session_reused_between_uploads(self):
+        self.assertEqual(self.ftp_client.write_and_push_temporary_file_to_robot(ZONES), 'OK')
+        self.assertEqual(self.ftp_client.write_and_push_temporary_file_to_robot(ZONES), 'OK')
+
+        self.assertEqual(self.get_delivered_orders(), encode_orders(ZONES))
+        self.assertEqual(self.ftp_client.connections_count, 1)
+        self.assertEqual(self.ftp_client.reused_connections_count, 1)
+        self.assertEqual(self.ftp_client.reconnections_count, 0)
+
+    def test_dropped_session_reopened_once(self):
+        self.assertEqual(self.ftp_client.write_and_push_temporary_file_to_robot(ZONES), 'OK')
+        self.ftp_client.ftp_client.sock.shutdown(socket.SHUT_RDWR)
+
+        self.assertEqual(self.ftp_client.write_and_push_temporary_file_to_robot(ZONES), 'OK')
+        self.assertEqual(self.ftp_client.connections_count, 2)
+        self.assertEqual(self.ftp_client.reconnections_count, 1)
+
+    def test_uploads_counted_by_kind(self):
+        self.ftp_client.skip_identical_orders = True
+        other_seat_zones = [['473', 'S2'] + ZONES[0][2:]] + ZONES[1:]
+
+        self.ftp_client.write_and_push_temporary_file_to_robot(ZONES)
+        self.ftp_client.write_and_push_temporary_file_to_robot(other_seat_zones)
+        self.ftp_client.write_and_push_temporary_file_to_robot(other_seat_zones)
+
+        self.assertEqual(self.get_delivered_orders(), encode_orders(other_seat_zones))
+        self.assertEqual(self.ftp_client.uploads_count,
+                         {FULL_UPLOAD: 1, REUSED_ENCODING_UPLOAD: 1, SKIPPED_UPLOAD: 1})
+        self.assertEqual(self.ftp_client.uploaded_bytes, len(encode_orders(ZONES)) * 2)
+        self.assertEqual(self.ftp_client.skipped_bytes, len(encode_orders(other_seat_zones)))
+
+    def test_unreachable_robot_reported_as_ftp_error(self):
+        self.ftp_server.stop()
+        self.ftp_client.port = get_free_port()
+
+        self.assertEqual(self.ftp_client.write_and_push_temporary_file_to_robot(ZONES), 'FTP error')
+        self.assertFalse(self.ftp_client.is_connected())
+
+    def test_keepalive_sends_noop_on_idle_session(self):
+        self.ftp_client.write_and_push_temporary_file_to_robot(ZONES)
+        self.ftp_client.keepalive_interval = 30
+        self.ftp_client.last_activity = 0
+
+        self.ftp_client.send_keepalive()
+
+        self.assertTrue(self.ftp_client.is_connected())
+        self.assertGreater(self.ftp_client.last_activity, 0)
+        self.assertEqual(self.ftp_client.connections_count, 1)
+
+    def test_keepalive_reopens_lost_session(self):
+        self.ftp_client.write_and_push_temporary_file_to_robot(ZONES)
+        self.ftp_client.get_disconnection()
+        self.ftp_client.keepalive_interval = 30
+        self.ftp_client.last_activity = 0
+
+        self.ftp_client.send_keepalive()
+
+        self.assertTrue(self.ftp_client.is_connected())
+        self.assertEqual(self.ftp_client.reconnections_count, 1)
+
+    def test_keepalive_reopens_session_without_holding_upload_lock(self):
+        self.ftp_client.keepalive_interval = 30
+        lock_available = []
+
+        def open_unreachable_session():
+            # An upload from another thread must get the lock while the keepalive waits for the robot
+            def upload():
+                lock_available.append(self.ftp_client.lock.acquire(timeout=1))
+                self.ftp_client.lock.release()
+
+            upload_thread = threading.Thread(target=upload)
+            upload_thread.start()
+            upload_thread.join()
+            raise ConnectionRefusedError('robot unreachable')
+
+        self.ftp_client.open_session = open_unreachable_session
+        self.ftp_client.send_keepalive()
+
+        self.assertEqual(lock_available, [True])
+        self.assertFalse(self.ftp_client.is_connected())
+
+
+if __name__ == '__main__':
+    unittest.main()
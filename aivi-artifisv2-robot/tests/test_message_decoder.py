@@ -0,0 +1,57 @@
+import json
+import math
+import unittest
+
+from tools.message_decoder import InvalidInputMessage, decode_input_message
+
+
+def get_input_message(**metadata_fields):
+    metadata = {"serial_number": "S1", "trigger_time": "2024-01-01T12:00:00",
+                "seat_info": {"plant_project": "R8", "cover_material": "Tissu", "program_number": "473"}}
+    metadata.update(metadata_fields)
+    return {"metadata": metadata,
+            "models": {"wrinkle_detector": {"succeed": True, "predicted_acceptance_per_zone": {"1": "0"}}},
+            "decisions": {"front_buckle_belt_domain_decision": {"left_buckle": "OK"}}}
+
+
+class TestMessageDecoder(unittest.TestCase):
+    def test_fields_used_by_the_module_extracted(self):
+        decoded_message = decode_input_message(json.dumps(get_input_message()).encode())
+
+        self.assertEqual(decoded_message.serial_number, 'S1')
+        self.assertEqual(decoded_message.time_stamp, '2024-01-01T12:00:00')
+        self.assertEqual(decoded_message.wrinkles_result, {"1": "0"})
+        self.assertTrue(decoded_message.wrinkles_succeed)
+        self.assertEqual(decoded_message.buckle_belt_result, {"left_buckle": "OK"})
+        self.assertEqual(decoded_message.seat_info["plant_project"], 'R8')
+
+    def test_optional_fields_missing(self):
+        message = get_input_message(seat_info=None)
+        del message["decisions"]
+        del message["models"]["wrinkle_detector"]["predicted_acceptance_per_zone"]
+
+        decoded_message = decode_input_message(json.dumps(message).encode())
+
+        self.assertIsNone(decoded_message.buckle_belt_result)
+        self.assertIsNone(decoded_message.wrinkles_result)
+        self.assertIsNone(decoded_message.seat_info)
+
+    def test_non_finite_numbers_accepted(self):
+        decoded_message = decode_input_message(json.dumps(get_input_message(score=float('nan'))).encode())
+
+        self.assertTrue(math.isnan(decoded_message.message["metadata"]["score"]))
+
+    def test_invalid_messages_rejected(self):
+        missing_serial_number = get_input_message()
+        del missing_serial_number["metadata"]["serial_number"]
+        missing_models = get_input_message()
+        del missing_models["models"]
+
+        for body in (b'', b'  [1, 2]', b'{"metadata": ', b'\xff{}', json.dumps(missing_serial_number).encode(),
+                     json.dumps(missing_models).encode()):
+            with self.subTest(body=body), self.assertRaises(InvalidInputMessage):
+                decode_input_message(body)
+
+
+if __name__ == '__main__':
+    unittest.main()
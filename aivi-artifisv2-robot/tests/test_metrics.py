@@ -0,0 +1,36 @@
+import unittest
+
+from prometheus_client import CollectorRegistry, generate_latest
+
+from tools.metrics import CountersCollector
+
+
+class TestCountersCollector(unittest.TestCase):
+    def test_counts_exposed_as_counters_when_scraped(self):
+        counts = {'connections': 1}
+        counters_collector = CountersCollector(['moduleId'], ['robot'])
+        counters_collector.add_counter('robot_ftp_connections', 'FTP sessions', lambda: counts['connections'])
+        registry = CollectorRegistry()
+        registry.register(counters_collector)
+        counts['connections'] = 3
+
+        exposition = generate_latest(registry).decode()
+
+        self.assertIn('# TYPE robot_ftp_connections_total counter', exposition)
+        self.assertIn('robot_ftp_connections_total{moduleId="robot"} 3.0', exposition)
+
+    def test_samples_told_apart_by_extra_labels(self):
+        counters_collector = CountersCollector(['moduleId'], ['robot'])
+        counters_collector.add_counter('robot_uploads', 'Uploads', lambda: 2, {'upload': 'full'})
+        counters_collector.add_counter('robot_uploads', 'Uploads', lambda: 5, {'upload': 'skipped'})
+
+        counter_families = list(counters_collector.collect())
+
+        self.assertEqual(len(counter_families), 1)
+        self.assertEqual([(sample.labels, sample.value) for sample in counter_families[0].samples],
+                         [({'moduleId': 'robot', 'upload': 'full'}, 2),
+                          ({'moduleId': 'robot', 'upload': 'skipped'}, 5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import json
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools.blob_spool import BlobSpool
+from tools.orders_archiver import ORDERS_BATCH_INDEX_SUFFIX, ORDERS_BATCH_SUFFIX, ORDERS_JOURNAL_SUFFIX, \
+    OrdersArchiver
+
+FOLDER = 'raw/FR_P1/STATION1/2024/01/01/'
+
+logger = logging.getLogger('tests')
+
+
+class RecordingUploader:
+    """
+    Stand-in of the blob uploader, keeping the enqueued blobs and their spooled callbacks
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.spooled_callbacks = []
+
+    def enqueue(self, blob_name, data, on_spooled=None):
+        self.blobs[blob_name] = data
+        if on_spooled is not None:
+            self.spooled_callbacks.append(on_spooled)
+        return True
+
+    def spool_all(self):
+        for on_spooled in self.spooled_callbacks:
+            on_spooled()
+        self.spooled_callbacks = []
+
+
+class ContainerClient:
+    def __init__(self):
+        self.blobs = {}
+
+    def upload_blob(self, name, data, overwrite=False):
+        self.blobs[name] = data
+
+
+def get_batch_records(blobs):
+    batch_records = {}
+    for blob_name, data in blobs.items():
+        if blob_name.endswith(ORDERS_BATCH_SUFFIX):
+            index = json.loads(blobs[blob_name[:-len(ORDERS_BATCH_SUFFIX)] + ORDERS_BATCH_INDEX_SUFFIX])
+            for pipeline_id, (offset, length) in index["records"].items():
+                batch_records[pipeline_id] = json.loads(data[offset:offset + length])["orders"]
+    return batch_records
+
+
+class TestOrdersArchiver(unittest.TestCase):
+    def setUp(self):
+        self.journal_folder = tempfile.TemporaryDirectory()
+        self.journal_path = Path(self.journal_folder.name)
+
+    def tearDown(self):
+        self.journal_folder.cleanup()
+
+    def get_journal_paths(self):
+        return sorted(self.journal_path.glob(f'*{ORDERS_JOURNAL_SUFFIX}'))
+
+    def test_seats_gathered_by_folder_and_hour_with_their_index(self):
+        blob_uploader = RecordingUploader()
+        orders_archiver = OrdersArchiver(logger, blob_uploader, 'instance')
+        orders_archiver.archive(FOLDER, 8, 'P1', b'473;S1\r\n')
+        orders_archiver.archive(FOLDER, 8, 'P2', b'473;S2\r\n')
+        orders_archiver.archive(FOLDER, 9, 'P3', b'473;S3\r\n')
+
+        self.assertEqual(orders_archiver.get_pending_count(), 3)
+        orders_archiver.stop()
+
+        self.assertEqual(len(blob_uploader.blobs), 4)
+        self.assertIn(f'{FOLDER}08_instance_000001{ORDERS_BATCH_SUFFIX}', blob_uploader.blobs)
+        self.assertEqual(get_batch_records(blob_uploader.blobs),
+                         {'P1': '473;S1\r\n', 'P2': '473;S2\r\n', 'P3': '473;S3\r\n'})
+
+    def test_batch_uploaded_once_full_or_old(self):
+        blob_uploader = RecordingUploader()
+        orders_archiver = OrdersArchiver(logger, blob_uploader, 'instance', max_batch_bytes=100, max_batch_age=0)
+        orders_archiver.archive(FOLDER, 8, 'P1', b'0' * 100)
+        self.assertEqual(orders_archiver.flushed_batches_count, 1)
+
+        orders_archiver.archive(FOLDER, 8, 'P2', b'473;S2\r\n')
+        orders_archiver.flush()
+        self.assertEqual(orders_archiver.flushed_batches_count, 2)
+        self.assertEqual(orders_archiver.get_pending_count(), 0)
+
+    def test_journal_deleted_once_the_batch_is_spooled(self):
+        blob_uploader = RecordingUploader()
+        orders_archiver = OrdersArchiver(logger, blob_uploader, 'instance', journal_directory=self.journal_path)
+        orders_archiver.archive(FOLDER, 8, 'P1', b'473;S1\r\n')
+        self.assertEqual(len(self.get_journal_paths()), 1)
+
+        orders_archiver.stop()
+        self.assertEqual(len(self.get_journal_paths()), 1)
+
+        blob_uploader.spool_all()
+        self.assertEqual(self.get_journal_paths(), [])
+
+    def test_batches_recovered_from_the_journals_after_a_crash(self):
+        crashed_orders_archiver = OrdersArchiver(logger, RecordingUploader(), 'crashed',
+                                                 journal_directory=self.journal_path)
+        crashed_orders_archiver.archive(FOLDER, 8, 'P1', b'473;S1\r\n')
+        crashed_orders_archiver.archive(FOLDER, 9, 'P2', b'473;S2\r\n')
+        with open(self.get_journal_paths()[-1], 'ab') as journal_file:
+            journal_file.write(b'{"pipeline_id": "P3", "ord')
+
+        blob_uploader = RecordingUploader()
+        orders_archiver = OrdersArchiver(logger, blob_uploader, 'instance', journal_directory=self.journal_path)
+        orders_archiver.start()
+        blob_uploader.spool_all()
+        orders_archiver.stop()
+
+        self.assertEqual(get_batch_records(blob_uploader.blobs), {'P1': '473;S1\r\n', 'P2': '473;S2\r\n'})
+        self.assertEqual(self.get_journal_paths(), [])
+
+    def test_journaled_batches_uploaded_through_the_blob_spool(self):
+        container_client = ContainerClient()
+        blob_spool = BlobSpool(logger, container_client, self.journal_path / 'spool')
+        blob_spool.start()
+        orders_archiver = OrdersArchiver(logger, blob_spool, 'instance', journal_directory=self.journal_path)
+        orders_archiver.start()
+        orders_archiver.archive(FOLDER, 8, 'P1', b'473;S1\r\n')
+
+        orders_archiver.stop(timeout=5)
+        blob_spool.stop(timeout=5)
+
+        self.assertEqual(get_batch_records(container_client.blobs), {'P1': '473;S1\r\n'})
+        self.assertEqual(self.get_journal_paths(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
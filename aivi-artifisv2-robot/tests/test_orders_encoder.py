@@ -0,0 +1,33 @@
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools.file import write_list_to_csv_file
+from tools.orders_encoder import encode_orders
+
+logger = logging.getLogger('tests')
+
+# The zone rows of the default parameters have one field more than the header row
+ZONES = [['473', 'S1', None, None, None, None, None, None, None, None, None],
+         [3, 0, 'BL', 1.5, '10', '1', '20', '0', '0', '50', '0', '0'],
+         [7, 1, 'CM, left', 2.0, '10', '1', '20', '0', '0', '50', '0', '0']]
+
+
+class TestEncodeOrders(unittest.TestCase):
+    def test_orders_encoded_as_csv_rows(self):
+        self.assertEqual(encode_orders(ZONES),
+                         b'473,S1,,,,,,,,,\r\n'
+                         b'3,0,BL,1.5,10,1,20,0,0,50,0,0\r\n'
+                         b'7,1,"CM, left",2.0,10,1,20,0,0,50,0,0\r\n')
+
+    def test_mounting_mode_file_identical_to_encoded_orders(self):
+        with tempfile.TemporaryDirectory() as orders_folder:
+            orders_file_path = Path(orders_folder) / 'orders.csv'
+
+            self.assertEqual(write_list_to_csv_file(logger, ZONES, orders_file_path), 'OK')
+            self.assertEqual(orders_file_path.read_bytes(), encode_orders(ZONES))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import unittest
+from unittest import mock
+
+from tools import output_encoder
+from tools.output_encoder import COMPACT_OUTPUT_FORMAT, FULL_OUTPUT_FORMAT, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, \
+    MSGPACK_OUTPUT_FORMAT, decode_output_message, encode_decision_message, get_available_output_format, \
+    get_columnar_sequence_record, get_output_pipeline_id
+
+MESSAGE = {"metadata": {"pipeline_id": "STATION1_S1", "serial_number": "S1"}, "models": {}}
+ROBOT_DECISION = {"steaming_robot": {"steaming": True, "upload_ftp": True,
+                                     "steaming_sequence_record": [{"zone": 1, "time": 1.5},
+                                                                  {"zone": 2, "time": 2.0, "skipped": True}]}}
+
+
+class TestOutputEncoder(unittest.TestCase):
+    def test_sequence_record_turned_into_columns(self):
+        self.assertEqual(get_columnar_sequence_record(ROBOT_DECISION["steaming_robot"]["steaming_sequence_record"]),
+                         {"zone": [1, 2], "time": [1.5, 2.0], "skipped": [None, True]})
+
+    def test_compact_output_decoded_back(self):
+        encoded_output = encode_decision_message(MESSAGE, ROBOT_DECISION, COMPACT_OUTPUT_FORMAT)
+
+        decoded_output = decode_output_message(encoded_output.body, encoded_output.content_type)
+
+        self.assertEqual(encoded_output.content_type, JSON_CONTENT_TYPE)
+        self.assertEqual(decoded_output["serial_number"], 'S1')
+        self.assertEqual(decoded_output["decisions"]["steaming_robot"]["steaming_sequence_record"]["zone"], [1, 2])
+        self.assertEqual(len(ROBOT_DECISION["steaming_robot"]["steaming_sequence_record"]), 2)
+
+    def test_pipeline_id_found_in_full_and_compact_outputs(self):
+        compact_output = json.loads(encode_decision_message(MESSAGE, ROBOT_DECISION, COMPACT_OUTPUT_FORMAT).body)
+
+        self.assertEqual(get_output_pipeline_id(dict(MESSAGE, robot_decision=ROBOT_DECISION)), 'STATION1_S1')
+        self.assertEqual(get_output_pipeline_id(compact_output), 'STATION1_S1')
+        self.assertIsNone(get_output_pipeline_id({}))
+
+    def test_unknown_output_format_replaced_by_the_default_one(self):
+        self.assertEqual(get_available_output_format('xml', FULL_OUTPUT_FORMAT), FULL_OUTPUT_FORMAT)
+        self.assertEqual(get_available_output_format(None, COMPACT_OUTPUT_FORMAT), COMPACT_OUTPUT_FORMAT)
+
+    def test_msgpack_output_replaced_by_compact_json_without_msgpack(self):
+        with mock.patch.object(output_encoder, 'msgpack', None):
+            self.assertEqual(get_available_output_format(MSGPACK_OUTPUT_FORMAT, FULL_OUTPUT_FORMAT),
+                             COMPACT_OUTPUT_FORMAT)
+            with self.assertRaises(ValueError):
+                decode_output_message(b'\x80', MSGPACK_CONTENT_TYPE)
+
+    @unittest.skipIf(output_encoder.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_output_decoded_back(self):
+        encoded_output = encode_decision_message(MESSAGE, ROBOT_DECISION, MSGPACK_OUTPUT_FORMAT)
+
+        self.assertEqual(encoded_output.content_type, MSGPACK_CONTENT_TYPE)
+        self.assertEqual(get_output_pipeline_id(decode_output_message(encoded_output.body,
+                                                                      encoded_output.content_type)), 'STATION1_S1')
+
+
+if __name__ == '__main__':
+    unittest.main()
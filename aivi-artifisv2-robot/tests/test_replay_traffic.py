@@ -0,0 +1,89 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from tools.output_encoder import COMPACT_OUTPUT_FORMAT, JSON_CONTENT_TYPE, encode_decision_message
+from tools.replay_traffic import FIXED_RATE_MODE, MAX_SPEED_MODE, ORIGINAL_TIMING_MODE, OutputCollector, \
+    generate_seats, get_percentile, get_send_delays, read_recorded_messages
+
+RUN_ID = '20240101-120000'
+
+
+def get_recorded_message(trigger_time: str):
+    return {"metadata": {"trigger_time": trigger_time, "serial_number": "S1", "pipeline_id": "P1",
+                         "station_info": {"station_full_id": "STATION1"}}}
+
+
+class TestReplayTraffic(unittest.TestCase):
+    def test_recorded_messages_read_from_json_and_json_lines_files(self):
+        with tempfile.TemporaryDirectory() as recording_folder:
+            recording_path = Path(recording_folder)
+            (recording_path / 'a.json').write_text(json.dumps({"seat": 1}))
+            (recording_path / 'b.jsonl').write_text(f'{json.dumps({"seat": 2})}\n\n{json.dumps({"seat": 3})}\n')
+
+            self.assertEqual(read_recorded_messages([recording_path]), [{"seat": 1}, {"seat": 2}, {"seat": 3}])
+
+    def test_send_delays_of_each_mode(self):
+        recorded_messages = [get_recorded_message('2024-01-01T12:00:00'), get_recorded_message('2024-01-01T12:00:02')]
+
+        self.assertEqual(get_send_delays(recorded_messages, 3, MAX_SPEED_MODE, 10, 1), [0.0, 0.0, 0.0])
+        self.assertEqual(get_send_delays(recorded_messages, 3, FIXED_RATE_MODE, 10, 1), [0.0, 0.1, 0.2])
+        self.assertEqual(get_send_delays(recorded_messages, 4, ORIGINAL_TIMING_MODE, 10, 2), [0.0, 1.0, 2.0, 3.0])
+
+    def test_original_timing_needs_trigger_times(self):
+        with self.assertRaises(ValueError):
+            get_send_delays([get_recorded_message('2024-01-01T12:00:00'), {"metadata": {}}], 2,
+                            ORIGINAL_TIMING_MODE, 10, 1)
+
+    def test_generated_seats_get_their_own_ids_and_station(self):
+        recorded_message = get_recorded_message('2024-01-01T12:00:00')
+
+        seats = list(generate_seats([recorded_message], 3, 2, RUN_ID))
+
+        self.assertEqual([seat["metadata"]["station_info"]["station_full_id"] for seat in seats],
+                         ['REPLAYSTATION1', 'REPLAYSTATION2', 'REPLAYSTATION1'])
+        self.assertEqual(len({seat["metadata"]["pipeline_id"] for seat in seats}), 3)
+        self.assertTrue(all(seat["metadata"]["pipeline_id"].endswith(RUN_ID) for seat in seats))
+        self.assertEqual(recorded_message["metadata"]["pipeline_id"], 'P1')
+
+    def test_percentile(self):
+        self.assertEqual(get_percentile([1.0, 2.0, 3.0, 4.0, 5.0], 50), 3.0)
+        self.assertEqual(get_percentile([1.0, 2.0, 3.0, 4.0, 5.0], 99), 5.0)
+
+
+class TestOutputCollector(unittest.TestCase):
+    def setUp(self):
+        # the collector is built without its AMQP connection, only its message callback is tested
+        self.output_collector = OutputCollector.__new__(OutputCollector)
+        self.output_collector.run_id = RUN_ID
+        self.output_collector.arrival_times = {}
+        self.output_collector.undecodable_count = 0
+        self.output_collector.lock = threading.Lock()
+
+    def receive(self, body: bytes, content_type=JSON_CONTENT_TYPE):
+        self.output_collector.on_output_message(None, None, SimpleNamespace(content_type=content_type), body)
+
+    def test_replayed_seats_recorded_once_whatever_the_output_format(self):
+        full_output = {"metadata": {"pipeline_id": f'STATION1_R0000000_{RUN_ID}'}}
+        compact_output = encode_decision_message({"metadata": {"pipeline_id": f'STATION1_R0000001_{RUN_ID}'}}, {},
+                                                 COMPACT_OUTPUT_FORMAT)
+
+        self.receive(json.dumps(full_output).encode())
+        self.receive(json.dumps(full_output).encode())
+        self.receive(compact_output.body, compact_output.content_type)
+
+        self.assertEqual(self.output_collector.get_received_count(), 2)
+
+    def test_other_outputs_ignored_and_undecodable_counted(self):
+        self.receive(json.dumps({"metadata": {"pipeline_id": 'STATION1_R0000000_other-run'}}).encode())
+        self.receive(b'not json')
+
+        self.assertEqual(self.output_collector.get_received_count(), 0)
+        self.assertEqual(self.output_collector.undecodable_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import logging
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from tools.station_dispatcher import StationDispatcher, get_station_table
+
+logger = logging.getLogger('tests')
+
+
+class TestStationDispatcher(unittest.TestCase):
+    def test_table_stations_get_their_own_executor(self):
+        station_ids = [f'STATION{station_number}' for station_number in range(1, 7)]
+        station_dispatcher = StationDispatcher(logger, 6, station_ids)
+        try:
+            executors = {id(station_dispatcher.get_executor(station_id)) for station_id in station_ids}
+            self.assertEqual(len(executors), 6)
+        finally:
+            station_dispatcher.stop()
+
+    def test_unknown_station_always_sent_to_the_same_executor(self):
+        station_dispatcher = StationDispatcher(logger, 4, ['STATION1'])
+        try:
+            self.assertIs(station_dispatcher.get_executor('UNKNOWN'), station_dispatcher.get_executor('UNKNOWN'))
+        finally:
+            station_dispatcher.stop()
+
+    def test_seats_of_a_station_kept_in_arrival_order(self):
+        station_dispatcher = StationDispatcher(logger, 2, ['STATION1', 'STATION2'])
+        processed_seats = {'STATION1': [], 'STATION2': []}
+
+        def process_seat(station_id, seat_number):
+            time.sleep(0.001 * (seat_number % 3))
+            processed_seats[station_id].append(seat_number)
+
+        for seat_number in range(20):
+            for station_id in processed_seats:
+                station_dispatcher.submit(station_id, process_seat, station_id, seat_number)
+        station_dispatcher.stop()
+
+        self.assertEqual(processed_seats, {'STATION1': list(range(20)), 'STATION2': list(range(20))})
+
+    def test_stations_processed_in_parallel(self):
+        station_dispatcher = StationDispatcher(logger, 2, ['STATION1', 'STATION2'])
+        both_stations_running = threading.Barrier(2, timeout=5)
+
+        station_dispatcher.submit('STATION1', both_stations_running.wait)
+        future = station_dispatcher.submit('STATION2', both_stations_running.wait)
+        station_dispatcher.stop()
+
+        self.assertFalse(both_stations_running.broken)
+        self.assertIsNotNone(future.result())
+
+    def test_failed_seat_does_not_stop_the_station(self):
+        station_dispatcher = StationDispatcher(logger, 1, ['STATION1'])
+
+        station_dispatcher.submit('STATION1', lambda: 1 / 0)
+        future = station_dispatcher.submit('STATION1', lambda: 'processed')
+        station_dispatcher.stop()
+
+        self.assertEqual(future.result(), 'processed')
+
+
+class TestStationTable(unittest.TestCase):
+    def test_station_table_read_with_defaults(self):
+        with tempfile.TemporaryDirectory() as table_folder:
+            station_table_file_path = Path(table_folder) / 'stations.csv'
+            station_table_file_path.write_text(
+                'station_full_id, robot_ip_address, robot_port, ftp_user, ftp_password, server_output_directory, '
+                'configuration_directory\n'
+                'STATION1, 10.0.0.1, 2121, user, password, Station1_Output, /configuration/station1\n'
+                'STATION2, 10.0.0.2, , user, password, , \n')
+
+            station_table = get_station_table(station_table_file_path, 'Aivi_Output')
+
+        self.assertEqual(list(station_table), ['STATION1', 'STATION2'])
+        self.assertEqual(station_table['STATION1'].robot_port, 2121)
+        self.assertEqual(station_table['STATION1'].server_output_directory, 'Station1_Output')
+        self.assertEqual(station_table['STATION1'].configuration_directory, '/configuration/station1')
+        self.assertEqual(station_table['STATION2'].robot_port, 21)
+        self.assertEqual(station_table['STATION2'].server_output_directory, 'Aivi_Output')
+        self.assertIsNone(station_table['STATION2'].configuration_directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
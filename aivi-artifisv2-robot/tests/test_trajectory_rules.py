@@ -0,0 +1,119 @@
+import unittest
+from unittest import mock
+
+from tools.artifis_file_reader import SeatProfile, SeatTypeMaterialKey, TransitionTimeTable, ZoneDescriptorValue
+from tools.route_optimizer import optimize_route
+from tools.trajectory_rules import PLANNERS, PlannerComparison, TrajectoryRules, ZonePredictionProps
+
+PLANT_PROJECT = 'P0'
+COVER_MATERIAL = 'Tissu'
+
+
+def create_transition_time_table(transition_times: dict) -> TransitionTimeTable:
+    transition_points = sorted({transition_point for transition in transition_times for transition_point in transition})
+    transition_time_table = TransitionTimeTable(transition_points, transition_points, transition_points)
+    for (from_point, to_point), transition_time in transition_times.items():
+        transition_time_table.set_time(transition_time_table.get_index(from_point),
+                                       transition_time_table.get_index(to_point), transition_time)
+    return transition_time_table
+
+
+def create_trajectory_rules(zone_transition_points: dict, transition_time_table: TransitionTimeTable) \
+        -> TrajectoryRules:
+    descriptors = {}
+    for zone_number, transition_point in zone_transition_points.items():
+        descriptor = ZoneDescriptorValue(1.0, 1, transition_point, '10', '1', '20', '0', '0', '50', '0', '0', '50')
+        descriptor.transition_point_index = transition_time_table.get_index(transition_point)
+        descriptors[(zone_number, 0)] = descriptor
+    seat_profile = SeatProfile(PLANT_PROJECT, COVER_MATERIAL,
+                               {zone_number: rank for rank, zone_number in enumerate(zone_transition_points)},
+                               descriptors)
+    return TrajectoryRules({SeatTypeMaterialKey(PLANT_PROJECT, COVER_MATERIAL): seat_profile}, PLANT_PROJECT, 1,
+                           COVER_MATERIAL)
+
+
+class TestOptimizeRoute(unittest.TestCase):
+    @mock.patch('tools.route_optimizer.search_nearest_neighbour_route', side_effect=AssertionError)
+    def test_eleven_transition_points_ordered_by_exact_search(self, _):
+        # going to the nearest point first, P1, leads to the far P11 at the end
+        points = [f'P{point_number}' for point_number in range(1, 12)]
+        transition_times = {(from_point, to_point): 10.0 for from_point in ['HOME'] + points for to_point in points}
+        transition_times.update({('HOME', 'P1'): 1.0, ('HOME', 'P2'): 2.0})
+        for point_number in range(2, 11):
+            transition_times[(f'P{point_number}', f'P{point_number + 1}')] = 1.0
+        transition_times[('P11', 'P1')] = 1.0
+        transition_times[('P1', 'P11')] = 1.0
+        transition_time_table = create_transition_time_table(transition_times)
+
+        route = optimize_route([transition_time_table.get_index(point) for point in points], transition_time_table,
+                               transition_time_table.get_index('HOME'), [])
+
+        self.assertEqual([points[zone_index] for zone_index in route],
+                         ['P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10', 'P11', 'P1'])
+
+
+class TestOptimizeZonesRoute(unittest.TestCase):
+    def test_route_forced_by_precedences_fits_in_cycle_time(self):
+        # zone 1 then zone 2 takes 4s, the precedence forces zone 2 then zone 1 which takes 6s
+        transition_time_table = create_transition_time_table({
+            ('HOME', 'A'): 1.0, ('HOME', 'B'): 2.0, ('A', 'B'): 1.0, ('B', 'A'): 2.0,
+            ('A', 'A'): 0.0, ('B', 'B'): 0.0})
+        trajectory_rules = create_trajectory_rules({1: 'A', 2: 'B'}, transition_time_table)
+        zones = [ZonePredictionProps(1, 0), ZonePredictionProps(2, 0)]
+
+        selected_zones, _, working_time = trajectory_rules.select_zones_according_to_time(
+            zones, transition_time_table, 5, 'HOME', 0)
+        self.assertEqual(selected_zones, zones)
+        self.assertEqual(working_time, 4.0)
+
+        route, steaming_sequence_record, working_time = trajectory_rules.optimize_zones_route(
+            selected_zones, zones, transition_time_table, 5, 'HOME', 0, [(2, 1)])
+
+        self.assertEqual(route, [ZonePredictionProps(2, 0)])
+        self.assertEqual([record['input_zone'] for record in steaming_sequence_record], [2])
+        self.assertEqual(working_time, 3.0)
+
+
+class TestOptimalPlanner(unittest.TestCase):
+    def test_working_time_compared_with_the_greedy_plan(self):
+        # zone 2 does not fit, the greedy planner stops there while the optimal planner also takes zone 3
+        transition_time_table = create_transition_time_table({('HOME', 'A'): 0.0, ('A', 'A'): 0.0})
+        trajectory_rules = create_trajectory_rules({1: 'A', 2: 'A', 3: 'A'}, transition_time_table)
+        trajectory_rules.seat_profile.descriptors[(2, 0)].cost = 10.0
+        zones = [ZonePredictionProps(1, 0), ZonePredictionProps(2, 0), ZonePredictionProps(3, 0)]
+
+        selected_zones, _, working_time = trajectory_rules.select_zones_optimally_according_to_time(
+            zones, transition_time_table, 5, 'HOME', 0)
+
+        self.assertEqual(selected_zones, [zones[0], zones[2]])
+        self.assertEqual(working_time, 2.0)
+        self.assertEqual(trajectory_rules.planner_comparison, PlannerComparison(1.0, 2.0, 5))
+
+
+class TestUnknownPreviousTransitionPoint(unittest.TestCase):
+    def test_seat_without_zones_to_steam_gets_an_empty_plan(self):
+        transition_time_table = create_transition_time_table({('HOME', 'A'): 1.0, ('A', 'A'): 0.0})
+        trajectory_rules = create_trajectory_rules({1: 'A'}, transition_time_table)
+
+        for planner in PLANNERS:
+            with self.subTest(planner=planner):
+                abb_format_zones, steaming_sequence_record, working_time = \
+                    trajectory_rules.define_zones_to_steam_in_abb_format_according_to_available_time(
+                        {'1': '3'}, transition_time_table, 5, 'UNKNOWN', 0, 'S1', '473', planner=planner,
+                        route_optimization=True)
+
+                self.assertEqual(abb_format_zones, [['473', 'S1'] + [None] * 9])
+                self.assertEqual(steaming_sequence_record, [])
+                self.assertEqual(working_time, 0)
+
+    def test_seat_with_zones_to_steam_fails(self):
+        transition_time_table = create_transition_time_table({('HOME', 'A'): 1.0, ('A', 'A'): 0.0})
+        trajectory_rules = create_trajectory_rules({1: 'A'}, transition_time_table)
+
+        with self.assertRaises(KeyError):
+            trajectory_rules.define_zones_to_steam_in_abb_format_according_to_available_time(
+                {'1': '0'}, transition_time_table, 5, 'UNKNOWN', 0, 'S1', '473')
+
+
+if __name__ == '__main__':
+    unittest.main()
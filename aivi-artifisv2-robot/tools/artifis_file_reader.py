@@ -1,68 +1,62 @@
 import logging
+import math
+from array import array
 from collections import namedtuple
 from itertools import islice
 from pathlib import Path
-from typing import Dict, List
+from types import MappingProxyType
+from typing import Dict, Iterable, Optional, Sequence, Tuple
 from tools.file import read_resource_csv
 
-TRANSITION_POINT_INDEX = 7
 START_POSITION_INDEX = 0
 ARRIVAL_POSITION_INDEX = 1
 
 ZoneDescriptorKey = namedtuple('ZoneDescriptorKey', ['plant_project', 'zone_number', 'acceptance', 'cover_material'])
-ZoneDescriptorValue = namedtuple('ZoneDescriptorValue', ['time',
-                                                         'input_offset_x',
-                                                         'input_offset_y',
-                                                         'input_offset_z',
-                                                         'output_offset_x',
-                                                         'output_offset_y',
-                                                         'output_offset_z',
-                                                         'transition_point',
-                                                         'steam',
-                                                         'speed',
-                                                         'trajectory_occurence',
-                                                         'pressure'])
-
 SeatTypeMaterialKey = namedtuple('SeatTypeMaterialKey', ['plant_project', 'cover_material'])
 PriorityValue = namedtuple('PriorityValue', ['program_number', 'bypass_wrinkliness_8_9', 'priority'])
+SeatProfile = namedtuple('SeatProfile', ['plant_project', 'cover_material', 'zone_ranks', 'descriptors'])
 
 TransitionDescriptor = namedtuple('StreamerPositionTransition', ['from_position', 'to_position'])
 
 
-def check_transition_points_zone_time_mapping_and_transition_time(
-        zone_time_mapping: Dict[ZoneDescriptorKey, ZoneDescriptorValue],
-        transition_time: Dict[TransitionDescriptor, float]) -> bool:
-    check = False
-    transition_points_from_zone_time_mapping = []
-
-    for key, value in zone_time_mapping.items():
-        transition_points_from_zone_time_mapping.append(value[TRANSITION_POINT_INDEX])
-
-    lines_of_transition_points_from_transition_time = []
-    columns_of_transition_points_from_transition_time = []
+class ZoneDescriptorValue:
+    """
+    Zone time mapping row, parsed once at load time.
 
-    for key, value in transition_time.items():
-        lines_of_transition_points_from_transition_time.append(key[START_POSITION_INDEX])
-        columns_of_transition_points_from_transition_time.append(key[ARRIVAL_POSITION_INDEX])
+    The steaming time and the occurrences are numbers and their product is the cost of the zone. The transition
+    point is interned to its index in the transition time table when the configuration is compiled. The ABB
+    parameters are kept as written in the file, in orders file order, so that the order rows are built by
+    prepending the order and zone numbers.
+    """
+    __slots__ = ('time', 'trajectory_occurence', 'cost', 'transition_point', 'transition_point_index',
+                 'abb_parameters')
 
-    set_from_lines_of_transition_points = set(lines_of_transition_points_from_transition_time)
-    set_from_zone_transition_points = set(transition_points_from_zone_time_mapping)
-    diff_sets_lines_and_zone = set_from_zone_transition_points.difference(set_from_lines_of_transition_points)
-    diff_lines = len(diff_sets_lines_and_zone)
+    def __init__(self, time: float, trajectory_occurence: int, transition_point: str, speed: str, steam: str,
+                 pressure: str, input_offset_x: str, input_offset_y: str, input_offset_z: str, output_offset_x: str,
+                 output_offset_y: str, output_offset_z: str):
+        self.time = time
+        self.trajectory_occurence = trajectory_occurence
+        self.cost = time * trajectory_occurence
+        self.transition_point = transition_point
+        self.transition_point_index: Optional[int] = None
+        self.abb_parameters = (speed, steam, pressure, input_offset_x, input_offset_y, input_offset_z,
+                               output_offset_x, output_offset_y, output_offset_z)
 
-    set_from_columns_of_transition_points = set(columns_of_transition_points_from_transition_time)
-    diff_sets_columns_and_zone = set_from_zone_transition_points.difference(set_from_columns_of_transition_points)
-    diff_columns = len(diff_sets_columns_and_zone)
+    def __repr__(self) -> str:
+        return f'ZoneDescriptorValue(time={self.time}, trajectory_occurence={self.trajectory_occurence}, ' \
+               f'transition_point={self.transition_point!r}, abb_parameters={self.abb_parameters})'
 
-    if diff_lines == 0 and diff_columns == 0:
-        check = True
 
-    return bool(check)
+def check_transition_points_zone_time_mapping_and_transition_time(
+        zone_time_mapping: Dict[ZoneDescriptorKey, ZoneDescriptorValue],
+        transition_time: 'TransitionTimeTable') -> bool:
+    transition_points_from_zone_time_mapping = {value.transition_point for value in zone_time_mapping.values()}
+    return transition_points_from_zone_time_mapping <= transition_time.origin_points and \
+        transition_points_from_zone_time_mapping <= transition_time.destination_points
 
 
-def get_zone_time_mapping_and_zones_per_seat_type(time_zone_mapping_file_path: Path) -> tuple:
+def get_zone_time_mapping_and_seat_profiles(time_zone_mapping_file_path: Path) -> tuple:
     zone_time_mapping: Dict[ZoneDescriptorKey, ZoneDescriptorValue] = {}
-    zones_per_seat_type: Dict[str, List] = {}
 
     time_zone_mapping_file_content = read_resource_csv(time_zone_mapping_file_path)
 
@@ -74,43 +68,106 @@ def get_zone_time_mapping_and_zones_per_seat_type(time_zone_mapping_file_path: P
         if key in zone_time_mapping:
             logging.warning(f'Key "{key}" already in sheet')
         else:
-            zone_time_mapping[key] = ZoneDescriptorValue(row['time'],
-                                                         row['input_offset_x'],
-                                                         row['input_offset_y'],
-                                                         row['input_offset_z'],
-                                                         row['output_offset_x'],
-                                                         row['output_offset_y'],
-                                                         row['output_offset_z'],
-                                                         row['transition_point'],
-                                                         row['steam'],
-                                                         row['speed'],
-                                                         row['trajectory_occurence'],
-                                                         row['pressure'])
-
-        key_seat_type = row['plant_project']
-        value_zone_number = row['zone_number']
-        if key_seat_type not in zones_per_seat_type:
-            zones_per_seat_type[key_seat_type] = [value_zone_number]
-        else:
-            zones_per_seat_type[key_seat_type].append(value_zone_number)
-
-    return zone_time_mapping, zones_per_seat_type
-
-
-def get_transition_time(transition_time_table: Path) -> Dict[TransitionDescriptor, float]:
-    transition_time: Dict[TransitionDescriptor, float] = {}
-
-    transition_time_table_content = read_resource_csv(transition_time_table)
-    for row in transition_time_table_content:
-        current_position_key = list(row.keys())[0]
-        current_transition_point = row[current_position_key]
-        for transition, time in islice(row.items(), 1, None):
-            current_destination_transition_key = TransitionDescriptor(current_transition_point, transition)
+            zone_time_mapping[key] = ZoneDescriptorValue(time=float(row['time']),
+                                                         trajectory_occurence=int(row['trajectory_occurence']),
+                                                         transition_point=row['transition_point'],
+                                                         speed=row['speed'],
+                                                         steam=row['steam'],
+                                                         pressure=row['pressure'],
+                                                         input_offset_x=row['input_offset_x'],
+                                                         input_offset_y=row['input_offset_y'],
+                                                         input_offset_z=row['input_offset_z'],
+                                                         output_offset_x=row['output_offset_x'],
+                                                         output_offset_y=row['output_offset_y'],
+                                                         output_offset_z=row['output_offset_z'])
+
+    return zone_time_mapping, compile_seat_profiles(zone_time_mapping)
+
+
+def compile_seat_profiles(zone_time_mapping: Dict[ZoneDescriptorKey, ZoneDescriptorValue]) \
+        -> Dict[SeatTypeMaterialKey, SeatProfile]:
+    """
+    Group the zone time mapping per (plant_project, cover_material).
+
+    The priority rank of a zone is the position of its first row in the zone time mapping file, the descriptors are
+    indexed by (zone_number, acceptance).
+    """
+    zone_ranks_per_seat_type: Dict[SeatTypeMaterialKey, Dict[int, int]] = {}
+    descriptors_per_seat_type: Dict[SeatTypeMaterialKey, Dict[Tuple[int, int], ZoneDescriptorValue]] = {}
 
+    for key, value in zone_time_mapping.items():
+        seat_type_key = SeatTypeMaterialKey(key.plant_project, key.cover_material)
+        zone_ranks = zone_ranks_per_seat_type.setdefault(seat_type_key, {})
+        zone_ranks.setdefault(key.zone_number, len(zone_ranks))
+        descriptors_per_seat_type.setdefault(seat_type_key, {})[(key.zone_number, key.acceptance)] = value
+
+    return {seat_type_key: SeatProfile(seat_type_key.plant_project,
+                                       seat_type_key.cover_material,
+                                       MappingProxyType(zone_ranks),
+                                       MappingProxyType(descriptors_per_seat_type[seat_type_key]))
+            for seat_type_key, zone_ranks in zone_ranks_per_seat_type.items()}
+
+
+class TransitionTimeTable:
+    """
+    Transition times between transition points.
+
+    The transition points are interned to small integers at load time and the times are stored in a dense row-major
+    array, so that the planners look them up by index. A transition missing from the file has no value and its
+    lookup raises a KeyError, as for a dict.
+    """
+    __slots__ = ('transition_points', 'indexes', 'size', 'times', 'origin_points', 'destination_points')
+
+    def __init__(self, transition_points: Sequence[str], origin_points: Iterable[str] = (),
+                 destination_points: Iterable[str] = ()):
+        self.transition_points = tuple(transition_points)
+        self.indexes = {transition_point: index for index, transition_point in enumerate(self.transition_points)}
+        self.size = len(self.transition_points)
+        self.times = array('d', [math.nan]) * (self.size * self.size)
+        self.origin_points = frozenset(origin_points)
+        self.destination_points = frozenset(destination_points)
+
+    def get_index(self, transition_point: str) -> int:
+        return self.indexes[transition_point]
+
+    def set_time(self, from_index: int, to_index: int, transition_time: float) -> None:
+        self.times[from_index * self.size + to_index] = transition_time
+
+    def get_time(self, from_index: int, to_index: int) -> float:
+        transition_time = self.times[from_index * self.size + to_index]
+        if transition_time != transition_time:
+            raise KeyError(TransitionDescriptor(self.transition_points[from_index], self.transition_points[to_index]))
+        return transition_time
+
+    def __getitem__(self, transition: TransitionDescriptor) -> float:
+        return self.get_time(self.indexes[transition.from_position], self.indexes[transition.to_position])
+
+
+def get_transition_time(transition_time_table: Path, zone_transition_points: Iterable[str] = ()) \
+        -> TransitionTimeTable:
+    """
+    Load the transition time table. The zone transition points missing from the file are interned too, without
+    transition time, so that every zone gets an index and an unknown transition fails at lookup as before.
+    """
+    rows = list(read_resource_csv(transition_time_table))
+    origin_points = [row[next(iter(row))] for row in rows]
+    destination_points = list(islice(rows[0], 1, None)) if rows else []
+    transition_points = list(dict.fromkeys(origin_points + destination_points + list(zone_transition_points)))
+    transition_time = TransitionTimeTable(transition_points, origin_points, destination_points)
+
+    for row, origin_point in zip(rows, origin_points):
+        from_index = transition_time.get_index(origin_point)
+        for destination_point, time in islice(row.items(), 1, None):
             try:
-                transition_time[current_destination_transition_key] = float(time)
+                transition_time.set_time(from_index, transition_time.get_index(destination_point), float(time))
 
             except ValueError:
                 logging.error(f'Value "{time}" is not a valid transition time value')
 
     return transition_time
+
+
+def intern_zone_transition_points(zone_time_mapping: Dict[ZoneDescriptorKey, ZoneDescriptorValue],
+                                  transition_time: TransitionTimeTable) -> None:
+    for value in zone_time_mapping.values():
+        value.transition_point_index = transition_time.get_index(value.transition_point)
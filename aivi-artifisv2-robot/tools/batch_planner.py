@@ -0,0 +1,185 @@
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from tools.artifis_file_reader import SeatProfile, TransitionTimeTable
+
+MISSING_ACCEPTANCE = int(np.iinfo(np.int64).max)
+
+BatchPlan = namedtuple('BatchPlan', ['acceptances',
+                                     'selected',
+                                     'transition_times',
+                                     'selected_zones_counts',
+                                     'working_times',
+                                     'failed',
+                                     'previous_transition_point'])
+
+
+class BatchPlanner:
+    """
+    Greedy planning of many seats of the same seat profile at once, for offline analytics.
+
+    A seat is a row of a (seats x zones) matrix of acceptances, the zones being in priority order. The greedy
+    planner keeps a prefix of the zones to steam, so the plans are computed with one cumulative sum of the zone costs
+    and transition times per seat, and masks. The plans, working times and ABB rows are the ones of
+    TrajectoryRules.select_zones_according_to_time and change_zones_to_abb_format; the optimal planner and the route
+    optimization are not available in batch.
+    """
+
+    def __init__(self, seat_profile: Optional[SeatProfile], transition_time_table: TransitionTimeTable,
+                 acceptance_threshold: int):
+        self.seat_profile = seat_profile
+        self.transition_time_table = transition_time_table
+        self.acceptance_threshold = acceptance_threshold
+
+        zone_ranks = seat_profile.zone_ranks if seat_profile is not None else {}
+        descriptors = seat_profile.descriptors if seat_profile is not None else {}
+        self.zone_numbers = sorted(zone_ranks, key=zone_ranks.get)
+        self.zone_ranks = dict(zone_ranks)
+
+        acceptances_count = max((acceptance for _, acceptance in descriptors), default=0) + 1
+        self.known_descriptors = np.zeros((len(self.zone_numbers), acceptances_count), dtype=bool)
+        self.zone_costs = np.zeros((len(self.zone_numbers), acceptances_count))
+        self.zone_transition_points = np.zeros((len(self.zone_numbers), acceptances_count), dtype=np.int64)
+        for (zone_number, acceptance), descriptor in descriptors.items():
+            if acceptance < 0 or descriptor.transition_point_index is None:
+                continue
+            rank = zone_ranks[zone_number]
+            self.known_descriptors[rank, acceptance] = True
+            self.zone_costs[rank, acceptance] = descriptor.cost
+            self.zone_transition_points[rank, acceptance] = descriptor.transition_point_index
+
+        self.transition_times = np.frombuffer(transition_time_table.times, dtype=np.float64)
+
+    def get_acceptances(self, predicted_wrinkles_list: Sequence[Dict]) -> np.ndarray:
+        """
+        (seats x zones) matrix of the predicted acceptances, MISSING_ACCEPTANCE for the zones not predicted
+        """
+        zone_ranks = self.zone_ranks
+        predicted_zone_ranks = {}
+        missing_acceptances = [MISSING_ACCEPTANCE] * len(self.zone_numbers)
+        acceptances = []
+        for predicted_wrinkles in predicted_wrinkles_list:
+            seat_acceptances = list(missing_acceptances)
+            for predicted_zone, acceptance in predicted_wrinkles.items():
+                try:
+                    rank = predicted_zone_ranks[predicted_zone]
+                except KeyError:
+                    rank = predicted_zone_ranks[predicted_zone] = zone_ranks.get(int(predicted_zone))
+                if rank is not None:
+                    seat_acceptances[rank] = int(acceptance)
+            acceptances.append(seat_acceptances)
+        return np.array(acceptances, dtype=np.int64).reshape(len(predicted_wrinkles_list), len(self.zone_numbers))
+
+    def plan(self, predicted_wrinkles_list: Sequence[Dict], cycle_time: float, previous_transition_point: str,
+             cumulated_time: float) -> BatchPlan:
+        """
+        Plan every seat with the greedy planner.
+
+        A seat is failed when its per-seat planning would raise, because a zone to steam has no descriptor for its
+        acceptance or a transition time is missing.
+
+        :raise KeyError: when the previous transition point is not in the transition time table
+        """
+        return self.plan_acceptances(self.get_acceptances(predicted_wrinkles_list), cycle_time,
+                                     previous_transition_point, cumulated_time)
+
+    def plan_acceptances(self, acceptances: np.ndarray, cycle_time: float, previous_transition_point: str,
+                         cumulated_time: float) -> BatchPlan:
+        """
+        Plan the seats of a (seats x zones) acceptances matrix, the zones being in zone_numbers order
+        """
+        start_transition_point = self.transition_time_table.get_index(previous_transition_point)
+        seats_count, zones_count = acceptances.shape
+        zone_positions = np.arange(zones_count)
+
+        candidates = acceptances <= self.acceptance_threshold
+        descriptor_acceptances = np.clip(acceptances, 0, self.known_descriptors.shape[1] - 1)
+        known = candidates & (acceptances == descriptor_acceptances) & \
+            self.known_descriptors[zone_positions, descriptor_acceptances]
+        zone_costs = np.where(known, self.zone_costs[zone_positions, descriptor_acceptances], 0.0)
+        zone_transition_points = np.where(known, self.zone_transition_points[zone_positions, descriptor_acceptances],
+                                          start_transition_point)
+
+        # the robot comes from the transition point of the previous zone to steam, from its start position for the
+        # first one
+        last_candidate_positions = np.maximum.accumulate(np.where(candidates, zone_positions, -1), axis=1)
+        previous_candidate_positions = np.full_like(last_candidate_positions, -1)
+        previous_candidate_positions[:, 1:] = last_candidate_positions[:, :-1]
+        previous_transition_points = np.where(
+            previous_candidate_positions >= 0,
+            np.take_along_axis(zone_transition_points, np.maximum(previous_candidate_positions, 0), axis=1),
+            start_transition_point)
+        transition_times = np.where(candidates, self.transition_times[
+            previous_transition_points * self.transition_time_table.size + zone_transition_points], 0.0)
+
+        # costs and transition times are summed in the order of the per-seat planner, for the same rounding
+        steps = np.empty((seats_count, 2 * zones_count + 1))
+        steps[:, 0] = cumulated_time
+        steps[:, 1::2] = zone_costs
+        steps[:, 2::2] = transition_times
+        cumulated_times = np.cumsum(steps, axis=1)
+        zone_cumulated_times = cumulated_times[:, 2::2]
+
+        exceeded = candidates & (zone_cumulated_times > cycle_time)
+        first_exceeded_positions = np.argmax(np.concatenate([exceeded, np.ones((seats_count, 1), dtype=bool)],
+                                                            axis=1), axis=1)
+        reached = zone_positions <= first_exceeded_positions[:, None]
+        selected = candidates & (zone_positions < first_exceeded_positions[:, None])
+        failed = (candidates & reached & (~known | np.isnan(transition_times))).any(axis=1)
+
+        seats = np.arange(seats_count)
+        last_positions = np.minimum(first_exceeded_positions, max(zones_count - 1, 0))
+        if zones_count:
+            working_times = np.where(
+                first_exceeded_positions < zones_count,
+                zone_cumulated_times[seats, last_positions] - transition_times[seats, last_positions]
+                - zone_costs[seats, last_positions],
+                cumulated_times[:, -1])
+        else:
+            working_times = np.zeros(seats_count)
+        has_candidates = candidates.any(axis=1)
+
+        return BatchPlan(acceptances=acceptances,
+                         selected=selected,
+                         transition_times=transition_times,
+                         selected_zones_counts=selected.sum(axis=1),
+                         working_times=[None if seat_failed else round(working_time, 1) if seat_has_candidates else 0
+                                        for working_time, seat_has_candidates, seat_failed in
+                                        zip(working_times.tolist(), has_candidates.tolist(), failed.tolist())],
+                         failed=failed,
+                         previous_transition_point=previous_transition_point)
+
+    def get_selected_zones(self, batch_plan: BatchPlan, seat_index: int) -> List[tuple]:
+        """
+        (zone number, acceptance) of the zones to steam of a seat, in steaming order
+        """
+        seat_acceptances = batch_plan.acceptances[seat_index]
+        return [(self.zone_numbers[position], int(seat_acceptances[position]))
+                for position in np.flatnonzero(batch_plan.selected[seat_index]).tolist()]
+
+    def get_steaming_sequence_record(self, batch_plan: BatchPlan, seat_index: int) -> List[Dict]:
+        descriptors = self.seat_profile.descriptors
+        seat_transition_times = batch_plan.transition_times[seat_index]
+        previous_transition_point = batch_plan.previous_transition_point
+        steaming_sequence_record = []
+        for zone_number, acceptance in self.get_selected_zones(batch_plan, seat_index):
+            descriptor = descriptors[(zone_number, acceptance)]
+            steaming_sequence_record.append({
+                'input_zone': zone_number, 'acceptance_threshold': acceptance,
+                'transition points': previous_transition_point + ' ' + descriptor.transition_point,
+                'transition_time': float(seat_transition_times[self.zone_ranks[zone_number]]),
+                'steaming_time': descriptor.time})
+            previous_transition_point = descriptor.transition_point
+        return steaming_sequence_record
+
+    def get_abb_format_zones(self, batch_plan: BatchPlan, seat_index: int, program_number: str,
+                             serial_number: str) -> List[List]:
+        descriptors = self.seat_profile.descriptors if self.seat_profile is not None else {}
+        abb_format = [[program_number, serial_number, None, None, None, None, None, None, None, None, None]]
+        for steaming_zone_order_number, (zone_number, acceptance) in \
+                enumerate(self.get_selected_zones(batch_plan, seat_index), 1):
+            abb_format.append([steaming_zone_order_number, zone_number,
+                               *descriptors[(zone_number, acceptance)].abb_parameters])
+        return abb_format
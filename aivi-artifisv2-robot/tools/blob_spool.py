@@ -0,0 +1,235 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+from tools.blob_uploader import BlobUploader, BlobUploadTask, DEFAULT_WORKERS, DEFAULT_MAX_RETRIES, \
+    DEFAULT_INITIAL_BACKOFF, DEFAULT_MAX_BACKOFF, STOP_POLL_INTERVAL, is_permanent_upload_error
+
+SpoolEntry = namedtuple('SpoolEntry', ['path', 'size', 'creation_time'])
+SpoolWrite = namedtuple('SpoolWrite', ['path', 'blob_name', 'content', 'on_spooled'])
+
+FSYNC_ALWAYS = 'always'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_NEVER)
+
+SPOOL_FILE_SUFFIX = '.spool'
+SPOOL_TEMPORARY_FILE_SUFFIX = '.tmp'
+DEAD_LETTER_DIRECTORY_NAME = 'dead_letter'
+DEFAULT_SPOOL_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_SPOOL_MAX_AGE = 24 * 3600.0
+
+
+class BlobSpool(BlobUploader):
+    """
+    Blob uploader writing the payloads to a local spool folder before uploading them.
+
+    Each payload is written by the spool writer thread to its own spool file (blob name line then data), renamed into
+    place once complete. With the "always" fsync policy, the writer syncs the payloads waiting to be written as one
+    group: each file, then the spool folder once, so that the caller never waits for the disk. The workers upload the
+    spool files in order and delete them once uploaded. A payload still failing after the retries goes back at the end of the spool and its worker pauses for
+    "max_backoff", so nothing is dropped while the storage is unreachable; the spool files left at stop time are
+    uploaded at the next start. A payload failing with a permanent error, or still not uploaded "max_age" seconds
+    after it was spooled, is moved to the dead letter folder of the spool and counted as failed once. Only the spool
+    file paths are kept in memory, and payloads are refused once the spool holds "max_bytes".
+    """
+
+    def __init__(self, logger, container_client, spool_directory: Union[str, Path],
+                 max_bytes: int = DEFAULT_SPOOL_MAX_BYTES, fsync_policy: str = FSYNC_ALWAYS,
+                 max_age: float = DEFAULT_SPOOL_MAX_AGE,
+                 workers: int = DEFAULT_WORKERS, max_retries: int = DEFAULT_MAX_RETRIES,
+                 initial_backoff: float = DEFAULT_INITIAL_BACKOFF, max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 latency_metric=None, failure_metric=None):
+        super().__init__(logger, container_client, queue_size=0, workers=workers, max_retries=max_retries,
+                         initial_backoff=initial_backoff, max_backoff=max_backoff, latency_metric=latency_metric,
+                         failure_metric=failure_metric)
+        self.spool_path = Path(spool_directory)
+        self.dead_letter_path = self.spool_path / DEAD_LETTER_DIRECTORY_NAME
+        self.max_bytes = max_bytes
+        self.fsync_policy = fsync_policy
+        self.max_age = max_age
+        self.dead_lettered_count = 0
+        self.spool_lock = threading.Lock()
+        self.spool_bytes = 0
+        self.sequence = itertools.count()
+        self.write_queue: queue.Queue = queue.Queue()
+        self.writer_stopping = threading.Event()
+        self.writer: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.spool_path.mkdir(parents=True, exist_ok=True)
+        for temporary_file_path in self.spool_path.glob(f'*{SPOOL_TEMPORARY_FILE_SUFFIX}'):
+            temporary_file_path.unlink()
+        spool_file_paths = sorted(self.spool_path.glob(f'*{SPOOL_FILE_SUFFIX}'))
+        for spool_file_path in spool_file_paths:
+            spool_file_stat = spool_file_path.stat()
+            self.add_entry(SpoolEntry(spool_file_path, spool_file_stat.st_size, spool_file_stat.st_mtime))
+        if spool_file_paths:
+            self.logger.info(f'{len(spool_file_paths)} blob uploads recovered from spool "{self.spool_path}" '
+                             f'({self.spool_bytes} bytes)')
+        self.writer = threading.Thread(target=self.run_writer, name='blob-spool-writer', daemon=True)
+        self.writer.start()
+        super().start()
+
+    def get_queue_depth(self) -> int:
+        return self.write_queue.qsize() + self.queue.qsize()
+
+    def get_spool_bytes(self) -> int:
+        return self.spool_bytes
+
+    def get_dead_lettered_count(self) -> int:
+        return self.dead_lettered_count
+
+    def add_entry(self, entry: SpoolEntry) -> None:
+        with self.spool_lock:
+            self.spool_bytes += entry.size
+        self.queue.put_nowait(entry)
+
+    def enqueue(self, blob_name: str, data, on_spooled: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Queue a payload to be written to the spool, "on_spooled" is called by the spool writer thread once the payload
+        is written (and synced with the "always" fsync policy)
+        """
+        content = blob_name.encode() + b'\n' + (data.encode() if isinstance(data, str) else data)
+        with self.spool_lock:
+            if self.spool_bytes + len(content) > self.max_bytes:
+                full = True
+            else:
+                full = False
+                self.spool_bytes += len(content)
+        if full:
+            self.rejected_count += 1
+            self.logger.error(f'Blob spool full ({self.spool_bytes} bytes), "{blob_name}" dropped')
+            if self.failure_metric is not None:
+                self.failure_metric.inc()
+            return False
+
+        spool_file_path = self.spool_path / f'{time.time_ns():020}_{next(self.sequence):08}{SPOOL_FILE_SUFFIX}'
+        self.write_queue.put_nowait(SpoolWrite(spool_file_path, blob_name, content, on_spooled))
+        return True
+
+    def run_writer(self) -> None:
+        """
+        Write the payloads to the spool by groups of the ones waiting, until the writer stops and none is left
+        """
+        while True:
+            try:
+                spool_writes = [self.write_queue.get(timeout=STOP_POLL_INTERVAL)]
+            except queue.Empty:
+                if self.writer_stopping.is_set():
+                    return
+                continue
+            while True:
+                try:
+                    spool_writes.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write_spool_files(spool_writes)
+
+    def write_spool_files(self, spool_writes: List[SpoolWrite]) -> None:
+        written_spool_writes = []
+        for spool_write in spool_writes:
+            try:
+                self.write_spool_file(spool_write.path, spool_write.content)
+                written_spool_writes.append(spool_write)
+            except OSError as e:
+                with self.spool_lock:
+                    self.spool_bytes -= len(spool_write.content)
+                self.rejected_count += 1
+                self.logger.error(f'Blob "{spool_write.blob_name}" cannot be written to spool "{self.spool_path}" - '
+                                  f'{e}, dropped')
+                if self.failure_metric is not None:
+                    self.failure_metric.inc()
+        if written_spool_writes and self.fsync_policy == FSYNC_ALWAYS:
+            try:
+                self.sync_spool_directory()
+            except OSError as e:
+                self.logger.warning(f'Spool folder "{self.spool_path}" cannot be synced to disk - {e}')
+        for spool_write in written_spool_writes:
+            self.queue.put_nowait(SpoolEntry(spool_write.path, len(spool_write.content), time.time()))
+            if spool_write.on_spooled is not None:
+                try:
+                    spool_write.on_spooled()
+                except Exception:
+                    self.logger.exception(f'Blob "{spool_write.blob_name}" spooled callback failed')
+
+    def write_spool_file(self, spool_file_path: Path, content: bytes) -> None:
+        temporary_file_path = spool_file_path.with_suffix(SPOOL_TEMPORARY_FILE_SUFFIX)
+        with open(temporary_file_path, 'wb') as spool_file:
+            spool_file.write(content)
+            if self.fsync_policy == FSYNC_ALWAYS:
+                spool_file.flush()
+                os.fsync(spool_file.fileno())
+        os.replace(temporary_file_path, spool_file_path)
+
+    def sync_spool_directory(self) -> None:
+        directory_descriptor = os.open(self.spool_path, os.O_RDONLY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
+
+    def upload_with_retry(self, entry: SpoolEntry) -> bool:
+        try:
+            blob_name, data = entry.path.read_bytes().split(b'\n', 1)
+        except (OSError, ValueError) as e:
+            self.move_to_dead_letter(entry, entry.path.name, f'spool file unreadable - {e}')
+            return False
+
+        error = self.try_upload(BlobUploadTask(blob_name.decode(), data, time.perf_counter()))
+        if error is None:
+            self.remove_entry(entry)
+            return True
+        if is_permanent_upload_error(error):
+            self.move_to_dead_letter(entry, blob_name.decode(), f'permanent error - {error}')
+        elif time.time() - entry.creation_time > self.max_age:
+            self.move_to_dead_letter(entry, blob_name.decode(), f'not uploaded after {self.max_age:0.0f}s - {error}')
+        elif not self.stopping.is_set():
+            self.logger.warning(f'Upload of blob "{blob_name.decode()}" postponed by {self.max_backoff:0.1f}s, '
+                                f'kept in spool')
+            self.queue.put_nowait(entry)
+            self.stopping.wait(self.max_backoff)
+        return False
+
+    def move_to_dead_letter(self, entry: SpoolEntry, blob_name: str, reason: str) -> None:
+        """
+        Give up a spooled payload, counted as failed once, and keep its spool file in the dead letter folder
+        """
+        self.logger.error(f'Upload of blob "{blob_name}" given up, {reason}, spool file moved to '
+                          f'"{self.dead_letter_path}"')
+        try:
+            self.dead_letter_path.mkdir(exist_ok=True)
+            os.replace(entry.path, self.dead_letter_path / entry.path.name)
+        except OSError as e:
+            self.logger.error(f'Spool file "{entry.path}" cannot be moved to "{self.dead_letter_path}" - {e}, '
+                              f'left in spool until the next start')
+        with self.spool_lock:
+            self.spool_bytes -= entry.size
+        self.dead_lettered_count += 1
+        self.failed_count += 1
+        if self.failure_metric is not None:
+            self.failure_metric.inc()
+
+    def remove_entry(self, entry: SpoolEntry) -> None:
+        try:
+            entry.path.unlink()
+        except FileNotFoundError:
+            pass
+        with self.spool_lock:
+            self.spool_bytes -= entry.size
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Write the payloads waiting to the spool, then upload the spooled payloads until the timeout, the ones left are
+        uploaded at the next start
+        """
+        self.writer_stopping.set()
+        if self.writer is not None:
+            self.writer.join(timeout)
+        super().stop(timeout)
+        if self.spool_bytes:
+            self.logger.info(f'{self.spool_bytes} bytes of blob uploads left in spool "{self.spool_path}"')
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from typing import List, Optional
+
+BlobUploadTask = namedtuple('BlobUploadTask', ['blob_name', 'data', 'enqueue_time'])
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_INITIAL_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+STOP_POLL_INTERVAL = 0.5
+RETRYABLE_CLIENT_ERROR_STATUS_CODES = (408, 429)
+
+
+def is_permanent_upload_error(error: Exception) -> bool:
+    """
+    Whether an upload error would fail again on retry: an invalid argument, or an HTTP client error (authentication,
+    invalid blob name...) other than a timeout or a throttling
+    """
+    if isinstance(error, (ValueError, TypeError)):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    return isinstance(status_code, int) and 400 <= status_code < 500 and \
+        status_code not in RETRYABLE_CLIENT_ERROR_STATUS_CODES
+
+
+class BlobUploader:
+    """
+    Upload blobs from a bounded in-memory queue with a pool of worker threads.
+
+    The consumer thread only enqueues the payloads, the workers upload them and retry with an exponential backoff
+    when the storage is slow or unreachable.
+    """
+
+    def __init__(self, logger, container_client, queue_size: int = DEFAULT_QUEUE_SIZE, workers: int = DEFAULT_WORKERS,
+                 max_retries: int = DEFAULT_MAX_RETRIES, initial_backoff: float = DEFAULT_INITIAL_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF, latency_metric=None, failure_metric=None):
+        self.logger = logger
+        self.container_client = container_client
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.workers_count = workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.latency_metric = latency_metric
+        self.failure_metric = failure_metric
+        self.workers: List[threading.Thread] = []
+        self.stopping = threading.Event()
+        self.uploaded_count = 0
+        self.failed_count = 0
+        self.rejected_count = 0
+
+    def start(self) -> None:
+        for worker_number in range(self.workers_count):
+            worker = threading.Thread(target=self.run_worker, name=f'blob-uploader-{worker_number}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Upload the payloads still queued then stop the workers. The failed uploads are no longer retried.
+        """
+        self.logger.info(f'Stopping blob uploader, {self.get_queue_depth()} uploads pending...')
+        self.stopping.set()
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+
+    def get_queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def enqueue(self, blob_name: str, data) -> bool:
+        try:
+            self.queue.put_nowait(BlobUploadTask(blob_name, data, time.perf_counter()))
+            return True
+        except queue.Full:
+            self.rejected_count += 1
+            self.logger.error(f'Blob upload queue full, "{blob_name}" dropped')
+            if self.failure_metric is not None:
+                self.failure_metric.inc()
+            return False
+
+    def run_worker(self) -> None:
+        """
+        Upload the queued payloads, until the uploader stops and the queue is empty
+        """
+        while True:
+            try:
+                task = self.queue.get(timeout=STOP_POLL_INTERVAL)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+            try:
+                self.upload_with_retry(task)
+            finally:
+                self.queue.task_done()
+
+    def upload_with_retry(self, task: BlobUploadTask) -> bool:
+        if self.try_upload(task) is None:
+            return True
+        self.failed_count += 1
+        if self.failure_metric is not None:
+            self.failure_metric.inc()
+        return False
+
+    def try_upload(self, task: BlobUploadTask) -> Optional[Exception]:
+        """
+        Upload a blob, retrying with an exponential backoff unless the error is permanent
+
+        :return: Optional[Exception]: None once uploaded, the last error otherwise
+        """
+        tic = time.perf_counter()
+        backoff = self.initial_backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.container_client.upload_blob(name=task.blob_name, data=task.data, overwrite=True)
+                self.uploaded_count += 1
+                if self.latency_metric is not None:
+                    self.latency_metric.observe(time.perf_counter() - tic)
+                return None
+            except Exception as e:
+                if is_permanent_upload_error(e):
+                    self.logger.error(f'Upload of blob "{task.blob_name}" failed, not retried - {e}')
+                    return e
+                if attempt == self.max_retries:
+                    self.logger.error(f'Upload of blob "{task.blob_name}" failed after {attempt + 1} attempts - {e}')
+                    return e
+                self.logger.warning(f'Upload of blob "{task.blob_name}" failed - {e}, retrying in {backoff:0.1f}s...')
+                if self.stopping.wait(backoff):
+                    return e
+                backoff = min(backoff * 2, self.max_backoff)
@@ -0,0 +1,141 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from ftplib import FTP, all_errors, error_perm
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tools.robot_configuration import CONFIGURATION_FILE_NAMES
+
+SYNC_STATE_FILE_NAME = '.configuration_sync_state.json'
+DEFAULT_SYNC_INTERVAL = 300.0
+
+
+def write_file_atomically(file_path: Path, content: bytes) -> None:
+    """
+    Write the content in a temporary file of the same folder then rename it, so that readers never see a partially
+    written file
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=file_path.parent, prefix=f'.{file_path.name}.')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temporary_file:
+            temporary_file.write(content)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def get_file_hash(file_path: Path) -> Optional[str]:
+    if not file_path.is_file():
+        return None
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+
+class ConfigurationSync(threading.Thread):
+    """
+    Keep the requested configuration folder in sync with the configuration files hosted on the robot FTP server.
+
+    Each synchronization asks the server for the modification time (MDTM) and size (SIZE) of the files, a file is
+    only downloaded when they differ from the last synchronization, and only written when its content hash changed.
+    Files are written atomically, the configuration watcher then loads them.
+    """
+
+    def __init__(self, logger, ip_server: str, port: int, user: str, password: str, remote_directory: str,
+                 destination_path: Path, interval: float = DEFAULT_SYNC_INTERVAL, timeout: Optional[float] = None):
+        super().__init__(name='configuration-sync', daemon=True)
+        self.logger = logger
+        self.ip_server = ip_server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.remote_directory = remote_directory
+        self.destination_path = destination_path
+        self.interval = interval
+        self.timeout = timeout
+        self.stopping = threading.Event()
+        self.state_file_path = destination_path / SYNC_STATE_FILE_NAME
+        self.state = self.load_state()
+        self.downloads_count = 0
+        self.updates_count = 0
+
+    def load_state(self) -> Dict[str, Dict]:
+        try:
+            return json.loads(self.state_file_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self) -> None:
+        try:
+            write_file_atomically(self.state_file_path, json.dumps(self.state, indent=4).encode())
+        except OSError as e:
+            # without state the files are only downloaded again at the next synchronization
+            self.logger.warning(f'Configuration synchronization state cannot be saved in "{self.state_file_path}" '
+                                f'- {e}')
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+    def run(self) -> None:
+        while not self.stopping.wait(self.interval):
+            self.synchronize()
+
+    def synchronize(self) -> List[str]:
+        """
+        Synchronize the configuration files, return the names of the files updated
+        """
+        updated_files = []
+        try:
+            ftp_client = FTP() if self.timeout is None else FTP(timeout=self.timeout)
+            ftp_client.connect(self.ip_server, self.port)
+            ftp_client.login(self.user, self.password)
+            ftp_client.set_pasv(True)
+            try:
+                ftp_client.voidcmd('TYPE I')
+                for file_name in CONFIGURATION_FILE_NAMES:
+                    if self.synchronize_file(ftp_client, file_name):
+                        updated_files.append(file_name)
+            finally:
+                ftp_client.close()
+
+        except all_errors as e:
+            self.logger.error(f'Configuration synchronization with {self.ip_server} failed - {e}')
+
+        self.save_state()
+        if updated_files:
+            self.logger.info(f'Configuration files updated from FTP server: {", ".join(updated_files)}')
+        return updated_files
+
+    def synchronize_file(self, ftp_client: FTP, file_name: str) -> bool:
+        remote_path = f'{self.remote_directory}/{file_name}'
+        local_path = self.destination_path / file_name
+        try:
+            modification_time = ftp_client.voidcmd(f'MDTM {remote_path}').split()[-1]
+            size = ftp_client.size(remote_path)
+        except error_perm:
+            self.logger.debug(f'"{remote_path}" not found on FTP server')
+            return False
+
+        file_state = self.state.get(file_name, {})
+        local_hash = get_file_hash(local_path)
+        if file_state.get('modification_time') == modification_time and file_state.get('size') == size and \
+                local_hash is not None and file_state.get('sha256') == local_hash:
+            return False
+
+        content = io.BytesIO()
+        ftp_client.retrbinary(f'RETR {remote_path}', content.write)
+        self.downloads_count += 1
+        content_hash = hashlib.sha256(content.getvalue()).hexdigest()
+        self.state[file_name] = {'modification_time': modification_time, 'size': size, 'sha256': content_hash}
+        if content_hash == local_hash:
+            return False
+
+        write_file_atomically(local_path, content.getvalue())
+        self.updates_count += 1
+        return True
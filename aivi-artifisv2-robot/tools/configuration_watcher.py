@@ -0,0 +1,84 @@
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from tools.robot_configuration import RobotConfiguration, CONFIGURATION_FILE_NAMES, get_configuration_files, \
+    load_robot_configuration, validate_robot_configuration
+
+DEFAULT_WATCH_INTERVAL = 10.0
+
+
+class ConfigurationWatcher(threading.Thread):
+    """
+    Watch the requested configuration folder and hand over a new compiled configuration when its files change.
+
+    The files are parsed and validated on this thread, off the messages hot path. A change is only taken once the
+    files have stayed the same for a whole interval, so that a configuration being copied is not loaded half written.
+    A configuration failing validation is rejected and the current one is kept.
+    """
+
+    def __init__(self, logger, default_config_path: Path, requested_config_path: Path,
+                 current_version: str, on_configuration_loaded: Callable[[RobotConfiguration], None],
+                 interval: float = DEFAULT_WATCH_INTERVAL):
+        super().__init__(name='configuration-watcher', daemon=True)
+        self.logger = logger
+        self.default_config_path = default_config_path
+        self.requested_config_path = requested_config_path
+        self.current_version = current_version
+        self.on_configuration_loaded = on_configuration_loaded
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.last_snapshot = self.get_files_snapshot()
+        self.rejected_count = 0
+
+    def get_files_snapshot(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        snapshot = {}
+        for file_name in CONFIGURATION_FILE_NAMES:
+            try:
+                file_stat = (self.requested_config_path / file_name).stat()
+                snapshot[file_name] = (file_stat.st_mtime_ns, file_stat.st_size)
+            except FileNotFoundError:
+                snapshot[file_name] = None
+        return snapshot
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+    def run(self) -> None:
+        pending_snapshot = None
+        while not self.stopping.wait(self.interval):
+            snapshot = self.get_files_snapshot()
+            if snapshot == self.last_snapshot:
+                pending_snapshot = None
+            elif snapshot != pending_snapshot:
+                self.logger.info('Configuration files change detected...')
+                pending_snapshot = snapshot
+            else:
+                self.last_snapshot = snapshot
+                pending_snapshot = None
+                self.reload_configuration()
+
+    def reload_configuration(self) -> Optional[RobotConfiguration]:
+        try:
+            configuration = load_robot_configuration(
+                self.logger, *get_configuration_files(self.logger, self.default_config_path,
+                                                      self.requested_config_path))
+        except Exception as e:
+            self.rejected_count += 1
+            self.logger.error(f'New configuration rejected, configuration "{self.current_version}" kept - {e}')
+            return None
+
+        problems = validate_robot_configuration(configuration)
+        if problems:
+            self.rejected_count += 1
+            self.logger.error(f'New configuration "{configuration.version}" rejected, configuration '
+                              f'"{self.current_version}" kept - {"; ".join(problems)}')
+            return None
+
+        if configuration.version == self.current_version:
+            self.logger.info(f'Configuration "{configuration.version}" unchanged')
+            return None
+
+        self.current_version = configuration.version
+        self.on_configuration_loaded(configuration)
+        return configuration
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from functools import partial
+from typing import Callable, Optional, Union
+
+import pika
+
+DEFAULT_RECONNECTION_DELAY = 5.0
+
+PublishRequest = namedtuple('PublishRequest', ['exchange', 'routing_key', 'body', 'on_confirmed', 'properties'])
+
+
+class ConfirmedPublisher(threading.Thread):
+    """
+    Publish the output messages on a connection of its own, with publisher confirms.
+
+    Publications are not blocking: they are sent as soon as the channel is open and the broker confirms them in
+    batches (one ack may confirm every message up to its delivery tag). The "on_confirmed" callback of a message is
+    called on this thread once the broker took it in charge, this is when the input message can be acknowledged.
+    Messages not confirmed when the connection drops, or refused by the broker, are published again after
+    reconnection. When the broker only closes the channel (unknown exchange, precondition failed...), the channel is
+    reopened on the same connection after the reconnection delay and its unconfirmed messages are published again.
+    """
+
+    def __init__(self, logger, amqp_host: str, reconnection_delay: float = DEFAULT_RECONNECTION_DELAY):
+        super().__init__(name='confirmed-publisher', daemon=True)
+        self.logger = logger
+        self.amqp_host = amqp_host
+        self.reconnection_delay = reconnection_delay
+        self.lock = threading.Lock()
+        self.pending_requests = deque()
+        self.unconfirmed_requests = OrderedDict()
+        self.connection: Optional[pika.SelectConnection] = None
+        self.channel = None
+        self.delivery_tag = 0
+        self.stopping = threading.Event()
+        self.ready = threading.Event()
+        self.published_count = 0
+        self.confirmed_count = 0
+        self.republished_count = 0
+
+    def get_unconfirmed_count(self) -> int:
+        with self.lock:
+            return len(self.pending_requests) + len(self.unconfirmed_requests)
+
+    def publish(self, exchange: str, routing_key: str, body: Union[str, bytes], on_confirmed: Callable[[], None],
+                properties: Optional[pika.BasicProperties] = None) -> None:
+        """
+        Thread safe, the message is handed over to the publisher thread
+        """
+        with self.lock:
+            self.pending_requests.append(PublishRequest(exchange, routing_key, body, on_confirmed, properties))
+            connection = self.connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(self.publish_pending_requests)
+
+    def publish_pending_requests(self) -> None:
+        if self.channel is None or not self.channel.is_open:
+            return
+        while True:
+            with self.lock:
+                if not self.pending_requests:
+                    return
+                request = self.pending_requests.popleft()
+                self.delivery_tag += 1
+                self.unconfirmed_requests[self.delivery_tag] = request
+            self.channel.basic_publish(exchange=request.exchange, routing_key=request.routing_key, body=request.body,
+                                       properties=request.properties)
+            self.published_count += 1
+
+    def on_delivery_confirmation(self, method_frame) -> None:
+        confirmation = method_frame.method
+        with self.lock:
+            requests = []
+            if confirmation.multiple:
+                while self.unconfirmed_requests and \
+                        next(iter(self.unconfirmed_requests)) <= confirmation.delivery_tag:
+                    requests.append(self.unconfirmed_requests.popitem(last=False)[1])
+            elif confirmation.delivery_tag in self.unconfirmed_requests:
+                requests.append(self.unconfirmed_requests.pop(confirmation.delivery_tag))
+            if isinstance(confirmation, pika.spec.Basic.Nack):
+                self.pending_requests.extendleft(reversed(requests))
+
+        if isinstance(confirmation, pika.spec.Basic.Nack):
+            self.logger.warning(f'{len(requests)} output messages refused by the broker, publishing again...')
+            self.republished_count += len(requests)
+            self.publish_pending_requests()
+            return
+
+        self.confirmed_count += len(requests)
+        for request in requests:
+            try:
+                request.on_confirmed()
+            except Exception:
+                self.logger.exception('Output message confirmation callback failed')
+
+    def on_connection_open(self, connection) -> None:
+        connection.channel(on_open_callback=self.on_channel_open)
+
+    def on_channel_open(self, channel) -> None:
+        self.logger.info('Output publisher channel opened')
+        self.channel = channel
+        self.delivery_tag = 0
+        channel.add_on_close_callback(self.on_channel_closed)
+        channel.confirm_delivery(self.on_delivery_confirmation)
+        self.ready.set()
+        self.publish_pending_requests()
+
+    def on_channel_closed(self, channel, reason) -> None:
+        connection = channel.connection
+        if channel is not self.channel or not connection.is_open:
+            # the channel closes with its connection, the connection close callback publishes again
+            return
+        self.channel = None
+        self.ready.clear()
+        unconfirmed_count = self.requeue_unconfirmed_requests()
+        if self.stopping.is_set():
+            return
+        self.logger.error(f'Output publisher channel closed - {reason}, {unconfirmed_count} unconfirmed messages will '
+                          f'be published again on a new channel in {self.reconnection_delay}s')
+        connection.ioloop.call_later(self.reconnection_delay, partial(self.reopen_channel, connection))
+
+    def reopen_channel(self, connection) -> None:
+        if connection.is_open and self.channel is None and not self.stopping.is_set():
+            connection.channel(on_open_callback=self.on_channel_open)
+
+    def requeue_unconfirmed_requests(self) -> int:
+        """
+        Put the messages not confirmed yet back at the front of the pending messages, return their count
+        """
+        with self.lock:
+            unconfirmed_requests = list(self.unconfirmed_requests.values())
+            self.unconfirmed_requests.clear()
+            self.pending_requests.extendleft(reversed(unconfirmed_requests))
+        self.republished_count += len(unconfirmed_requests)
+        return len(unconfirmed_requests)
+
+    def on_connection_closed(self, connection, reason) -> None:
+        self.channel = None
+        self.ready.clear()
+        unconfirmed_count = self.requeue_unconfirmed_requests()
+        if not self.stopping.is_set():
+            self.logger.error(f'Output publisher connection closed - {reason}, '
+                              f'{unconfirmed_count} unconfirmed messages will be published again')
+        connection.ioloop.stop()
+
+    def on_connection_error(self, connection, error) -> None:
+        self.logger.error(f'Output publisher connection to {self.amqp_host} failed - {error}')
+        connection.ioloop.stop()
+
+    def run(self) -> None:
+        while not self.stopping.is_set():
+            connection = pika.SelectConnection(pika.ConnectionParameters(host=self.amqp_host),
+                                               on_open_callback=self.on_connection_open,
+                                               on_open_error_callback=self.on_connection_error,
+                                               on_close_callback=self.on_connection_closed)
+            with self.lock:
+                self.connection = connection
+            connection.ioloop.start()
+            with self.lock:
+                self.connection = None
+            if not self.stopping.is_set():
+                time.sleep(self.reconnection_delay)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait for the messages already published to be confirmed, then close the connection
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        while timeout and self.ready.is_set() and self.get_unconfirmed_count() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.stopping.set()
+        with self.lock:
+            connection = self.connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(connection.close)
+        self.join(timeout)
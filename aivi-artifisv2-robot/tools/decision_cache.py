@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+DEFAULT_DECISION_CACHE_SIZE = 1024
+
+
+class DecisionCache:
+    """
+    Bounded LRU cache of computed robot plans.
+
+    The cache is bound to a configuration version, every entry is dropped when the version changes. A max_size of 0
+    disables the cache.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_DECISION_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.configuration_version: Optional[str] = None
+        self.hits_count = 0
+        self.misses_count = 0
+        self.evictions_count = 0
+        self.invalidations_count = 0
+
+    def check_configuration_version(self, configuration_version: str) -> None:
+        with self.lock:
+            if configuration_version != self.configuration_version:
+                if self.entries:
+                    self.invalidations_count += 1
+                self.entries.clear()
+                self.configuration_version = configuration_version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if self.max_size <= 0:
+            return None
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses_count += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits_count += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions_count += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -1,10 +1,13 @@
 import csv
+import hashlib
 import json
 import logging
 from enum import Enum
 from json import JSONDecodeError
 from pathlib import Path
-from typing import Dict, Any, Union
+from typing import Dict, Any, Iterable, Union
+
+from tools.orders_encoder import encode_orders
 
 
 class ConfigurationExtension(Enum):
@@ -70,6 +73,18 @@ def convert_csv_to_dict(file_path, key_column, logger: logging.getLogger()):
     return result
 
 
+def get_configuration_version(file_paths: Iterable[Union[str, Path]], parameters: Any = None) -> str:
+    """
+    Short hash identifying a configuration from the content of its files and its parameters
+    """
+    configuration_hash = hashlib.sha1()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as file_content:
+            configuration_hash.update(file_content.read())
+    configuration_hash.update(repr(parameters).encode())
+    return configuration_hash.hexdigest()[:12]
+
+
 def save_dict_in_json(input_dict, out_put_path):
     with open(out_put_path, 'w') as file:
         json.dump(input_dict, file, indent=4, separators=(",", ":"))
@@ -77,9 +92,8 @@ def save_dict_in_json(input_dict, out_put_path):
 
 def write_list_to_csv_file(logger: logging.getLogger(), list_to_copy, file_path):
     try:
-        with open(file_path, 'w', newline='') as used_file:
-            writer = csv.writer(used_file, quoting=csv.QUOTE_NONE)
-            writer.writerows(list_to_copy)
+        with open(file_path, 'wb') as used_file:
+            used_file.write(encode_orders(list_to_copy))
             return 'OK'
     except Exception as e:
         logger.error(f'{e} exception was produced...')
@@ -1,53 +1,228 @@
-import csv
-import os
-import tempfile
+import hashlib
+import io
+import threading
+import time
+from collections import namedtuple
 from ftplib import FTP, all_errors
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+from tools.metrics import ProcessMetrics, FTP_CONNECT_STAGE, FTP_STORE_STAGE
+from tools.orders_encoder import encode_orders
+
+DEFAULT_KEEPALIVE_INTERVAL = 30.0
+
+FULL_UPLOAD = 'full'
+REUSED_ENCODING_UPLOAD = 'reused_encoding'
+SKIPPED_UPLOAD = 'skipped'
+
+DeliveredOrders = namedtuple('DeliveredOrders', ['zone_rows', 'encoded_zone_rows', 'digest'])
+
+
+def get_orders_digest(orders_content: bytes) -> bytes:
+    return hashlib.blake2b(orders_content, digest_size=16).digest()
 
 
 class FtpClient:
+    """
+    Long-lived FTP session with the robot.
+
+    The session is opened on the first upload and reused for the following ones. A background thread sends NOOP
+    commands while the session is idle, and the session is reopened when the link has dropped.
+
+    The client remembers the orders it last delivered in the session. Orders differing only by their header line
+    (program and serial numbers) reuse the encoded zone rows. Identical orders are not stored again when
+    "skip_identical_orders" is set, for robots that do not consume the orders file.
+    """
+
     def __init__(self, input_logger, orders_file_name, output_directory, ip_server: str, port: int = 21, user: str = "",
-                 password: str = ""):
+                 password: str = "", keepalive_interval: float = DEFAULT_KEEPALIVE_INTERVAL,
+                 timeout: Optional[float] = None, metrics: Optional[ProcessMetrics] = None,
+                 skip_identical_orders: bool = False):
         self.logger = input_logger
+        self.metrics = metrics or ProcessMetrics()
         self.user = user
         self.password = password
         self.ip_server = ip_server
         self.port = port
-        self.ftp_client = FTP()
-        self.directories = []
-        self.files = []
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.ftp_client: Optional[FTP] = None
         self.orders_file_name = orders_file_name
         self.output_directory = output_directory
-        
+        self.lock = threading.RLock()
+        self.last_activity = 0.0
+        self.keepalive_thread: Optional[threading.Thread] = None
+        self.stop_keepalive = threading.Event()
+        self.connections_count = 0
+        self.reconnections_count = 0
+        self.reused_connections_count = 0
+        self.skip_identical_orders = skip_identical_orders
+        self.last_delivered_orders: Optional[DeliveredOrders] = None
+        self.uploads_count = {FULL_UPLOAD: 0, REUSED_ENCODING_UPLOAD: 0, SKIPPED_UPLOAD: 0}
+        self.uploaded_bytes = 0
+        self.skipped_bytes = 0
+
+    def is_connected(self) -> bool:
+        return self.ftp_client is not None
+
+    def open_session(self) -> FTP:
+        with self.metrics.time_stage(FTP_CONNECT_STAGE):
+            ftp_client = FTP() if self.timeout is None else FTP(timeout=self.timeout)
+            try:
+                ftp_client.connect(self.ip_server, self.port)
+                ftp_client.login(self.user, self.password)
+                ftp_client.set_pasv(True)
+            except all_errors:
+                ftp_client.close()
+                raise
+        return ftp_client
+
     def get_connection(self) -> None:
-        self.ftp_client.connect(self.ip_server, self.port)
-        self.ftp_client.login(self.user, self.password)
-        self.ftp_client.set_pasv(True)
+        self.set_connection(self.open_session())
+
+    def set_connection(self, ftp_client: FTP) -> None:
+        if self.connections_count > 0:
+            self.reconnections_count += 1
+            self.logger.info(f'FTP session with {self.ip_server} reopened ({self.reconnections_count} reconnections)')
+        self.connections_count += 1
+        # The orders file may have changed on the robot while the session was down
+        self.last_delivered_orders = None
+        self.ftp_client = ftp_client
+        self.last_activity = time.monotonic()
+        self.start_keepalive()
 
     def get_disconnection(self) -> None:
-        self.ftp_client.close()
+        if self.ftp_client is not None:
+            try:
+                self.ftp_client.close()
+            finally:
+                self.ftp_client = None
 
-    def write_and_push_temporary_file_to_robot(self, zones: List) -> str:
-        self.logger.info('write and push orders.csv file to ftp server')
-        status = 'OK'
-        try:
-            self.get_connection()
-            self.logger.info('connection with FTP server done')
+    def ensure_connection(self) -> bool:
+        """
+        Open the session if needed, return True when an already opened session is reused
+        """
+        if self.is_connected():
+            self.reused_connections_count += 1
+            return True
+        self.get_connection()
+        self.logger.info('connection with FTP server done')
+        return False
+
+    def start_keepalive(self) -> None:
+        if self.keepalive_interval <= 0 or self.keepalive_thread is not None:
+            return
+        self.keepalive_thread = threading.Thread(target=self.run_keepalive, name='ftp-keepalive', daemon=True)
+        self.keepalive_thread.start()
 
-            files_in_ftp = []
-            self.ftp_client.retrlines('LIST', lambda line: files_in_ftp.append(line.split()[-1]))
+    def run_keepalive(self) -> None:
+        while not self.stop_keepalive.wait(self.keepalive_interval):
+            self.send_keepalive()
 
-            f = tempfile.NamedTemporaryFile(mode='w', newline='', delete=False)
-            writer = csv.writer(f)
-            writer.writerows(zones)
-            f.close()
-            self.ftp_client.storlines(f'STOR {self.output_directory}/{self.orders_file_name}', open(f.name, 'rb'))
-            
-            os.remove(f.name)
+    def send_keepalive(self) -> None:
+        with self.lock:
+            if time.monotonic() - self.last_activity < self.keepalive_interval:
+                return
+            if self.is_connected():
+                try:
+                    self.ftp_client.voidcmd('NOOP')
+                    self.last_activity = time.monotonic()
+                except all_errors as e:
+                    self.logger.warning(f'FTP session with {self.ip_server} lost - {e}')
+                    self.get_disconnection()
+                return
 
+        # The session is reopened outside the lock, so that the uploads do not wait for an unreachable robot
+        try:
+            ftp_client = self.open_session()
         except all_errors as e:
-            self.logger.error(f'Error when uploading file on ABB FTP - {e}')
+            self.logger.warning(f'FTP session with {self.ip_server} cannot be reopened - {e}')
+            return
+        with self.lock:
+            if self.is_connected() or self.stop_keepalive.is_set():
+                ftp_client.close()
+                return
+            self.set_connection(ftp_client)
+
+    def close(self) -> None:
+        self.stop_keepalive.set()
+        with self.lock:
+            if self.is_connected():
+                try:
+                    self.ftp_client.quit()
+                except all_errors:
+                    pass
             self.get_disconnection()
-            status = 'FTP error'
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {'connections': self.connections_count,
+                'reconnections': self.reconnections_count,
+                'reused_connections': self.reused_connections_count,
+                'full_uploads': self.uploads_count[FULL_UPLOAD],
+                'reused_encoding_uploads': self.uploads_count[REUSED_ENCODING_UPLOAD],
+                'skipped_uploads': self.uploads_count[SKIPPED_UPLOAD],
+                'uploaded_bytes': self.uploaded_bytes,
+                'skipped_bytes': self.skipped_bytes}
+
+    def encode_orders_for_delivery(self, zones: List, last_delivered_orders: Optional[DeliveredOrders]) \
+            -> Tuple[bytes, DeliveredOrders, str]:
+        """
+        Encode the orders, reusing the zone rows of the last delivered orders when only the header line changed
+        """
+        zone_rows = zones[1:]
+        if last_delivered_orders is not None and zone_rows == last_delivered_orders.zone_rows:
+            encoded_zone_rows = last_delivered_orders.encoded_zone_rows
+            upload_kind = REUSED_ENCODING_UPLOAD
+        else:
+            encoded_zone_rows = encode_orders(zone_rows)
+            upload_kind = FULL_UPLOAD
+        orders_content = encode_orders(zones[:1]) + encoded_zone_rows
+        delivered_orders = DeliveredOrders([list(zone_row) for zone_row in zone_rows], encoded_zone_rows,
+                                           get_orders_digest(orders_content))
+        return orders_content, delivered_orders, upload_kind
+
+    def write_and_push_temporary_file_to_robot(self, zones: List) -> str:
+        self.logger.info('write and push orders.csv file to ftp server')
+
+        with self.lock:
+            last_delivered_orders = self.last_delivered_orders if self.is_connected() else None
+            orders_content, delivered_orders, upload_kind = self.encode_orders_for_delivery(zones,
+                                                                                            last_delivered_orders)
+            if self.skip_identical_orders and last_delivered_orders is not None and \
+                    delivered_orders.digest == last_delivered_orders.digest:
+                self.logger.info('Orders identical to the last delivered ones, upload skipped')
+                self.uploads_count[SKIPPED_UPLOAD] += 1
+                self.skipped_bytes += len(orders_content)
+                return 'OK'
+
+            status = 'OK'
+            try:
+                reused_connection = self.ensure_connection()
+                try:
+                    self.store_orders(orders_content)
+                except all_errors as e:
+                    if not reused_connection:
+                        raise
+                    # The link may have dropped since the last upload, retry once with a new session
+                    self.logger.warning(f'FTP session with {self.ip_server} lost - {e}, reconnecting...')
+                    self.get_disconnection()
+                    self.get_connection()
+                    self.store_orders(orders_content)
+
+                self.last_delivered_orders = delivered_orders
+                self.uploads_count[upload_kind] += 1
+                self.uploaded_bytes += len(orders_content)
+
+            except all_errors as e:
+                self.logger.error(f'Error when uploading file on ABB FTP - {e}')
+                self.get_disconnection()
+                self.last_delivered_orders = None
+                status = 'FTP error'
 
         return status
+
+    def store_orders(self, orders_content: bytes) -> None:
+        with self.metrics.time_stage(FTP_STORE_STAGE):
+            self.ftp_client.storbinary(f'STOR {self.output_directory}/{self.orders_file_name}',
+                                       io.BytesIO(orders_content))
+        self.last_activity = time.monotonic()
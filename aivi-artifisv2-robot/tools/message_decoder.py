@@ -0,0 +1,79 @@
+import json
+from collections import namedtuple
+from typing import Any, Dict
+
+try:
+    import orjson
+
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    orjson = None
+    JSON_BACKEND = 'json'
+
+InputMessage = namedtuple('InputMessage', ['message',
+                                           'buckle_belt_result',
+                                           'wrinkles_result',
+                                           'wrinkles_succeed',
+                                           'serial_number',
+                                           'seat_info',
+                                           'time_stamp'])
+
+
+class InvalidInputMessage(Exception):
+    pass
+
+
+def load_json(body: bytes) -> Any:
+    """
+    Parse json with orjson when it is installed, falling back to the json module for the NaN and Infinity values
+    orjson rejects
+    """
+    if orjson is None:
+        return json.loads(body)
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return json.loads(body)
+
+
+def get_mapping(parent: Dict, key: str, path: str, optional: bool = False) -> Any:
+    value = parent.get(key)
+    if value is None and optional:
+        return None
+    if not isinstance(value, dict):
+        raise InvalidInputMessage(f'"{path}" is missing or is not an object')
+    return value
+
+
+def decode_input_message(body: bytes) -> InputMessage:
+    """
+    Parse a wrinkle detector message and check the fields used by the module, with orjson when it is installed
+
+    :raise InvalidInputMessage: when the message is not a json object or a mandatory field is missing
+    """
+    if not body or body.lstrip()[:1] != b'{':
+        raise InvalidInputMessage('Message is not a json object')
+    try:
+        message = load_json(body)
+    except ValueError as e:
+        raise InvalidInputMessage(f'Message is not valid json - {e}')
+
+    metadata = get_mapping(message, "metadata", "metadata")
+    wrinkle_detector = get_mapping(get_mapping(message, "models", "models"), "wrinkle_detector",
+                                   "models.wrinkle_detector")
+    wrinkles_result = get_mapping(wrinkle_detector, "predicted_acceptance_per_zone",
+                                  "models.wrinkle_detector.predicted_acceptance_per_zone", optional=True)
+    decisions = get_mapping(message, "decisions", "decisions", optional=True)
+    seat_info = get_mapping(metadata, "seat_info", "metadata.seat_info", optional=True)
+    if "serial_number" not in metadata:
+        raise InvalidInputMessage('"metadata.serial_number" is missing')
+    if "trigger_time" not in metadata:
+        raise InvalidInputMessage('"metadata.trigger_time" is missing')
+
+    return InputMessage(message=message,
+                        buckle_belt_result=decisions.get("front_buckle_belt_domain_decision") if decisions else None,
+                        wrinkles_result=wrinkles_result,
+                        wrinkles_succeed=wrinkle_detector.get("succeed"),
+                        serial_number=metadata["serial_number"],
+                        seat_info=seat_info,
+                        time_stamp=metadata["trigger_time"])
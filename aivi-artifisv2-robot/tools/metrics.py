@@ -0,0 +1,185 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Sequence
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily
+
+DECODE_STAGE = 'decode'
+BUCKLE_FILTERING_STAGE = 'buckle_filtering'
+PLANNING_STAGE = 'planning'
+FTP_CONNECT_STAGE = 'ftp_connect'
+FTP_STORE_STAGE = 'ftp_store'
+MOUNTING_WRITE_STAGE = 'mounting_write'
+BLOB_UPLOAD_STAGE = 'blob_upload'
+PUBLISH_STAGE = 'publish'
+PROCESS_STAGES = (DECODE_STAGE, BUCKLE_FILTERING_STAGE, PLANNING_STAGE, FTP_CONNECT_STAGE, FTP_STORE_STAGE,
+                  MOUNTING_WRITE_STAGE, BLOB_UPLOAD_STAGE, PUBLISH_STAGE)
+
+ZONES_REQUESTED = 'requested'
+ZONES_SELECTED = 'selected'
+ZONES_DROPPED_FOR_TIME = 'dropped_for_time'
+ZONES_UNKNOWN = 'unknown'
+
+GREEDY_PLAN = 'greedy'
+OPTIMAL_PLAN = 'optimal'
+CYCLE_TIME = 'cycle'
+
+METRICS_SERVER_PHASE = 'metrics_server'
+CONFIGURATION_PHASE = 'configuration'
+AMQP_CONNECTION_PHASE = 'amqp_connection'
+BLOB_CONTAINER_PHASE = 'blob_container'
+ROBOTS_PHASE = 'robots'
+READY_PHASE = 'ready'
+FIRST_MESSAGE_PHASE = 'first_message'
+
+STAGE_LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class ProcessMetrics:
+    """
+    Latency of each stage of a seat processing and count of the zones going through the planner.
+
+    Every method does nothing when the metrics are not given, so that the components can be used without Prometheus.
+    """
+
+    def __init__(self, stage_latency: Optional[Histogram] = None, zones_count: Optional[Counter] = None,
+                 label_values: Sequence = (), planner_working_time: Optional[Counter] = None):
+        self.stage_latencies = {}
+        self.zones_counts = {}
+        self.planner_working_times = {}
+        if stage_latency is not None:
+            self.stage_latencies = {stage: stage_latency.labels(*label_values, stage) for stage in PROCESS_STAGES}
+        if zones_count is not None:
+            self.zones_counts = {zones_outcome: zones_count.labels(*label_values, zones_outcome)
+                                 for zones_outcome in (ZONES_REQUESTED, ZONES_SELECTED, ZONES_DROPPED_FOR_TIME,
+                                                       ZONES_UNKNOWN)}
+        if planner_working_time is not None:
+            self.planner_working_times = {plan: planner_working_time.labels(*label_values, plan)
+                                          for plan in (GREEDY_PLAN, OPTIMAL_PLAN, CYCLE_TIME)}
+
+    def get_stage_latency(self, stage: str) -> Optional[Histogram]:
+        return self.stage_latencies.get(stage)
+
+    @contextmanager
+    def time_stage(self, stage: str) -> Iterator[None]:
+        stage_latency = self.stage_latencies.get(stage)
+        if stage_latency is None:
+            yield
+            return
+        with stage_latency.time():
+            yield
+
+    def count_zones(self, requested_zones_count: int, selected_zones_count: int, unknown_zones_count: int = 0) -> None:
+        """
+        The requested zones are the ones the seat profile describes, the zones under the threshold it does not
+        describe are counted as unknown instead of dropped for time
+        """
+        if not self.zones_counts:
+            return
+        self.zones_counts[ZONES_UNKNOWN].inc(unknown_zones_count)
+        self.zones_counts[ZONES_REQUESTED].inc(requested_zones_count)
+        self.zones_counts[ZONES_SELECTED].inc(selected_zones_count)
+        self.zones_counts[ZONES_DROPPED_FOR_TIME].inc(max(requested_zones_count - selected_zones_count, 0))
+
+    def count_planner_working_time(self, greedy_working_time: float, optimal_working_time: float,
+                                   cycle_time: float) -> None:
+        """
+        Working time of the plan of the optimal planner and of the greedy plan of the same seat, with the cycle time
+        to get the robot utilization gained
+        """
+        if not self.planner_working_times:
+            return
+        self.planner_working_times[GREEDY_PLAN].inc(greedy_working_time)
+        self.planner_working_times[OPTIMAL_PLAN].inc(optimal_working_time)
+        self.planner_working_times[CYCLE_TIME].inc(cycle_time)
+
+
+class StartupMetrics:
+    """
+    Duration of each startup phase, and time from the start to the consumption readiness and to the first message.
+
+    The phases may run in parallel threads, so their durations do not add up to the readiness time.
+    """
+
+    def __init__(self, startup_duration: Optional[Gauge] = None, label_values: Sequence = (),
+                 start_time: Optional[float] = None):
+        self.startup_duration = startup_duration
+        self.label_values = label_values
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.durations: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def set_duration(self, phase: str, duration: float) -> None:
+        with self.lock:
+            if phase in self.durations:
+                return
+            self.durations[phase] = duration
+        if self.startup_duration is not None:
+            self.startup_duration.labels(*self.label_values, phase).set(duration)
+
+    @contextmanager
+    def time_phase(self, phase: str) -> Iterator[None]:
+        tic = time.perf_counter()
+        yield
+        self.set_duration(phase, time.perf_counter() - tic)
+
+    def mark(self, phase: str) -> None:
+        """
+        Time since the start, recorded the first time only
+        """
+        if phase in self.durations:
+            return
+        self.set_duration(phase, time.perf_counter() - self.start_time)
+
+    def get_breakdown(self) -> str:
+        with self.lock:
+            return ', '.join(f'{phase} {duration:0.3f}s' for phase, duration in self.durations.items())
+
+
+class CountersCollector:
+    """
+    Prometheus collector exposing, as counters, counts kept by the components themselves.
+
+    The counts are read when the metrics are scraped, so that the components keep plain integers and can be used
+    without Prometheus. A counter may have several samples, told apart by extra labels.
+    """
+
+    def __init__(self, label_names: Sequence[str], label_values: Sequence):
+        self.label_names = list(label_names)
+        self.label_values = [str(label_value) for label_value in label_values]
+        self.counters = {}
+
+    def add_counter(self, name: str, documentation: str, count_function: Callable[[], float],
+                    extra_labels: Optional[Dict[str, str]] = None) -> None:
+        extra_labels = extra_labels or {}
+        _, extra_label_names, samples = self.counters.setdefault(name, (documentation, list(extra_labels), []))
+        samples.append(([extra_labels[label_name] for label_name in extra_label_names], count_function))
+
+    def collect(self) -> Iterator[CounterMetricFamily]:
+        for name, (documentation, extra_label_names, samples) in self.counters.items():
+            counter_family = CounterMetricFamily(name, documentation, labels=self.label_names + extra_label_names)
+            for extra_label_values, count_function in samples:
+                counter_family.add_metric(self.label_values + extra_label_values, count_function())
+            yield counter_family
+
+
+def create_process_metrics(module_id: str, label_names: Sequence[str], label_values: Sequence) -> ProcessMetrics:
+    stage_latency = Histogram(f"{module_id}_stage_latency_seconds", "Latency of each seat processing stage",
+                              list(label_names) + ['stage'], buckets=STAGE_LATENCY_BUCKETS)
+    zones_count = Counter(f"{module_id}_zones", "Zones under the acceptance threshold requested to the planner, "
+                                                "selected, dropped for lack of time, and unknown to the seat profile",
+                          list(label_names) + ['outcome'])
+    planner_working_time = Counter(f"{module_id}_optimal_planner_seconds",
+                                   "Working time of the seats planned by the optimal planner, of their greedy plan, "
+                                   "and their cycle time", list(label_names) + ['plan'])
+    return ProcessMetrics(stage_latency, zones_count, label_values, planner_working_time)
+
+
+def create_startup_metrics(module_id: str, label_names: Sequence[str], label_values: Sequence,
+                           start_time: Optional[float] = None) -> StartupMetrics:
+    startup_duration = Gauge(f"{module_id}_startup_seconds", "Duration of each startup phase, and time from the start "
+                                                             "to the readiness and to the first message",
+                             list(label_names) + ['phase'])
+    return StartupMetrics(startup_duration, label_values, start_time)
@@ -0,0 +1,241 @@
+import itertools
+import json
+import os
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Union
+
+SEAT_BLOB_ARCHIVE_MODE = 'blob'
+BATCH_ARCHIVE_MODE = 'batch'
+ARCHIVE_MODES = (SEAT_BLOB_ARCHIVE_MODE, BATCH_ARCHIVE_MODE)
+
+ORDERS_BLOB_SUFFIX = '_robot_orders.csv'
+ORDERS_BATCH_SUFFIX = '_robot_orders.jsonl'
+ORDERS_BATCH_INDEX_SUFFIX = '_robot_orders_index.json'
+
+DEFAULT_MAX_BATCH_BYTES = 1024 * 1024
+DEFAULT_MAX_BATCH_AGE = 300.0
+JOURNAL_SYNC_INTERVAL = 1.0
+
+ORDERS_JOURNAL_DIRECTORY_NAME = 'orders_batches'
+ORDERS_JOURNAL_SUFFIX = '.journal'
+
+
+class OrdersBatch:
+    __slots__ = ('folder', 'hour', 'lines', 'index', 'size', 'creation_time', 'journal_path', 'journal_file',
+                 'spooled_blobs_count')
+
+    def __init__(self, folder: str, hour: int):
+        self.folder = folder
+        self.hour = hour
+        self.lines = []
+        self.index: Dict[str, list] = {}
+        self.size = 0
+        self.creation_time = time.monotonic()
+        self.journal_path: Optional[Path] = None
+        self.journal_file: Optional[BinaryIO] = None
+        self.spooled_blobs_count = 0
+
+    def append(self, pipeline_id: str, orders: bytes) -> bytes:
+        line = json.dumps({"pipeline_id": pipeline_id, "orders": orders.decode()}).encode() + b'\n'
+        self.append_line(pipeline_id, line)
+        return line
+
+    def append_line(self, pipeline_id: str, line: bytes) -> None:
+        self.index[pipeline_id] = [self.size, len(line)]
+        self.lines.append(line)
+        self.size += len(line)
+
+
+class OrdersArchiver:
+    """
+    Archive the orders of the seats by batches instead of one blob per seat.
+
+    The orders of a station folder (raw/{country}_{plant}/{station}/{yyyy}/{mm}/{dd}/) and of an hour are gathered
+    in a json lines blob, one {"pipeline_id", "orders"} record per seat, with an index blob giving the byte offset
+    and length of each pipeline id record. A batch is handed to the blob uploader when it reaches "max_batch_bytes",
+    when it is older than "max_batch_age" seconds, or when the archiver stops.
+
+    With a "journal_directory", to use with a blob spool uploader, the records of each batch are also appended to a
+    journal file as they are archived, synced to disk every second by the flush thread, and the journal is deleted
+    once both blobs of the batch are in the spool. The batches of the journals left by a crash are handed to the
+    blob uploader at the next start, so that an acknowledged seat is not lost with the batches held in memory.
+    """
+
+    def __init__(self, logger, blob_uploader, instance_id: str, max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+                 max_batch_age: float = DEFAULT_MAX_BATCH_AGE, journal_directory: Union[str, Path, None] = None):
+        self.logger = logger
+        self.blob_uploader = blob_uploader
+        self.instance_id = instance_id
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_age = max_batch_age
+        self.lock = threading.Lock()
+        self.batches: Dict[tuple, OrdersBatch] = {}
+        self.batch_sequence = 0
+        self.stopping = threading.Event()
+        self.flush_thread: Optional[threading.Thread] = None
+        self.archived_count = 0
+        self.flushed_batches_count = 0
+        self.journal_path = Path(journal_directory) if journal_directory else None
+        self.journal_sequence = itertools.count()
+
+    def start(self) -> None:
+        if self.journal_path is not None:
+            self.journal_path.mkdir(parents=True, exist_ok=True)
+            self.recover_journals()
+        self.flush_thread = threading.Thread(target=self.run_flush, name='orders-archiver', daemon=True)
+        self.flush_thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Hand the batches in progress over to the blob uploader, which has to be stopped afterwards
+        """
+        self.stopping.set()
+        if self.flush_thread is not None:
+            self.flush_thread.join(timeout)
+        self.flush(force=True)
+
+    def archive(self, folder: str, hour: int, pipeline_id: str, orders: bytes) -> None:
+        with self.lock:
+            batch = self.batches.get((folder, hour))
+            if batch is None:
+                batch = self.batches[(folder, hour)] = OrdersBatch(folder, hour)
+                self.open_journal(batch)
+            line = batch.append(pipeline_id, orders)
+            self.write_journal(batch, line)
+            self.archived_count += 1
+            if batch.size < self.max_batch_bytes:
+                return
+            del self.batches[(folder, hour)]
+        self.upload_batch(batch)
+
+    def get_pending_count(self) -> int:
+        with self.lock:
+            return sum(len(batch.index) for batch in self.batches.values())
+
+    def run_flush(self) -> None:
+        flush_interval = min(self.max_batch_age / 4, 5.0)
+        if self.journal_path is not None:
+            flush_interval = min(flush_interval, JOURNAL_SYNC_INTERVAL)
+        while not self.stopping.wait(flush_interval):
+            self.sync_journals()
+            self.flush()
+
+    def open_journal(self, batch: OrdersBatch) -> None:
+        """
+        Create the journal of a new batch, starting with a {"folder", "hour"} header line
+        """
+        if self.journal_path is None:
+            return
+        journal_path = self.journal_path / f'{time.time_ns():020}_{next(self.journal_sequence):08}' \
+                                           f'{ORDERS_JOURNAL_SUFFIX}'
+        try:
+            batch.journal_file = open(journal_path, 'ab')
+            batch.journal_path = journal_path
+        except OSError as e:
+            self.logger.error(f'Orders journal "{journal_path}" cannot be created - {e}, batch kept in memory only')
+            return
+        self.write_journal(batch, json.dumps({"folder": batch.folder, "hour": batch.hour}).encode() + b'\n')
+
+    def write_journal(self, batch: OrdersBatch, line: bytes) -> None:
+        if batch.journal_file is None:
+            return
+        try:
+            batch.journal_file.write(line)
+            batch.journal_file.flush()
+        except OSError as e:
+            self.logger.error(f'Orders journal "{batch.journal_path}" cannot be written - {e}, batch kept in memory '
+                              f'only')
+            self.close_journal(batch)
+            self.remove_journal(batch)
+
+    def sync_journals(self) -> None:
+        with self.lock:
+            journal_files = [batch.journal_file for batch in self.batches.values() if batch.journal_file is not None]
+        for journal_file in journal_files:
+            try:
+                os.fsync(journal_file.fileno())
+            except (OSError, ValueError):
+                # the journal was closed meanwhile, its batch is already handed over to the blob uploader
+                pass
+
+    @staticmethod
+    def close_journal(batch: OrdersBatch) -> None:
+        if batch.journal_file is not None:
+            try:
+                batch.journal_file.close()
+            except OSError:
+                pass
+            batch.journal_file = None
+
+    def remove_journal(self, batch: OrdersBatch) -> None:
+        if batch.journal_path is None:
+            return
+        try:
+            batch.journal_path.unlink()
+        except OSError as e:
+            self.logger.warning(f'Orders journal "{batch.journal_path}" cannot be deleted - {e}')
+        batch.journal_path = None
+
+    def on_batch_blob_spooled(self, batch: OrdersBatch) -> None:
+        batch.spooled_blobs_count += 1
+        if batch.spooled_blobs_count == 2:
+            self.remove_journal(batch)
+
+    def recover_journals(self) -> None:
+        """
+        Hand the batches of the journals left by the previous run over to the blob uploader
+        """
+        for journal_path in sorted(self.journal_path.glob(f'*{ORDERS_JOURNAL_SUFFIX}')):
+            try:
+                header, *lines = journal_path.read_bytes().splitlines(keepends=True)
+                batch_header = json.loads(header)
+                batch = OrdersBatch(batch_header["folder"], batch_header["hour"])
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.logger.error(f'Orders journal "{journal_path}" unreadable - {e}, deleted')
+                journal_path.unlink()
+                continue
+            for line in lines:
+                try:
+                    batch.append_line(json.loads(line)["pipeline_id"], line)
+                except (ValueError, KeyError, TypeError):
+                    # the last record of a journal may be cut by the crash
+                    self.logger.warning(f'Invalid record skipped in orders journal "{journal_path}"')
+            batch.journal_path = journal_path
+            if not batch.index:
+                self.remove_journal(batch)
+                continue
+            self.logger.info(f'Orders of {len(batch.index)} seats recovered from journal "{journal_path}"')
+            self.upload_batch(batch)
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Upload the batches older than the maximum batch age, or all of them
+        """
+        now = time.monotonic()
+        with self.lock:
+            batch_keys = [batch_key for batch_key, batch in self.batches.items()
+                          if force or now - batch.creation_time >= self.max_batch_age]
+            batches = [self.batches.pop(batch_key) for batch_key in batch_keys]
+        for batch in batches:
+            self.upload_batch(batch)
+
+    def upload_batch(self, batch: OrdersBatch) -> None:
+        with self.lock:
+            self.batch_sequence += 1
+            batch_sequence = self.batch_sequence
+        batch_name = f'{batch.folder}{batch.hour:02}_{self.instance_id}_{batch_sequence:06}'
+        batch_content = b''.join(batch.lines)
+        index_content = json.dumps({"batch": batch_name + ORDERS_BATCH_SUFFIX, "records": batch.index}).encode()
+        if batch.journal_path is None:
+            self.blob_uploader.enqueue(batch_name + ORDERS_BATCH_SUFFIX, batch_content)
+            self.blob_uploader.enqueue(batch_name + ORDERS_BATCH_INDEX_SUFFIX, index_content)
+        else:
+            self.close_journal(batch)
+            on_spooled = partial(self.on_batch_blob_spooled, batch)
+            self.blob_uploader.enqueue(batch_name + ORDERS_BATCH_SUFFIX, batch_content, on_spooled=on_spooled)
+            self.blob_uploader.enqueue(batch_name + ORDERS_BATCH_INDEX_SUFFIX, index_content, on_spooled=on_spooled)
+        self.flushed_batches_count += 1
+        self.logger.info(f'Orders of {len(batch.index)} seats archived in "{batch_name}{ORDERS_BATCH_SUFFIX}"')
@@ -0,0 +1,23 @@
+import csv
+import io
+from typing import List
+
+ORDERS_ENCODING = 'utf-8'
+ORDERS_LINE_TERMINATOR = '\r\n'
+
+
+def encode_orders(zones: List[List]) -> bytes:
+    """
+    Serialize the orders in the csv format sent to the robot.
+
+    The same bytes are written to every sink (robot FTP, mounting mode and blob storage): comma separated values,
+    minimal quoting, None written as an empty field and "\\r\\n" line endings.
+
+    :param zones: List[List]: orders rows, the first one holds the program and serial numbers
+    :return: bytes: encoded orders
+    """
+    orders_buffer = io.StringIO(newline='')
+    writer = csv.writer(orders_buffer, lineterminator=ORDERS_LINE_TERMINATOR)
+    writer.writerows(zones)
+    return orders_buffer.getvalue().encode(ORDERS_ENCODING)
+
@@ -0,0 +1,98 @@
+import json
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FULL_OUTPUT_FORMAT = 'json'
+COMPACT_OUTPUT_FORMAT = 'compact'
+MSGPACK_OUTPUT_FORMAT = 'msgpack'
+OUTPUT_FORMATS = (FULL_OUTPUT_FORMAT, COMPACT_OUTPUT_FORMAT, MSGPACK_OUTPUT_FORMAT)
+OUTPUT_FORMAT_HEADER = 'output_format'
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+
+EncodedOutput = namedtuple('EncodedOutput', ['body', 'content_type', 'output_format'])
+
+
+def get_available_output_format(output_format: Optional[str], default_output_format: str) -> str:
+    """
+    Output format asked for, the default one when it is unknown, compact json when msgpack is not installed
+    """
+    if output_format not in OUTPUT_FORMATS:
+        output_format = default_output_format
+    if output_format == MSGPACK_OUTPUT_FORMAT and msgpack is None:
+        return COMPACT_OUTPUT_FORMAT
+    return output_format
+
+
+def get_columnar_sequence_record(steaming_sequence_record: List[Dict]) -> Dict[str, List]:
+    """
+    Turn the list of zone records into one list of values per key, so that the keys are written once
+    """
+    columns = {}
+    for record_number, time_zone_record in enumerate(steaming_sequence_record):
+        for key, value in time_zone_record.items():
+            columns.setdefault(key, [None] * record_number).append(value)
+        for key, column in columns.items():
+            if len(column) == record_number:
+                column.append(None)
+    return columns
+
+
+def get_decision_message(message: Dict, robot_decision_result: Dict) -> Dict:
+    """
+    Robot decision referencing the seat by its pipeline id instead of echoing the input message
+    """
+    metadata = message.get("metadata", {})
+    decisions = {}
+    for decision_name, decision in robot_decision_result.items():
+        decision = dict(decision)
+        if 'steaming_sequence_record' in decision:
+            decision['steaming_sequence_record'] = get_columnar_sequence_record(decision['steaming_sequence_record'])
+        decisions[decision_name] = decision
+
+    return {"pipeline_id": metadata.get("pipeline_id"),
+            "serial_number": metadata.get("serial_number"),
+            "decisions": decisions}
+
+
+def encode_decision_message(message: Dict, robot_decision_result: Dict, output_format: str) -> EncodedOutput:
+    decision_message = get_decision_message(message, robot_decision_result)
+    if output_format == MSGPACK_OUTPUT_FORMAT:
+        return EncodedOutput(msgpack.packb(decision_message), MSGPACK_CONTENT_TYPE, output_format)
+    if orjson is not None:
+        return EncodedOutput(orjson.dumps(decision_message), JSON_CONTENT_TYPE, output_format)
+    return EncodedOutput(json.dumps(decision_message, separators=(',', ':')).encode(), JSON_CONTENT_TYPE,
+                         output_format)
+
+
+def decode_output_message(body: bytes, content_type: Optional[str]) -> Dict:
+    """
+    Decode an output message of any format, by its content type: msgpack, or json for the full and compact formats
+
+    :raise ValueError: when the body cannot be decoded
+    """
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise ValueError('msgpack output message received but msgpack is not installed')
+        return msgpack.unpackb(body)
+    return json.loads(body)
+
+
+def get_output_pipeline_id(output_message: Dict) -> Optional[str]:
+    """
+    Pipeline id of the seat of an output message, in the metadata of a full message or at the top of a compact one
+    """
+    if "metadata" in output_message:
+        return output_message["metadata"].get("pipeline_id")
+    return output_message.get("pipeline_id")
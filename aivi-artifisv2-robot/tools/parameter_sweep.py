@@ -0,0 +1,337 @@
+"""
+Replay archived seats through the planner with other robot parameters, to evaluate a configuration change offline.
+
+The archive follows the blob storage layout raw/{country}_{plant}/{station}/{yyyy}/{mm}/{dd}/: wrinkle detector
+messages (json or json lines files) and the orders sent for them, one "{pipeline_id}_robot_orders.csv" blob per
+seat or "_robot_orders.jsonl" batches. It is read from
+local folders (a copy of the container) or from the blob container given by BLOB_STORAGE_CONNECTION_STRING:
+    python -m tools.parameter_sweep archive/raw/FR_P1 --cycle-time 44 48 52 --acceptance-threshold 2 3 \\
+        --zone-time-mapping new_zone_time_mapping.csv --workers 8 --output sweep.csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from abb_communication import PROGRAM_NUMBER_TO_NOT_STEAM, check_unknown_in_buckle_state_results, \
+    count_requested_zones, filter_out_steaming_zones_buckle_position_is_nok
+from tools import message_decoder
+from tools.artifis_file_reader import SeatTypeMaterialKey
+from tools.orders_archiver import ORDERS_BLOB_SUFFIX, ORDERS_BATCH_SUFFIX, ORDERS_BATCH_INDEX_SUFFIX
+from tools.robot_configuration import RobotConfiguration, get_configuration_files, load_robot_configuration, \
+    validate_robot_configuration
+from tools.trajectory_rules import TrajectoryRules
+
+DEFAULT_CONFIGURATION_PATH = Path(__file__).absolute().parent.parent / 'default_configuration'
+MESSAGE_FILE_SUFFIXES = ('.json', '.jsonl')
+
+ArchivedSeat = namedtuple('ArchivedSeat', ['pipeline_id',
+                                           'buckle_belt_result',
+                                           'wrinkles_result',
+                                           'wrinkles_succeed',
+                                           'serial_number',
+                                           'seat_info',
+                                           'recorded_zones_count'])
+SweepCombination = namedtuple('SweepCombination', ['zone_time_mapping',
+                                                   'cycle_time',
+                                                   'acceptance_threshold',
+                                                   'previous_transition_point'])
+
+REPORT_COLUMNS = ('zone_time_mapping', 'cycle_time', 'acceptance_threshold', 'previous_transition_point', 'seats',
+                  'planned_seats', 'unknown_seat_type_seats', 'failed_seats', 'zones_requested', 'zones_steamed',
+                  'zones_dropped', 'zones_unknown', 'steamed_zones_ratio', 'robot_utilization', 'recorded_seats',
+                  'recorded_zones_steamed', 'problems')
+
+logger = logging.getLogger('parameter_sweep')
+
+# set in each worker process by initialize_worker
+worker_archived_seats: List[ArchivedSeat] = []
+worker_configuration_path: Optional[Path] = None
+worker_configurations: Dict[Optional[str], RobotConfiguration] = {}
+
+
+def is_archive_file(file_name: str) -> bool:
+    return not file_name.endswith(ORDERS_BATCH_INDEX_SUFFIX) and \
+        (file_name.endswith(ORDERS_BLOB_SUFFIX) or os.path.splitext(file_name)[1] in MESSAGE_FILE_SUFFIXES)
+
+
+def iterate_local_archive_files(paths: List[Path]) -> Iterator[Tuple[str, bytes]]:
+    for path in paths:
+        file_paths = sorted(file_path for file_path in path.rglob('*') if file_path.is_file()) \
+            if path.is_dir() else [path]
+        for file_path in file_paths:
+            if is_archive_file(file_path.name):
+                yield file_path.name, file_path.read_bytes()
+
+
+def iterate_blob_archive_files(connection_string: str, container_name: str, prefix: str) \
+        -> Iterator[Tuple[str, bytes]]:
+    from azure.storage.blob import ContainerClient
+
+    container_client = ContainerClient.from_connection_string(conn_str=connection_string,
+                                                              container_name=container_name)
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        blob_name = blob.name.rsplit('/', 1)[-1]
+        if is_archive_file(blob_name):
+            yield blob_name, container_client.download_blob(blob.name).readall()
+
+
+def get_orders_zones_count(orders: bytes) -> int:
+    return max(len(orders.splitlines()) - 1, 0)
+
+
+def read_archived_seats(archive_files: Iterator[Tuple[str, bytes]]) -> List[ArchivedSeat]:
+    """
+    Decode the archived messages, once per pipeline id, and attach to each seat the number of zones of its archived
+    orders when they are there
+    """
+    decoded_messages = []
+    recorded_zones_counts = {}
+    invalid_messages_count = 0
+    for file_name, content in archive_files:
+        if file_name.endswith(ORDERS_BLOB_SUFFIX):
+            recorded_zones_counts[file_name[:-len(ORDERS_BLOB_SUFFIX)]] = get_orders_zones_count(content)
+            continue
+        if file_name.endswith(ORDERS_BATCH_SUFFIX):
+            for line in content.splitlines():
+                if line.strip():
+                    orders_record = json.loads(line)
+                    recorded_zones_counts[orders_record["pipeline_id"]] = \
+                        get_orders_zones_count(orders_record["orders"].encode())
+            continue
+        bodies = [line for line in content.splitlines() if line.strip()] if file_name.endswith('.jsonl') \
+            else [content]
+        for body in bodies:
+            try:
+                decoded_messages.append(message_decoder.decode_input_message(body))
+            except message_decoder.InvalidInputMessage as e:
+                invalid_messages_count += 1
+                logger.debug(f'Archived message of "{file_name}" skipped - {e}')
+
+    if invalid_messages_count:
+        logger.warning(f'{invalid_messages_count} archived messages are not wrinkle detector messages, skipped')
+
+    archived_seats = []
+    pipeline_ids = set()
+    for decoded_message in decoded_messages:
+        pipeline_id = decoded_message.message["metadata"].get("pipeline_id")
+        if pipeline_id is not None:
+            if pipeline_id in pipeline_ids:
+                continue
+            pipeline_ids.add(pipeline_id)
+        archived_seats.append(ArchivedSeat(pipeline_id=pipeline_id,
+                                           buckle_belt_result=decoded_message.buckle_belt_result,
+                                           wrinkles_result=decoded_message.wrinkles_result or {},
+                                           wrinkles_succeed=decoded_message.wrinkles_succeed,
+                                           serial_number=decoded_message.serial_number,
+                                           seat_info=decoded_message.seat_info,
+                                           recorded_zones_count=recorded_zones_counts.get(pipeline_id)))
+    return archived_seats
+
+
+def get_sweep_combinations(zone_time_mappings: List[Optional[str]], cycle_times: List[Optional[float]],
+                           acceptance_thresholds: List[Optional[int]],
+                           previous_transition_points: List[Optional[str]]) -> List[SweepCombination]:
+    """
+    Every combination of the swept values, None standing for the value of the configuration
+    """
+    return [SweepCombination(*values) for values in itertools.product(zone_time_mappings or [None],
+                                                                      cycle_times or [None],
+                                                                      acceptance_thresholds or [None],
+                                                                      previous_transition_points or [None])]
+
+
+def initialize_worker(archived_seats: List[ArchivedSeat], configuration_path: Path, log_level: int) -> None:
+    global worker_archived_seats, worker_configuration_path
+    logging.basicConfig(level=log_level)
+    worker_archived_seats = archived_seats
+    worker_configuration_path = configuration_path
+
+
+def get_worker_configuration(zone_time_mapping: Optional[str]) -> RobotConfiguration:
+    """
+    Configuration of the configuration folder, with another zone time mapping file when one is given. Loaded once
+    per worker process.
+    """
+    if zone_time_mapping not in worker_configurations:
+        zone_time_mapping_file_path, transition_time_table_file_path, robot_module_configuration_file_path = \
+            get_configuration_files(logger, DEFAULT_CONFIGURATION_PATH, worker_configuration_path)
+        worker_configurations[zone_time_mapping] = load_robot_configuration(
+            logger, zone_time_mapping or zone_time_mapping_file_path, transition_time_table_file_path,
+            robot_module_configuration_file_path)
+    return worker_configurations[zone_time_mapping]
+
+
+def get_combination_configuration(combination: SweepCombination) -> RobotConfiguration:
+    configuration = get_worker_configuration(combination.zone_time_mapping)
+    overridden_values = {name: value for name, value in (('cycle_time', combination.cycle_time),
+                                                         ('acceptance_threshold', combination.acceptance_threshold),
+                                                         ('previous_transition_point',
+                                                          combination.previous_transition_point))
+                         if value is not None}
+    return configuration._replace(**overridden_values)
+
+
+def simulate_combination(combination: SweepCombination) -> Dict:
+    """
+    Plan the archived seats as the module would with the parameters of the combination, without the decision cache
+    """
+    configuration = get_combination_configuration(combination)
+    report = {'zone_time_mapping': combination.zone_time_mapping or 'configuration',
+              'cycle_time': configuration.cycle_time,
+              'acceptance_threshold': configuration.acceptance_threshold,
+              'previous_transition_point': configuration.previous_transition_point,
+              'seats': len(worker_archived_seats),
+              'planned_seats': 0, 'unknown_seat_type_seats': 0, 'failed_seats': 0, 'zones_requested': 0,
+              'zones_steamed': 0, 'zones_dropped': 0, 'zones_unknown': 0, 'steamed_zones_ratio': 0.0,
+              'robot_utilization': 0.0, 'recorded_seats': 0, 'recorded_zones_steamed': 0,
+              'problems': '; '.join(validate_robot_configuration(configuration))}
+    if report['problems']:
+        return report
+
+    trajectory_rules_per_seat_type = {}
+    working_time = 0.0
+    for archived_seat in worker_archived_seats:
+        seat_info = archived_seat.seat_info
+        if not seat_info or not archived_seat.wrinkles_succeed:
+            continue
+        try:
+            program_number = seat_info['program_number']
+            predicted_wrinkles = archived_seat.wrinkles_result
+            buckle_belt_result = archived_seat.buckle_belt_result
+            if buckle_belt_result:
+                if check_unknown_in_buckle_state_results(buckle_belt_result):
+                    continue
+                predicted_wrinkles = filter_out_steaming_zones_buckle_position_is_nok(
+                    predicted_wrinkles, buckle_belt_result, configuration.zones_not_to_steam_from_buckle_detection)
+            if int(program_number) == PROGRAM_NUMBER_TO_NOT_STEAM:
+                continue
+
+            seat_type = SeatTypeMaterialKey(seat_info['plant_project'], seat_info['cover_material'])
+            if seat_type not in configuration.seat_profiles:
+                report['unknown_seat_type_seats'] += 1
+                continue
+            if seat_type not in trajectory_rules_per_seat_type:
+                trajectory_rules_per_seat_type[seat_type] = TrajectoryRules(
+                    seat_profiles=configuration.seat_profiles, plant_project=seat_type.plant_project,
+                    acceptance_threshold=configuration.acceptance_threshold, cover_material=seat_type.cover_material)
+            trajectory_rules = trajectory_rules_per_seat_type[seat_type]
+            _, steaming_sequence_record, theoretical_working_time = \
+                trajectory_rules.define_zones_to_steam_in_abb_format_according_to_available_time(
+                    predicted_wrinkles=predicted_wrinkles, transition_time_table=configuration.transition_time_table,
+                    cycle_time=configuration.cycle_time,
+                    previous_transition_point=configuration.previous_transition_point,
+                    cumulated_time=configuration.cumulated_time, serial_number=archived_seat.serial_number,
+                    program_number=program_number, planner=configuration.planner,
+                    planner_time_budget=configuration.planner_time_budget,
+                    route_optimization=configuration.route_optimization,
+                    precedence_constraints=configuration.precedence_constraints)
+            zones_requested, zones_unknown = count_requested_zones(configuration, seat_type.plant_project,
+                                                                   seat_type.cover_material, predicted_wrinkles)
+
+        except Exception as e:
+            report['failed_seats'] += 1
+            logger.debug(f'Seat "{archived_seat.serial_number}" not planned - {type(e).__name__}: {e}')
+            continue
+
+        report['planned_seats'] += 1
+        report['zones_requested'] += zones_requested
+        report['zones_unknown'] += zones_unknown
+        report['zones_steamed'] += len(steaming_sequence_record)
+        working_time += theoretical_working_time
+        if archived_seat.recorded_zones_count is not None:
+            report['recorded_seats'] += 1
+            report['recorded_zones_steamed'] += archived_seat.recorded_zones_count
+
+    report['zones_dropped'] = max(report['zones_requested'] - report['zones_steamed'], 0)
+    if report['zones_requested']:
+        report['steamed_zones_ratio'] = round(report['zones_steamed'] / report['zones_requested'], 4)
+    if report['planned_seats']:
+        report['robot_utilization'] = round(working_time / (report['planned_seats'] * configuration.cycle_time), 4)
+    return report
+
+
+def run_parameter_sweep(archived_seats: List[ArchivedSeat], combinations: List[SweepCombination],
+                        configuration_path: Path, workers: Optional[int] = None) -> List[Dict]:
+    with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                             initargs=(archived_seats, configuration_path, logging.WARNING)) as executor:
+        return list(executor.map(simulate_combination, combinations))
+
+
+def write_report(reports: List[Dict], output_path: Path) -> None:
+    if output_path.suffix == '.csv':
+        with output_path.open('w', newline='') as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(reports)
+    else:
+        output_path.write_text(json.dumps(reports, indent=4))
+
+
+def print_report(reports: List[Dict]) -> None:
+    print(f'{"zone_time_mapping":<30} {"cycle":>6} {"thr":>4} {"start":>8} {"planned":>8} {"steamed":>8} '
+          f'{"dropped":>8} {"ratio":>6} {"use":>6}')
+    for report in reports:
+        if report['problems']:
+            print(f'{Path(report["zone_time_mapping"]).name:<30} {report["cycle_time"]:>6} '
+                  f'{report["acceptance_threshold"]:>4} {report["previous_transition_point"]:>8} '
+                  f'rejected - {report["problems"]}')
+            continue
+        print(f'{Path(report["zone_time_mapping"]).name:<30} {report["cycle_time"]:>6} '
+              f'{report["acceptance_threshold"]:>4} {report["previous_transition_point"]:>8} '
+              f'{report["planned_seats"]:>8} {report["zones_steamed"]:>8} {report["zones_dropped"]:>8} '
+              f'{report["steamed_zones_ratio"]:>6.1%} {report["robot_utilization"]:>6.1%}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay archived seats through the planner with other parameters')
+    parser.add_argument('archive', type=Path, nargs='*',
+                        help='archived messages and orders, files or folders in the blob storage layout')
+    parser.add_argument('--container', help='read the archive from this blob container instead, with the '
+                                            'BLOB_STORAGE_CONNECTION_STRING environment variable')
+    parser.add_argument('--prefix', default='raw/', help='blob name prefix, e.g. raw/FR_P1/STATION/2024/05/')
+    parser.add_argument('--configuration', type=Path, default=DEFAULT_CONFIGURATION_PATH,
+                        help='configuration folder, the default configuration completes its missing files')
+    parser.add_argument('--zone-time-mapping', nargs='+', default=[],
+                        help='zone time mapping files to compare, the one of the configuration by default')
+    parser.add_argument('--cycle-time', type=float, nargs='+', default=[])
+    parser.add_argument('--acceptance-threshold', type=int, nargs='+', default=[])
+    parser.add_argument('--previous-transition-point', nargs='+', default=[])
+    parser.add_argument('--workers', type=int, help='worker processes, one per CPU by default')
+    parser.add_argument('--output', type=Path, help='csv or json file where the report is written')
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if arguments.container:
+        archive_files = iterate_blob_archive_files(os.environ["BLOB_STORAGE_CONNECTION_STRING"],
+                                                   arguments.container, arguments.prefix)
+    elif arguments.archive:
+        archive_files = iterate_local_archive_files(arguments.archive)
+    else:
+        parser.error('give archive folders or a --container')
+
+    tic = time.perf_counter()
+    archived_seats = read_archived_seats(archive_files)
+    if not archived_seats:
+        parser.error('no archived message found')
+    combinations = get_sweep_combinations([Path(path).absolute().as_posix() for path in arguments.zone_time_mapping],
+                                          arguments.cycle_time, arguments.acceptance_threshold,
+                                          arguments.previous_transition_point)
+    print(f'{len(archived_seats)} archived seats, {len(combinations)} combinations')
+
+    reports = run_parameter_sweep(archived_seats, combinations, arguments.configuration, arguments.workers)
+    print_report(reports)
+    print(f'Done in {time.perf_counter() - tic:0.1f} seconds')
+    if arguments.output:
+        write_report(reports, arguments.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Replay recorded wrinkle detector messages to the robot module and measure its throughput and latency.
+
+The recorded messages are json files or json lines files. Each replayed seat gets a new serial number and pipeline id
+so that its output message can be matched:
+    python -m tools.replay_traffic recorded_messages.jsonl --mode rate --rate 20 --seats 2000 --stations 8
+"""
+import argparse
+import copy
+import datetime
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pika
+
+from tools.output_encoder import decode_output_message, get_output_pipeline_id
+
+ORIGINAL_TIMING_MODE = 'original'
+FIXED_RATE_MODE = 'rate'
+MAX_SPEED_MODE = 'max'
+REPLAY_MODES = (ORIGINAL_TIMING_MODE, FIXED_RATE_MODE, MAX_SPEED_MODE)
+
+
+def read_recorded_messages(paths: List[Path]) -> List[Dict]:
+    recorded_messages = []
+    for path in paths:
+        files = sorted(path.glob('*.json*')) if path.is_dir() else [path]
+        for file_path in files:
+            if file_path.suffix == '.jsonl':
+                recorded_messages.extend(json.loads(line) for line in file_path.read_text().splitlines()
+                                         if line.strip())
+            else:
+                recorded_messages.append(json.loads(file_path.read_text()))
+    return recorded_messages
+
+
+def get_trigger_time(message: Dict) -> Optional[float]:
+    try:
+        return datetime.datetime.fromisoformat(message["metadata"]["trigger_time"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_send_delays(recorded_messages: List[Dict], seats_count: int, mode: str, rate: float, speed: float) \
+        -> List[float]:
+    """
+    Delay of each seat from the start of the replay. In original timing mode, the recorded messages are expected in
+    trigger time order and each new pass on them starts one average gap after the previous one.
+    """
+    if mode == MAX_SPEED_MODE:
+        return [0.0] * seats_count
+    if mode == FIXED_RATE_MODE:
+        return [seat_number / rate for seat_number in range(seats_count)]
+
+    trigger_times = [get_trigger_time(message) for message in recorded_messages]
+    if None in trigger_times:
+        raise ValueError('Original timing replay needs a "metadata.trigger_time" in every recorded message')
+    recorded_delays = [max(trigger_time - trigger_times[0], 0.0) for trigger_time in trigger_times]
+    pass_duration = recorded_delays[-1] + (recorded_delays[-1] / (len(recorded_delays) - 1)
+                                           if len(recorded_delays) > 1 else 1.0)
+    return [(seat_number // len(recorded_delays) * pass_duration + recorded_delays[seat_number % len(recorded_delays)])
+            / speed for seat_number in range(seats_count)]
+
+
+def generate_seats(recorded_messages: List[Dict], seats_count: int, stations_count: int, run_id: str) \
+        -> Iterator[Dict]:
+    """
+    Cycle on the recorded messages, each seat gets its own serial number and pipeline id, and is given one of
+    "stations_count" station ids when it is set
+    """
+    for seat_number in range(seats_count):
+        message = copy.deepcopy(recorded_messages[seat_number % len(recorded_messages)])
+        metadata = message.setdefault("metadata", {})
+        station_info = metadata.setdefault("station_info", {})
+        if stations_count:
+            station_info["station_full_id"] = f'REPLAYSTATION{seat_number % stations_count + 1}'
+        serial_number = f'R{seat_number:07}'
+        metadata["serial_number"] = serial_number
+        metadata["pipeline_id"] = f'{station_info.get("station_full_id", "REPLAY")}_{serial_number}_{run_id}'
+        yield message
+
+
+def get_percentile(sorted_values: List[float], percentile: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))]
+
+
+class OutputCollector(threading.Thread):
+    """
+    Consume the module output messages on a connection of its own and record the arrival time of the replayed seats
+    by pipeline id, whatever their output format
+    """
+
+    def __init__(self, amqp_host: str, output_exchange: str, output_routing_key: str, run_id: str):
+        super().__init__(name='output-collector', daemon=True)
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(host=amqp_host))
+        self.channel = self.connection.channel()
+        self.channel.exchange_declare(exchange=output_exchange, exchange_type='topic')
+        self.queue = self.channel.queue_declare(queue='', exclusive=True).method.queue
+        self.channel.queue_bind(exchange=output_exchange, queue=self.queue, routing_key=output_routing_key)
+        self.channel.basic_consume(queue=self.queue, on_message_callback=self.on_output_message, auto_ack=True)
+        self.run_id = run_id
+        self.arrival_times: Dict[str, float] = {}
+        self.undecodable_count = 0
+        self.lock = threading.Lock()
+
+    def on_output_message(self, channel, method, properties, body):
+        arrival_time = time.perf_counter()
+        try:
+            pipeline_id = get_output_pipeline_id(decode_output_message(body, properties.content_type))
+        except (ValueError, TypeError, AttributeError):
+            self.undecodable_count += 1
+            return
+        if not str(pipeline_id).endswith(self.run_id):
+            return
+        with self.lock:
+            self.arrival_times.setdefault(pipeline_id, arrival_time)
+
+    def get_received_count(self) -> int:
+        with self.lock:
+            return len(self.arrival_times)
+
+    def run(self):
+        self.channel.start_consuming()
+
+    def stop(self):
+        self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+        self.join(timeout=5)
+
+
+def replay_traffic(recorded_messages: List[Dict], amqp_host: str, input_exchange: str, input_routing_key: str,
+                   output_exchange: str, output_routing_key: str, mode: str, rate: float, speed: float,
+                   seats_count: int, stations_count: int, drain_timeout: float) -> Dict:
+    run_id = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    seats = list(generate_seats(recorded_messages, seats_count, stations_count, run_id))
+    send_delays = get_send_delays(recorded_messages, seats_count, mode, rate, speed)
+
+    output_collector = OutputCollector(amqp_host, output_exchange, output_routing_key, run_id)
+    output_collector.start()
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=amqp_host))
+    channel = connection.channel()
+    channel.exchange_declare(exchange=input_exchange, exchange_type='topic')
+
+    send_times = {}
+    start_time = time.perf_counter()
+    for seat, send_delay in zip(seats, send_delays):
+        waiting_time = start_time + send_delay - time.perf_counter()
+        if waiting_time > 0:
+            connection.sleep(waiting_time)
+        send_times[seat["metadata"]["pipeline_id"]] = time.perf_counter()
+        channel.basic_publish(exchange=input_exchange, routing_key=input_routing_key, body=json.dumps(seat))
+    sending_end_time = time.perf_counter()
+
+    drain_deadline = time.perf_counter() + drain_timeout
+    while output_collector.get_received_count() < len(seats) and time.perf_counter() < drain_deadline:
+        connection.sleep(0.1)
+    connection.close()
+    output_collector.stop()
+
+    with output_collector.lock:
+        arrival_times = dict(output_collector.arrival_times)
+    latencies = sorted(arrival_times[pipeline_id] - send_time for pipeline_id, send_time in send_times.items()
+                       if pipeline_id in arrival_times)
+    last_arrival_time = max(arrival_times.values(), default=sending_end_time)
+
+    report = {'mode': mode,
+              'stations': stations_count,
+              'sent': len(seats),
+              'received': len(latencies),
+              'lost': len(seats) - len(latencies),
+              'undecodable': output_collector.undecodable_count,
+              'sending_rate': len(seats) / max(sending_end_time - start_time, 1e-9),
+              'throughput': len(latencies) / max(last_arrival_time - start_time, 1e-9)}
+    if latencies:
+        report.update({'latency_p50': get_percentile(latencies, 50),
+                       'latency_p95': get_percentile(latencies, 95),
+                       'latency_p99': get_percentile(latencies, 99),
+                       'latency_max': latencies[-1]})
+    return report
+
+
+def print_report(report: Dict) -> None:
+    print(f'{report["sent"]} seats sent at {report["sending_rate"]:0.2f} seats/s ({report["mode"]} mode, '
+          f'{report["stations"] or "recorded"} stations)')
+    print(f'{report["received"]} outputs received, {report["lost"]} missing, '
+          f'throughput {report["throughput"]:0.2f} seats/s')
+    if report['undecodable']:
+        print(f'{report["undecodable"]} output messages could not be decoded')
+    if report['received']:
+        print(f'End-to-end latency: p50 {report["latency_p50"] * 1000:0.1f} ms, '
+              f'p95 {report["latency_p95"] * 1000:0.1f} ms, p99 {report["latency_p99"] * 1000:0.1f} ms, '
+              f'max {report["latency_max"] * 1000:0.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded wrinkle detector messages to the robot module')
+    parser.add_argument('recorded_messages', type=Path, nargs='+',
+                        help='json or json lines files, or folders containing them')
+    parser.add_argument('--amqp-host', default='localhost')
+    parser.add_argument('--input-exchange', default='robot_input')
+    parser.add_argument('--input-routing-key', default='replay')
+    parser.add_argument('--output-exchange', default='robot_output')
+    parser.add_argument('--output-routing-key', default='#')
+    parser.add_argument('--mode', choices=REPLAY_MODES, default=MAX_SPEED_MODE,
+                        help='original: recorded trigger times, rate: fixed rate, max: as fast as possible')
+    parser.add_argument('--rate', type=float, default=10.0, help='seats per second in rate mode')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed-up factor in original mode')
+    parser.add_argument('--seats', type=int, help='seats to send, the recorded messages are cycled on '
+                                                  '(one pass by default)')
+    parser.add_argument('--stations', type=int, default=0,
+                        help='spread the seats over this number of station ids, recorded stations kept when 0')
+    parser.add_argument('--drain-timeout', type=float, default=30.0,
+                        help='seconds waited for the last outputs after sending')
+    parser.add_argument('--output', type=Path, help='json file where the report is written')
+    arguments = parser.parse_args()
+
+    recorded_messages = read_recorded_messages(arguments.recorded_messages)
+    if not recorded_messages:
+        parser.error('no recorded message found')
+
+    report = replay_traffic(recorded_messages, arguments.amqp_host, arguments.input_exchange,
+                            arguments.input_routing_key, arguments.output_exchange, arguments.output_routing_key,
+                            arguments.mode, arguments.rate, arguments.speed,
+                            arguments.seats or len(recorded_messages), arguments.stations, arguments.drain_timeout)
+    print_report(report)
+    if arguments.output:
+        arguments.output.write_text(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
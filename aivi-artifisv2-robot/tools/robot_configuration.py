@@ -0,0 +1,123 @@
+import logging
+import os
+from collections import namedtuple
+from pathlib import Path
+from typing import List, Tuple
+
+from tools.artifis_file_reader import get_zone_time_mapping_and_seat_profiles, get_transition_time, \
+    check_transition_points_zone_time_mapping_and_transition_time, intern_zone_transition_points
+from tools.file import load_data_from_json_file, get_configuration_version, InvalidConfigurationFile
+from tools.trajectory_rules import GREEDY_PLANNER, PLANNERS
+
+ZONE_TIME_MAPPING_FILE_NAME = 'zone_time_mapping.csv'
+TRANSITION_TIME_TABLE_FILE_NAME = 'transition_time_table.csv'
+ROBOT_MODULE_CONFIGURATION_FILE_NAME = 'robot_module_configuration.json'
+CONFIGURATION_FILE_NAMES = (ZONE_TIME_MAPPING_FILE_NAME, TRANSITION_TIME_TABLE_FILE_NAME,
+                            ROBOT_MODULE_CONFIGURATION_FILE_NAME)
+
+RIGHT_BUCKLE = 'right_buckle'
+CENTRAL_BUCKLE = 'central_buckle'
+LEFT_BUCKLE = 'left_buckle'
+
+RobotConfiguration = namedtuple('RobotConfiguration', ['version',
+                                                       'cycle_time',
+                                                       'previous_transition_point',
+                                                       'cumulated_time',
+                                                       'acceptance_threshold',
+                                                       'zones_not_to_steam_from_buckle_detection',
+                                                       'upload_ftp',
+                                                       'planner',
+                                                       'planner_time_budget',
+                                                       'route_optimization',
+                                                       'precedence_constraints',
+                                                       'zone_time_mapping',
+                                                       'seat_profiles',
+                                                       'transition_time_table',
+                                                       'transition_points_match'])
+
+
+def get_configuration_files(logger: logging.Logger, default_config_path: Path, requested_config_path: Path) \
+        -> Tuple[str, str, str]:
+    """
+    Take each configuration file from the requested configuration folder when it is there, from the default
+    configuration folder otherwise
+    """
+    configuration_file_paths = []
+    for file_name in CONFIGURATION_FILE_NAMES:
+        if os.path.isfile((requested_config_path / file_name).resolve().as_posix()):
+            logger.info(f'Requested configuration taken for "{file_name}"')
+            configuration_file_paths.append((requested_config_path / file_name).resolve().as_posix())
+        else:
+            logger.info(f'Default configuration taken for "{file_name}"')
+            configuration_file_paths.append((default_config_path / file_name).resolve().as_posix())
+
+    zone_time_mapping_file_path, transition_time_table_file_path, robot_module_configuration_file_path = \
+        configuration_file_paths
+    return zone_time_mapping_file_path, transition_time_table_file_path, robot_module_configuration_file_path
+
+
+def load_robot_configuration(logger: logging.Logger, zone_time_mapping_file_path: str,
+                             transition_time_table_file_path: str,
+                             robot_module_configuration_file_path: str) -> RobotConfiguration:
+    """
+    Parse the configuration files and compile them into an immutable RobotConfiguration
+
+    :raise InvalidConfigurationFile: when a file cannot be parsed or a mandatory key is missing
+    """
+    robot_configuration_dict = load_data_from_json_file(robot_module_configuration_file_path, logger)
+
+    try:
+        planner = robot_configuration_dict.get("planner", GREEDY_PLANNER)
+        if planner not in PLANNERS:
+            logger.warning(f'Unknown planner "{planner}", {GREEDY_PLANNER} planner used')
+            planner = GREEDY_PLANNER
+
+        zone_time_mapping, seat_profiles = get_zone_time_mapping_and_seat_profiles(zone_time_mapping_file_path)
+        transition_time_table = get_transition_time(transition_time_table_file_path,
+                                                    (value.transition_point for value in zone_time_mapping.values()))
+        intern_zone_transition_points(zone_time_mapping, transition_time_table)
+
+        return RobotConfiguration(
+            version=get_configuration_version([zone_time_mapping_file_path, transition_time_table_file_path,
+                                               robot_module_configuration_file_path]),
+            cycle_time=float(robot_configuration_dict["cycle_time"]),
+            previous_transition_point=robot_configuration_dict["previous_transition_point"],
+            cumulated_time=float(robot_configuration_dict["cumulated_time"]),
+            acceptance_threshold=int(robot_configuration_dict["acceptance_threshold"]),
+            zones_not_to_steam_from_buckle_detection={
+                LEFT_BUCKLE: robot_configuration_dict.get("left_buckle"),
+                CENTRAL_BUCKLE: robot_configuration_dict.get("central_buckle"),
+                RIGHT_BUCKLE: robot_configuration_dict.get("right_buckle")},
+            upload_ftp=robot_configuration_dict["upload_ftp"],
+            planner=planner,
+            planner_time_budget=float(robot_configuration_dict.get("planner_time_budget_ms", 50)) / 1000,
+            route_optimization=robot_configuration_dict.get("route_optimization", False),
+            precedence_constraints=tuple((int(before), int(after)) for before, after in
+                                         robot_configuration_dict.get("precedence_constraints", [])),
+            zone_time_mapping=zone_time_mapping,
+            seat_profiles=seat_profiles,
+            transition_time_table=transition_time_table,
+            transition_points_match=check_transition_points_zone_time_mapping_and_transition_time(
+                zone_time_mapping, transition_time_table))
+
+    except (KeyError, ValueError, TypeError) as e:
+        log_message = f'Invalid robot configuration - {type(e).__name__}: {e}'
+        logger.error(log_message)
+        raise InvalidConfigurationFile(log_message)
+
+
+def validate_robot_configuration(robot_configuration: RobotConfiguration) -> List[str]:
+    """
+    Return the inconsistencies found in a compiled configuration, an empty list when it can be used
+    """
+    problems = []
+    if not robot_configuration.zone_time_mapping:
+        problems.append('zone_time_mapping file is empty')
+    if not robot_configuration.transition_points_match:
+        problems.append("Zone_time_mapping file doesn't match with the transition_time file")
+    if robot_configuration.previous_transition_point not in robot_configuration.transition_time_table.origin_points:
+        problems.append(f'previous_transition_point "{robot_configuration.previous_transition_point}" '
+                        f'is not in the transition_time file')
+    if robot_configuration.cycle_time <= 0:
+        problems.append(f'cycle_time {robot_configuration.cycle_time} is not positive')
+    return problems
@@ -0,0 +1,158 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tools.artifis_file_reader import TransitionTimeTable
+
+# every transition point of the robot, 2^11 * 11^2 steps take about 20 ms
+ROUTE_EXACT_SEARCH_MAX_TRANSITION_POINTS = 11
+
+
+def get_route_transition_time(transition_points: Sequence[int], transition_time: TransitionTimeTable,
+                              start_transition_point: int) -> float:
+    route_transition_time = 0.0
+    previous_transition_point = start_transition_point
+    for transition_point in transition_points:
+        route_transition_time += transition_time.get_time(previous_transition_point, transition_point)
+        previous_transition_point = transition_point
+    return route_transition_time
+
+
+def sort_topologically(members: List[int], precedences: List[Tuple[int, int]]) -> Optional[List[int]]:
+    """
+    Order the members so that every (before, after) precedence is respected, keeping the given order otherwise.
+    Return None when the precedences are cyclic.
+    """
+    remaining = list(members)
+    ordered_members = []
+    while remaining:
+        for member in remaining:
+            if not any(after == member and before in remaining for before, after in precedences):
+                ordered_members.append(member)
+                remaining.remove(member)
+                break
+        else:
+            return None
+    return ordered_members
+
+
+def search_shortest_route(transition_time_matrix: List[List[float]], start_transition_times: List[float],
+                          predecessors_masks: List[int]) -> Optional[List[int]]:
+    """
+    Held-Karp search of the order visiting every transition point once with the lowest transition time, starting
+    from the robot position and without returning to it. A transition point can only be visited once all the
+    transition points of its predecessors mask have been visited.
+    """
+    points_count = len(start_transition_times)
+    full_mask = (1 << points_count) - 1
+    costs = [[math.inf] * points_count for _ in range(full_mask + 1)]
+    parents = [[-1] * points_count for _ in range(full_mask + 1)]
+
+    for point in range(points_count):
+        if predecessors_masks[point] == 0:
+            costs[1 << point][point] = start_transition_times[point]
+
+    for mask in range(1, full_mask + 1):
+        next_points = [(next_point, mask | (1 << next_point)) for next_point in range(points_count)
+                       if not mask & (1 << next_point) and not predecessors_masks[next_point] & ~mask]
+        if not next_points:
+            continue
+        mask_costs = costs[mask]
+        for last_point in range(points_count):
+            cost = mask_costs[last_point]
+            if cost == math.inf:
+                continue
+            last_point_transition_times = transition_time_matrix[last_point]
+            for next_point, next_mask in next_points:
+                next_cost = cost + last_point_transition_times[next_point]
+                next_mask_costs = costs[next_mask]
+                if next_cost < next_mask_costs[next_point]:
+                    next_mask_costs[next_point] = next_cost
+                    parents[next_mask][next_point] = last_point
+
+    last_point = min(range(points_count), key=lambda point: costs[full_mask][point])
+    if costs[full_mask][last_point] == math.inf:
+        return None
+
+    route = []
+    mask = full_mask
+    while last_point != -1:
+        route.append(last_point)
+        mask, last_point = mask & ~(1 << last_point), parents[mask][last_point]
+    route.reverse()
+    return route
+
+
+def search_nearest_neighbour_route(transition_time_matrix: List[List[float]], start_transition_times: List[float],
+                                   predecessors_masks: List[int]) -> Optional[List[int]]:
+    points_count = len(start_transition_times)
+    route = []
+    visited_mask = 0
+    current_transition_times = start_transition_times
+    for _ in range(points_count):
+        available_points = [point for point in range(points_count)
+                            if not visited_mask & (1 << point) and not predecessors_masks[point] & ~visited_mask]
+        if not available_points:
+            return None
+        next_point = min(available_points, key=lambda point: current_transition_times[point])
+        route.append(next_point)
+        visited_mask |= 1 << next_point
+        current_transition_times = transition_time_matrix[next_point]
+    return route
+
+
+def optimize_route(transition_points: List[int], transition_time: TransitionTimeTable,
+                   start_transition_point: int, precedences: List[Tuple[int, int]]) -> Optional[List[int]]:
+    """
+    Reorder zones to lower the total transition time of the robot.
+
+    The zones sharing a transition point are steamed together, in their given order. The groups are ordered with an
+    exact search up to ROUTE_EXACT_SEARCH_MAX_TRANSITION_POINTS transition points, with a nearest neighbour heuristic
+    above.
+
+    :param transition_points: List[int]: transition point index of each zone, in priority order
+    :param transition_time: TransitionTimeTable: transition time table
+    :param start_transition_point: int: index of the position of the robot before the first zone
+    :param precedences: List[Tuple[int, int]]: (before, after) indexes of zones that must keep this relative order
+    :return: Optional[List[int]]: zone indexes in route order, None when the precedences cannot be satisfied
+    """
+    if not transition_points:
+        return []
+
+    members_per_transition_point: Dict[int, List[int]] = {}
+    for zone_index, transition_point in enumerate(transition_points):
+        members_per_transition_point.setdefault(transition_point, []).append(zone_index)
+
+    group_transition_points = list(members_per_transition_point)
+    group_per_transition_point = {transition_point: group
+                                  for group, transition_point in enumerate(group_transition_points)}
+    predecessors_masks = [0] * len(group_transition_points)
+    inner_precedences: Dict[int, List[Tuple[int, int]]] = {}
+    for before, after in precedences:
+        before_group = group_per_transition_point[transition_points[before]]
+        after_group = group_per_transition_point[transition_points[after]]
+        if before_group == after_group:
+            inner_precedences.setdefault(before_group, []).append((before, after))
+        else:
+            predecessors_masks[after_group] |= 1 << before_group
+
+    ordered_members_per_group = []
+    for group, transition_point in enumerate(group_transition_points):
+        ordered_members = sort_topologically(members_per_transition_point[transition_point],
+                                             inner_precedences.get(group, []))
+        if ordered_members is None:
+            return None
+        ordered_members_per_group.append(ordered_members)
+
+    transition_time_matrix = [[transition_time.get_time(from_point, to_point) for to_point in group_transition_points]
+                              for from_point in group_transition_points]
+    start_transition_times = [transition_time.get_time(start_transition_point, to_point)
+                              for to_point in group_transition_points]
+
+    if len(group_transition_points) <= ROUTE_EXACT_SEARCH_MAX_TRANSITION_POINTS:
+        route = search_shortest_route(transition_time_matrix, start_transition_times, predecessors_masks)
+    else:
+        route = search_nearest_neighbour_route(transition_time_matrix, start_transition_times, predecessors_masks)
+
+    if route is None:
+        return None
+    return [zone_index for group in route for zone_index in ordered_members_per_group[group]]
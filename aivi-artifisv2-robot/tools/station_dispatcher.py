@@ -0,0 +1,70 @@
+import zlib
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Union
+
+from tools.file import read_resource_csv
+
+StationDescriptor = namedtuple('StationDescriptor', ['station_full_id',
+                                                     'robot_ip_address',
+                                                     'robot_port',
+                                                     'ftp_user',
+                                                     'ftp_password',
+                                                     'server_output_directory',
+                                                     'configuration_directory'])
+
+
+def get_station_table(station_table_file_path: Union[str, Path], default_output_directory: str = '') \
+        -> Dict[str, StationDescriptor]:
+    """
+    Read the station table, one row per station with its robot FTP access and, optionally, the folder of its
+    requested configuration
+    """
+    station_table: Dict[str, StationDescriptor] = {}
+    for row in read_resource_csv(station_table_file_path):
+        station_table[row['station_full_id']] = StationDescriptor(
+            station_full_id=row['station_full_id'],
+            robot_ip_address=row['robot_ip_address'],
+            robot_port=int(row.get('robot_port') or 21),
+            ftp_user=row.get('ftp_user', ''),
+            ftp_password=row.get('ftp_password', ''),
+            server_output_directory=row.get('server_output_directory') or default_output_directory,
+            configuration_directory=row.get('configuration_directory') or None)
+    return station_table
+
+
+class StationDispatcher:
+    """
+    Run the seats of the different stations in parallel while keeping the seats of a station in arrival order.
+
+    Each station is always sent to the same single-threaded executor. The stations of the station table are spread
+    over the executors by table order, so that each one has its own executor when there are as many workers as
+    stations; the stations missing from the table are sent to an executor chosen from a stable hash of their id.
+    """
+
+    def __init__(self, logger, workers: int, station_ids: Iterable[str] = ()):
+        self.logger = logger
+        self.executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'station-worker-{worker_number}')
+                          for worker_number in range(max(workers, 1))]
+        self.station_executors = {station_id: self.executors[station_index % len(self.executors)]
+                                  for station_index, station_id in enumerate(station_ids)}
+
+    def get_executor(self, station_id: str) -> ThreadPoolExecutor:
+        executor = self.station_executors.get(station_id)
+        if executor is None:
+            executor = self.executors[zlib.crc32(str(station_id).encode()) % len(self.executors)]
+        return executor
+
+    def submit(self, station_id: str, function: Callable, *args) -> Future:
+        return self.get_executor(station_id).submit(self.run_safely, station_id, function, *args)
+
+    def run_safely(self, station_id: str, function: Callable, *args):
+        try:
+            return function(*args)
+        except Exception:
+            self.logger.exception(f'Seat of station "{station_id}" failed')
+
+    def stop(self) -> None:
+        for executor in self.executors:
+            executor.shutdown(wait=True)
@@ -1,10 +1,13 @@
 import logging
+import time
 
 from collections import namedtuple
-from typing import List, Dict
-from tools.artifis_file_reader import ZoneDescriptorKey, TransitionDescriptor, ZoneDescriptorValue
+from typing import List, Dict, Optional, Tuple
+from tools.artifis_file_reader import ZoneDescriptorKey, SeatProfile, SeatTypeMaterialKey, TransitionTimeTable
+from tools.route_optimizer import optimize_route, get_route_transition_time
 
 ZonePredictionProps = namedtuple('ZonePredictionProps', ['zone', 'acceptance'])
+PlannerComparison = namedtuple('PlannerComparison', ['greedy_working_time', 'optimal_working_time', 'cycle_time'])
 DEFAULT_TRAJECTORY_RULES_PARAMETERS = {
     'SPEED': '10',
     'STEAM': '0',
@@ -19,10 +22,15 @@ DEFAULT_TRAJECTORY_RULES_PARAMETERS = {
 
 }
 
+GREEDY_PLANNER = 'greedy'
+OPTIMAL_PLANNER = 'optimal'
+PLANNERS = (GREEDY_PLANNER, OPTIMAL_PLANNER)
+DEFAULT_PLANNER_TIME_BUDGET = 0.05
+
 
 class TrajectoryRules:
-    def __init__(self, zones_per_seat_type: Dict[str, List], plant_project: str, acceptance_threshold: int,
-                 cover_material: str):
+    def __init__(self, seat_profiles: Dict[SeatTypeMaterialKey, SeatProfile], plant_project: str,
+                 acceptance_threshold: int, cover_material: str):
         """
         default parameters in robot inputs
         SPEED : robot speed
@@ -33,10 +41,11 @@ class TrajectoryRules:
         """
 
         self.default_parameters = DEFAULT_TRAJECTORY_RULES_PARAMETERS
-        self.zones_per_seat_type = zones_per_seat_type
         self.plant_project = plant_project
         self.acceptance_threshold = acceptance_threshold
         self.cover_material = cover_material
+        self.seat_profile = seat_profiles.get(SeatTypeMaterialKey(plant_project, cover_material))
+        self.planner_comparison: Optional[PlannerComparison] = None
 
     def get_default_parameters(self) -> List:
         return [self.default_parameters['SPEED'],
@@ -54,21 +63,14 @@ class TrajectoryRules:
     def sort_zones_according_to_zone_time_mapping(self, unsorted_zones_meta: List[ZonePredictionProps]) \
             -> List[ZonePredictionProps]:
 
-        sorted_zones = []
-        try:
-            sorted_zones_per_priority_for_plant_project_seat_type = self.zones_per_seat_type[self.plant_project]
-
-            list_sorted_unique_zones_per_seat_type = list(
-                dict.fromkeys(sorted_zones_per_priority_for_plant_project_seat_type))
+        if self.seat_profile is None:
+            logging.error(f'sort_zones_time_mapping_cycle : Not found the key : '
+                          f'{SeatTypeMaterialKey(self.plant_project, self.cover_material)}')
+            return []
 
-        except KeyError:
-            logging.error(f'sort_zones_time_mapping_cycle : Not found the key : {self.plant_project}')
-            list_sorted_unique_zones_per_seat_type = []
-
-        for current_zone_to_match in list_sorted_unique_zones_per_seat_type:
-            for zone_meta in unsorted_zones_meta:
-                if int(zone_meta.zone) == int(current_zone_to_match):
-                    sorted_zones.append(zone_meta)
+        zone_ranks = self.seat_profile.zone_ranks
+        sorted_zones = [zone_meta for zone_meta in unsorted_zones_meta if zone_meta.zone in zone_ranks]
+        sorted_zones.sort(key=lambda zone_meta: zone_ranks[zone_meta.zone])
         return sorted_zones
 
     @staticmethod
@@ -109,82 +111,250 @@ class TrajectoryRules:
         return zones_sorted_time_steaming_cycle_list
 
     def select_zones_according_to_time(self, zones: List[ZonePredictionProps],
-                                       zone_time_mapping: Dict[ZoneDescriptorKey, ZoneDescriptorValue],
-                                       transition_time: Dict, time_threshold: int, previous_transition_point: str,
-                                       initial_cumulated_time: float):
+                                       transition_time: TransitionTimeTable, time_threshold: int,
+                                       previous_transition_point: str, initial_cumulated_time: float):
         cumulated_time = initial_cumulated_time
         selected_zones = []
         steaming_sequence_record = []
         current_transition_time = 0
-        current_zone_steaming_time = 0
-        trajectory_occurence = 0
+        current_zone_cost = 0
 
+        descriptors = self.seat_profile.descriptors if self.seat_profile is not None else {}
+        # resolved only when there are zones, an unknown previous transition point fails at the first transition
+        previous_transition_point_index = transition_time.get_index(previous_transition_point) if zones else None
         for zone_input in zones:
-            composed_key = ZoneDescriptorKey(self.plant_project, zone_input.zone, zone_input.acceptance,
-                                             self.cover_material)
-
-            current_zone_descriptor_values = zone_time_mapping[composed_key]
+            current_zone_descriptor_values = descriptors[(zone_input.zone, zone_input.acceptance)]
             new_transition_point = current_zone_descriptor_values.transition_point
+            new_transition_point_index = current_zone_descriptor_values.transition_point_index
 
-            current_next_transition_key = TransitionDescriptor(previous_transition_point, new_transition_point)
-            current_transition_time = transition_time[current_next_transition_key]
+            current_transition_time = transition_time.get_time(previous_transition_point_index,
+                                                               new_transition_point_index)
 
-            current_zone_steaming_time = float(current_zone_descriptor_values.time)
-            trajectory_occurence = int(current_zone_descriptor_values.trajectory_occurence)
+            current_zone_cost = current_zone_descriptor_values.cost
 
-            cumulated_time += current_zone_steaming_time * trajectory_occurence
+            cumulated_time += current_zone_cost
             cumulated_time += current_transition_time
 
             if cumulated_time > time_threshold:
                 break
             time_zone_record = {'input_zone': zone_input.zone, 'acceptance_threshold': zone_input.acceptance,
                                 'transition points': previous_transition_point + ' ' + new_transition_point,
-                                'transition_time': current_transition_time, 'steaming_time': current_zone_steaming_time}
+                                'transition_time': current_transition_time,
+                                'steaming_time': current_zone_descriptor_values.time}
             steaming_sequence_record.append(time_zone_record)
             selected_zones.append(zone_input)
             previous_transition_point = new_transition_point
+            previous_transition_point_index = new_transition_point_index
 
         if len(zones) == 0:
             theoretical_working_time = 0
         elif cumulated_time > time_threshold:
             theoretical_working_time = cumulated_time - current_transition_time
-            theoretical_working_time -= current_zone_steaming_time * trajectory_occurence
+            theoretical_working_time -= current_zone_cost
         else:
             theoretical_working_time = cumulated_time
 
         return selected_zones, steaming_sequence_record, round(theoretical_working_time, 1)
 
-    def change_zones_to_abb_format(self, zones_meta: List[ZonePredictionProps],
-                                   zone_time_mapping: Dict[ZoneDescriptorKey, ZoneDescriptorValue], program_number: str,
+    def evaluate_zones_sequence(self, zones: List[ZonePredictionProps], transition_time: TransitionTimeTable,
+                                previous_transition_point: str, initial_cumulated_time: float) -> Tuple[List, float]:
+        """
+        Build the steaming sequence record of zones steamed in the given order and the time they need
+        """
+        cumulated_time = initial_cumulated_time
+        steaming_sequence_record = []
+
+        descriptors = self.seat_profile.descriptors if self.seat_profile is not None else {}
+        # resolved only when there are zones, an unknown previous transition point fails at the first transition
+        previous_transition_point_index = transition_time.get_index(previous_transition_point) if zones else None
+        for zone_input in zones:
+            current_zone_descriptor_values = descriptors[(zone_input.zone, zone_input.acceptance)]
+            new_transition_point = current_zone_descriptor_values.transition_point
+            new_transition_point_index = current_zone_descriptor_values.transition_point_index
+            current_transition_time = transition_time.get_time(previous_transition_point_index,
+                                                               new_transition_point_index)
+
+            cumulated_time += current_zone_descriptor_values.cost
+            cumulated_time += current_transition_time
+
+            steaming_sequence_record.append({'input_zone': zone_input.zone,
+                                             'acceptance_threshold': zone_input.acceptance,
+                                             'transition points': previous_transition_point + ' ' + new_transition_point,
+                                             'transition_time': current_transition_time,
+                                             'steaming_time': current_zone_descriptor_values.time})
+            previous_transition_point = new_transition_point
+            previous_transition_point_index = new_transition_point_index
+
+        return steaming_sequence_record, cumulated_time
+
+    def search_optimal_zones_selection(self, zones: List[ZonePredictionProps], transition_time: TransitionTimeTable,
+                                       time_threshold: float, previous_transition_point: str,
+                                       initial_cumulated_time: float, time_budget: float) -> Optional[List[int]]:
+        """
+        Search the subset of zones, steamed in priority order, with the highest priority weight that fits in the
+        cycle time. Among n zones, the zone of rank i weighs n - i.
+
+        The search keeps, for each transition point the robot can stand at, the Pareto front of (cumulated time,
+        weight) of the partial selections. Return the indexes of the selected zones, or None when the time budget
+        is exceeded.
+        """
+        if not zones:
+            return []
+        deadline = time.perf_counter() + time_budget
+        descriptors = self.seat_profile.descriptors if self.seat_profile is not None else {}
+        labels_per_transition_point = {transition_time.get_index(previous_transition_point):
+                                       [(initial_cumulated_time, 0, ())]}
+
+        for zone_index, zone_input in enumerate(zones):
+            if time.perf_counter() > deadline:
+                return None
+
+            zone_descriptor_values = descriptors[(zone_input.zone, zone_input.acceptance)]
+            zone_transition_point = zone_descriptor_values.transition_point_index
+            zone_steaming_time = zone_descriptor_values.cost
+            zone_weight = len(zones) - zone_index
+
+            new_labels = list(labels_per_transition_point.get(zone_transition_point, []))
+            for transition_point, labels in labels_per_transition_point.items():
+                current_transition_time = transition_time.get_time(transition_point, zone_transition_point)
+                for cumulated_time, weight, selection in labels:
+                    new_cumulated_time = cumulated_time + zone_steaming_time + current_transition_time
+                    if new_cumulated_time <= time_threshold:
+                        new_labels.append((new_cumulated_time, weight + zone_weight, selection + (zone_index,)))
+
+            labels_per_transition_point[zone_transition_point] = keep_pareto_front(new_labels)
+
+        best_label = max((label for labels in labels_per_transition_point.values() for label in labels),
+                         key=lambda label: (label[1], -label[0]))
+        return list(best_label[2])
+
+    def select_zones_optimally_according_to_time(self, zones: List[ZonePredictionProps],
+                                                 transition_time: TransitionTimeTable,
+                                                 time_threshold: float, previous_transition_point: str,
+                                                 initial_cumulated_time: float,
+                                                 time_budget: float = DEFAULT_PLANNER_TIME_BUDGET):
+        greedy_selection = self.select_zones_according_to_time(
+            zones=zones, transition_time=transition_time, time_threshold=time_threshold,
+            previous_transition_point=previous_transition_point, initial_cumulated_time=initial_cumulated_time)
+
+        selection = self.search_optimal_zones_selection(zones, transition_time, time_threshold,
+                                                        previous_transition_point, initial_cumulated_time,
+                                                        time_budget)
+        greedy_working_time = greedy_selection[2]
+        if selection is None:
+            logging.warning(f'Optimal planner exceeded its {time_budget * 1000:0.0f} ms budget, greedy plan kept')
+            self.planner_comparison = PlannerComparison(greedy_working_time, greedy_working_time, time_threshold)
+            return greedy_selection
+
+        selected_zones = [zones[zone_index] for zone_index in selection]
+        steaming_sequence_record, theoretical_working_time = self.evaluate_zones_sequence(
+            selected_zones, transition_time, previous_transition_point, initial_cumulated_time)
+        theoretical_working_time = round(theoretical_working_time, 1) if len(zones) > 0 else 0
+
+        self.planner_comparison = PlannerComparison(greedy_working_time, theoretical_working_time, time_threshold)
+        logging.info(f'Optimal planner: {len(selected_zones)} zones in {theoretical_working_time}s '
+                     f'({theoretical_working_time / time_threshold:.0%} of cycle time), greedy planner: '
+                     f'{len(greedy_selection[0])} zones in {greedy_working_time}s '
+                     f'({greedy_working_time / time_threshold:.0%} of cycle time)')
+
+        return selected_zones, steaming_sequence_record, theoretical_working_time
+
+    def get_zones_route(self, zones: List[ZonePredictionProps], transition_time: TransitionTimeTable,
+                        previous_transition_point: str, precedence_constraints: List[Tuple[int, int]]) \
+            -> Optional[List[ZonePredictionProps]]:
+        if not zones:
+            return []
+        descriptors = self.seat_profile.descriptors
+        transition_points = [descriptors[(zone_input.zone, zone_input.acceptance)].transition_point_index
+                             for zone_input in zones]
+        previous_transition_point = transition_time.get_index(previous_transition_point)
+        zone_indexes = {zone_input.zone: zone_index for zone_index, zone_input in enumerate(zones)}
+        precedences = [(zone_indexes[before], zone_indexes[after]) for before, after in precedence_constraints
+                       if before in zone_indexes and after in zone_indexes]
+
+        route = optimize_route(transition_points, transition_time, previous_transition_point, precedences)
+        if route is None:
+            return None
+
+        given_order_respects_precedences = all(before < after for before, after in precedences)
+        if given_order_respects_precedences and \
+                get_route_transition_time([transition_points[zone_index] for zone_index in route], transition_time,
+                                          previous_transition_point) > \
+                get_route_transition_time(transition_points, transition_time, previous_transition_point):
+            return zones
+        return [zones[zone_index] for zone_index in route]
+
+    def optimize_zones_route(self, selected_zones: List[ZonePredictionProps], candidate_zones: List[ZonePredictionProps],
+                             transition_time: TransitionTimeTable, time_threshold: float,
+                             previous_transition_point: str, initial_cumulated_time: float,
+                             precedence_constraints: List[Tuple[int, int]],
+                             time_budget: float = DEFAULT_PLANNER_TIME_BUDGET):
+        """
+        Reorder the selected zones to lower the transition time, then add the candidate zones left aside, by
+        priority order, as long as the reordered route still fits in the cycle time
+        """
+        deadline = time.perf_counter() + time_budget
+        steaming_sequence_record, initial_working_time = self.evaluate_zones_sequence(
+            selected_zones, transition_time, previous_transition_point, initial_cumulated_time)
+
+        route = self.get_zones_route(selected_zones, transition_time, previous_transition_point,
+                                     precedence_constraints)
+        if route is None:
+            logging.warning('Precedence constraints cannot be satisfied, zones kept in priority order')
+            return selected_zones, steaming_sequence_record, round(initial_working_time, 1)
+
+        steaming_sequence_record, working_time = self.evaluate_zones_sequence(
+            route, transition_time, previous_transition_point, initial_cumulated_time)
+        if working_time > time_threshold:
+            # the precedences forced a longer route, its last zones are dropped until it fits in the cycle time,
+            # which keeps the precedences of the zones left
+            logging.warning(f'Reordered route of {len(route)} zones takes {round(working_time, 1)}s, over the '
+                            f'cycle time, last zones dropped')
+            while route and working_time > time_threshold:
+                route = route[:-1]
+                steaming_sequence_record, working_time = self.evaluate_zones_sequence(
+                    route, transition_time, previous_transition_point, initial_cumulated_time)
+
+        added_zones_count = 0
+        descriptors = self.seat_profile.descriptors
+        for candidate_zone in candidate_zones:
+            if time.perf_counter() > deadline:
+                logging.warning(f'Route optimization exceeded its {time_budget * 1000:0.0f} ms budget')
+                break
+            if candidate_zone in route or (candidate_zone.zone, candidate_zone.acceptance) not in descriptors:
+                continue
+
+            candidate_route = self.get_zones_route(route + [candidate_zone], transition_time,
+                                                   previous_transition_point, precedence_constraints)
+            if candidate_route is None:
+                continue
+            candidate_sequence_record, candidate_working_time = self.evaluate_zones_sequence(
+                candidate_route, transition_time, previous_transition_point, initial_cumulated_time)
+            if candidate_working_time <= time_threshold:
+                route, steaming_sequence_record, working_time = \
+                    candidate_route, candidate_sequence_record, candidate_working_time
+                added_zones_count += 1
+
+        logging.info(f'Route optimization: {len(selected_zones)} zones in {round(initial_working_time, 1)}s '
+                     f'reordered, {added_zones_count} zones added, {len(route)} zones in {round(working_time, 1)}s')
+
+        return route, steaming_sequence_record, round(working_time, 1)
+
+    def change_zones_to_abb_format(self, zones_meta: List[ZonePredictionProps], program_number: str,
                                    serial_number: str) -> List[List]:
         abb_format = [[program_number, serial_number, None, None, None, None, None, None, None, None, None]]
+        descriptors = self.seat_profile.descriptors if self.seat_profile is not None else {}
         steaming_zone_order_number = 1
         for current_zone_meta in zones_meta:
             current_zone = int(current_zone_meta.zone)
             current_acceptance = int(current_zone_meta.acceptance)
-            composed_key = ZoneDescriptorKey(self.plant_project, current_zone, current_acceptance,
-                                             self.cover_material)
-
-            if composed_key in zone_time_mapping.keys():
-                zone_descriptor_value = zone_time_mapping[composed_key]
-
-                input_offset_x: int = zone_descriptor_value.input_offset_x
-                input_offset_y: int = zone_descriptor_value.input_offset_y
-                input_offset_z: int = zone_descriptor_value.input_offset_z
-                output_offset_x: int = zone_descriptor_value.output_offset_x
-                output_offset_y: int = zone_descriptor_value.output_offset_y
-                output_offset_z: int = zone_descriptor_value.output_offset_z
-                steam: int = zone_descriptor_value.steam
-                speed: int = zone_descriptor_value.speed
-                pressure: int = zone_descriptor_value.pressure
-
-                # abb_format.append(
-                #     [str(steaming_zone_order_number), str(current_zone), speed, steam, pressure, input_offset_x,
-                #      input_offset_y, input_offset_z, output_offset_x, output_offset_y, output_offset_z])
-                abb_format.append(
-                    [steaming_zone_order_number, current_zone, speed, steam, pressure, input_offset_x,
-                     input_offset_y, input_offset_z, output_offset_x, output_offset_y, output_offset_z])
+
+            zone_descriptor_value = descriptors.get((current_zone, current_acceptance))
+            if zone_descriptor_value is not None:
+                abb_format.append([steaming_zone_order_number, current_zone, *zone_descriptor_value.abb_parameters])
             else:
+                composed_key = ZoneDescriptorKey(self.plant_project, current_zone, current_acceptance,
+                                                 self.cover_material)
                 logging.warning(f'{composed_key} does not exist in configuration file, default values used')
                 abb_format.append(
                     [str(steaming_zone_order_number), str(current_zone)] + self.get_default_parameters())
@@ -194,25 +364,55 @@ class TrajectoryRules:
         return abb_format
 
     def define_zones_to_steam_in_abb_format_according_to_available_time(self, predicted_wrinkles: Dict,
-                                                                        zone_time_mapping: Dict[
-                                                                            ZoneDescriptorKey, ZoneDescriptorValue],
-                                                                        transition_time_table: Dict[
-                                                                            TransitionDescriptor, float],
+                                                                        transition_time_table: TransitionTimeTable,
                                                                         cycle_time: int,
                                                                         previous_transition_point: str,
                                                                         cumulated_time: float,
                                                                         serial_number: str,
-                                                                        program_number: str
+                                                                        program_number: str,
+                                                                        planner: str = GREEDY_PLANNER,
+                                                                        planner_time_budget: float =
+                                                                        DEFAULT_PLANNER_TIME_BUDGET,
+                                                                        route_optimization: bool = False,
+                                                                        precedence_constraints: List[
+                                                                            Tuple[int, int]] = ()
                                                                         ):
 
         steaming_zones_sequence = self.get_steaming_zones_sequence(predicted_wrinkles)
-        selected_zones, steaming_sequence_record, theoretical_working_time = self.select_zones_according_to_time(
-            zones=steaming_zones_sequence, zone_time_mapping=zone_time_mapping, transition_time=transition_time_table,
-            time_threshold=cycle_time, previous_transition_point=previous_transition_point,
-            initial_cumulated_time=cumulated_time
-        )
+        if planner == OPTIMAL_PLANNER:
+            selected_zones, steaming_sequence_record, theoretical_working_time = \
+                self.select_zones_optimally_according_to_time(
+                    zones=steaming_zones_sequence, transition_time=transition_time_table,
+                    time_threshold=cycle_time, previous_transition_point=previous_transition_point,
+                    initial_cumulated_time=cumulated_time, time_budget=planner_time_budget
+                )
+        else:
+            selected_zones, steaming_sequence_record, theoretical_working_time = self.select_zones_according_to_time(
+                zones=steaming_zones_sequence, transition_time=transition_time_table,
+                time_threshold=cycle_time, previous_transition_point=previous_transition_point,
+                initial_cumulated_time=cumulated_time
+            )
 
-        zone_to_steam_in_abb_format = self.change_zones_to_abb_format(selected_zones, zone_time_mapping, program_number,
-                                                                      serial_number)
+        if route_optimization and len(selected_zones) > 0:
+            selected_zones, steaming_sequence_record, theoretical_working_time = self.optimize_zones_route(
+                selected_zones=selected_zones, candidate_zones=steaming_zones_sequence,
+                transition_time=transition_time_table, time_threshold=cycle_time,
+                previous_transition_point=previous_transition_point, initial_cumulated_time=cumulated_time,
+                precedence_constraints=precedence_constraints, time_budget=planner_time_budget)
+
+        zone_to_steam_in_abb_format = self.change_zones_to_abb_format(selected_zones, program_number, serial_number)
 
         return zone_to_steam_in_abb_format, steaming_sequence_record, theoretical_working_time
+
+
+def keep_pareto_front(labels: List[Tuple[float, int, Tuple]]) -> List[Tuple[float, int, Tuple]]:
+    """
+    Keep the (cumulated time, weight, selection) labels that no other label beats on both time and weight
+    """
+    pareto_front = []
+    best_weight = -1
+    for label in sorted(labels, key=lambda current_label: (current_label[0], -current_label[1])):
+        if label[1] > best_weight:
+            pareto_front.append(label)
+            best_weight = label[1]
+    return pareto_front